@@ -0,0 +1,49 @@
+"""add monthly_rollups
+
+Revision ID: 8d41f6a2c9e3
+Revises: 3b7e9c1d2a5f
+Create Date: 2026-10-18 14:05:12.804417
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d41f6a2c9e3'
+down_revision: Union[str, Sequence[str], None] = '3b7e9c1d2a5f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('monthly_rollups',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('snapshot_year', sa.Integer(), nullable=False),
+    sa.Column('snapshot_month', sa.Integer(), nullable=False),
+    sa.Column('row_count', sa.Integer(), nullable=False),
+    sa.Column('total_loan', sa.Numeric(precision=18, scale=4), nullable=False),
+    sa.Column('total_guarantee', sa.Numeric(precision=18, scale=4), nullable=False),
+    sa.Column('total_outstanding_loan', sa.Numeric(precision=18, scale=4), nullable=False),
+    sa.Column('total_outstanding_guarantee', sa.Numeric(precision=18, scale=4), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('snapshot_year', 'snapshot_month', name='uq_monthly_rollups_snapshot')
+    )
+    op.create_index(op.f('ix_monthly_rollups_id'), 'monthly_rollups', ['id'], unique=False)
+    # Backfill from the rows imported so far
+    op.execute(
+        "INSERT INTO monthly_rollups (snapshot_year, snapshot_month, row_count, total_loan, total_guarantee, "
+        "total_outstanding_loan, total_outstanding_guarantee) "
+        "SELECT snapshot_year, snapshot_month, COUNT(*), COALESCE(SUM(loan_amount), 0), COALESCE(SUM(guarantee_amount), 0), "
+        "COALESCE(SUM(outstanding_loan_balance), 0), COALESCE(SUM(outstanding_guarantee_balance), 0) "
+        "FROM business_data GROUP BY snapshot_year, snapshot_month"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_monthly_rollups_id'), table_name='monthly_rollups')
+    op.drop_table('monthly_rollups')
@@ -0,0 +1,30 @@
+"""add business_data indexes
+
+Revision ID: c5a1e7d30b84
+Revises: 8d41f6a2c9e3
+Create Date: 2026-10-18 16:40:27.115093
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5a1e7d30b84'
+down_revision: Union[str, Sequence[str], None] = '8d41f6a2c9e3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_business_data_snapshot', 'business_data', ['snapshot_year', 'snapshot_month'], unique=False)
+    op.create_index(op.f('ix_business_data_company_id'), 'business_data', ['company_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_business_data_company_id'), table_name='business_data')
+    op.drop_index('ix_business_data_snapshot', table_name='business_data')
@@ -0,0 +1,36 @@
+"""add dataset_version
+
+Revision ID: e4b2f8a61c07
+Revises: c5a1e7d30b84
+Create Date: 2026-10-18 19:12:44.503218
+
+"""
+from typing import Sequence, Union
+import uuid
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4b2f8a61c07'
+down_revision: Union[str, Sequence[str], None] = 'c5a1e7d30b84'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    dataset_version = op.create_table('dataset_version',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('epoch', sa.String(length=32), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    # Existing data starts at version 1 under a fresh epoch
+    op.bulk_insert(dataset_version, [{'id': 1, 'epoch': uuid.uuid4().hex, 'version': 1}])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('dataset_version')
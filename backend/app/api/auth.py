@@ -1,16 +1,17 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 from datetime import timedelta
 from jose import JWTError, jwt
 from .. import models, schemas, auth, database
-from ..database import get_db
+from ..database import get_db, get_read_db
 
 router = APIRouter()
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token")
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_read_db)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -24,15 +25,25 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
         token_data = schemas.TokenData(username=username)
     except JWTError:
         raise credentials_exception
-    user = db.query(models.User).filter(models.User.username == token_data.username).first()
-    if user is None:
-        raise credentials_exception
-    return user
+    principal = auth.cached_principal(token_data.username)
+    if principal is None:
+        generation = auth.principal_generation()
+        user = get_user(db, token_data.username)
+        if user is None:
+            raise credentials_exception
+        principal = schemas.Principal.model_validate(user)
+        auth.cache_principal(token_data.username, principal, generation)
+    return principal
+
+def get_user(db: Session, username: str):
+    return db.query(models.User).filter(models.User.username == username).first()
 
 @router.post("/token", response_model=schemas.Token)
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.username == form_data.username).first()
-    if not user or not auth.verify_password(form_data.password, user.hashed_password):
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_read_db)):
+    user = await run_in_threadpool(get_user, db, form_data.username)
+    # Hand the connection back before the slow password check
+    await run_in_threadpool(db.close)
+    if not user or not await auth.verify_password_async(form_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -45,12 +56,18 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.post("/register", response_model=schemas.User)
-def register_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    db_user = db.query(models.User).filter(models.User.username == user.username).first()
-    if db_user:
+async def register_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
+    # Hashed before touching the database, so the writer connection is not
+    # held while bcrypt runs
+    hashed_password = await auth.get_password_hash_async(user.password)
+    db_user = await run_in_threadpool(create_user, db, user, hashed_password)
+    if db_user is None:
         raise HTTPException(status_code=400, detail="Username already registered")
-    
-    hashed_password = auth.get_password_hash(user.password)
+    return db_user
+
+def create_user(db: Session, user: schemas.UserCreate, hashed_password: str):
+    if get_user(db, user.username):
+        return None
     db_user = models.User(
         username=user.username,
         email=user.email,
@@ -1,63 +1,68 @@
-from fastapi import APIRouter, Depends, HTTPException
+import hashlib
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from ..database import get_db
-from ..models import BusinessData, Company
+from ..database import get_read_db
+from .. import cache, dataset, reports
+from ..concurrency import run_compute
 from .auth import get_current_user
 from typing import List, Dict
 
 router = APIRouter()
 
+def _report_etag(version, name: str, params: tuple):
+    # Weak, since GZipMiddleware changes the bytes. Handlers read the version
+    # once, before the report, and key the result cache on it too, so a
+    # racing import can only make the tag stale.
+    digest = hashlib.sha1(repr((name, params)).encode()).hexdigest()[:16]
+    return f'W/"{version or 0}-{digest}"'
+
+def _not_modified(request: Request, response: Response, version, name: str, params: tuple):
+    # Sets the validators on response; returns a 304 if the client's copy is current
+    etag = _report_etag(version, name, params)
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "private, no-cache"
+    tags = [tag.strip().removeprefix("W/") for tag in request.headers.get("if-none-match", "").split(",")]
+    if "*" in tags or etag.removeprefix("W/") in tags:
+        return Response(status_code=304, headers=dict(response.headers))
+    return None
+
 @router.get("/summary")
 async def get_summary(
-    db: Session = Depends(get_db),
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_read_db),
     current_user = Depends(get_current_user)
 ):
-    total_companies = db.query(func.count(Company.id)).scalar()
-    
-    business_summary = db.query(
-        func.sum(BusinessData.loan_amount).label("total_loan"),
-        func.sum(BusinessData.guarantee_amount).label("total_guarantee"),
-        func.sum(BusinessData.outstanding_loan_balance).label("total_outstanding_loan"),
-        func.sum(BusinessData.outstanding_guarantee_balance).label("total_outstanding_guarantee")
-    ).first()
+    version = await run_in_threadpool(dataset.current_version, db)
+    if cached := _not_modified(request, response, version, "summary", ()):
+        return cached
+    return await run_compute(reports.get_summary, db, version=version)
 
-    return {
-        "total_companies": total_companies or 0,
-        "total_loan": float(business_summary.total_loan or 0),
-        "total_guarantee": float(business_summary.total_guarantee or 0),
-        "total_outstanding_loan": float(business_summary.total_outstanding_loan or 0),
-        "total_outstanding_guarantee": float(business_summary.total_outstanding_guarantee or 0)
-    }
+def _parse_period(value: str):
+    try:
+        year, month = (int(part) for part in value.split("-"))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Periods must be given as YYYY-MM.")
+    if not 1 <= month <= 12:
+        raise HTTPException(status_code=400, detail="Periods must be given as YYYY-MM.")
+    return year, month
 
 @router.get("/growth")
 async def get_growth(
-    db: Session = Depends(get_db),
+    request: Request,
+    response: Response,
+    start: str = Query(None, alias="from", description="First period, YYYY-MM"),
+    end: str = Query(None, alias="to", description="Last period, YYYY-MM"),
+    db: Session = Depends(get_read_db),
     current_user = Depends(get_current_user)
 ):
-    growth_data = db.query(
-        BusinessData.snapshot_year,
-        BusinessData.snapshot_month,
-        func.sum(BusinessData.loan_amount).label("total_loan"),
-        func.sum(BusinessData.guarantee_amount).label("total_guarantee"),
-        func.sum(BusinessData.outstanding_loan_balance).label("total_outstanding_loan"),
-        func.sum(BusinessData.outstanding_guarantee_balance).label("total_outstanding_guarantee")
-    ).group_by(
-        BusinessData.snapshot_year,
-        BusinessData.snapshot_month
-    ).order_by(
-        BusinessData.snapshot_year.asc(),
-        BusinessData.snapshot_month.asc()
-    ).all()
-
-    result = []
-    for row in growth_data:
-        result.append({
-            "period": f"{row.snapshot_year}-{row.snapshot_month:02d}",
-            "total_loan": float(row.total_loan or 0),
-            "total_guarantee": float(row.total_guarantee or 0),
-            "total_outstanding_loan": float(row.total_outstanding_loan or 0),
-            "total_outstanding_guarantee": float(row.total_outstanding_guarantee or 0)
-        })
+    period = (_parse_period(start) if start else None, _parse_period(end) if end else None)
+    version = await run_in_threadpool(dataset.current_version, db)
+    if cached := _not_modified(request, response, version, "growth", period):
+        return cached
+    return await run_compute(reports.get_growth, db, *period, version=version)
 
-    return result
+@router.get("/cache")
+async def get_cache_stats(current_user = Depends(get_current_user)):
+    return cache.stats()
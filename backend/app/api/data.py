@@ -1,33 +1,24 @@
-from fastapi import APIRouter, Depends, UploadFile, File, HTTPException
+from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from ..database import get_db
-from ..importer import import_excel_data
+from ..jobs import submit_import
 from .auth import get_current_user
-import os
-import shutil
-import tempfile
 
 router = APIRouter()
 
 @router.post("/import")
 async def import_data(
     file: UploadFile = File(...), 
+    streaming: bool = Query(True, description="Read .xlsx uploads in fixed-size chunks"),
     db: Session = Depends(get_db),
     current_user = Depends(get_current_user)
 ):
     if not file.filename.endswith(('.xlsx', '.xls')):
         raise HTTPException(status_code=400, detail="Only Excel files are allowed.")
-    
-    # Save the uploaded file temporarily
-    with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(file.filename)[1]) as tmp:
-        shutil.copyfileobj(file.file, tmp)
-        temp_path = tmp.name
-        
-    try:
-        count = import_excel_data(temp_path, db)
-        return {"message": f"Successfully imported {count} records."}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Import failed: {str(e)}")
-    finally:
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
+
+    # The import runs in the job worker pool; poll GET /api/jobs/{job_id} for progress.
+    # Streaming mode reads .xlsx files in fixed-size chunks; legacy .xls workbooks
+    # are not supported by openpyxl and use the pandas path.
+    job = await run_in_threadpool(submit_import, db, file.filename, file.file, streaming)
+    return {"message": f"Import job {job.id} queued.", "job_id": job.id}
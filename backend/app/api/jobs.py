@@ -0,0 +1,32 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from typing import List
+from ..database import get_read_db
+from ..models import ImportJob
+from .. import schemas
+from .auth import get_current_user
+
+router = APIRouter()
+
+@router.get("", response_model=List[schemas.ImportJob])
+def list_jobs(
+    status: str = Query(None, description="Filter by status: queued, running, done or failed"),
+    limit: int = Query(50, le=500),
+    db: Session = Depends(get_read_db),
+    current_user = Depends(get_current_user)
+):
+    query = db.query(ImportJob)
+    if status:
+        query = query.filter(ImportJob.status == status)
+    return query.order_by(ImportJob.id.desc()).limit(limit).all()
+
+@router.get("/{job_id}", response_model=schemas.ImportJob)
+def get_job(
+    job_id: int,
+    db: Session = Depends(get_read_db),
+    current_user = Depends(get_current_user)
+):
+    job = db.get(ImportJob, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return job
@@ -1,9 +1,17 @@
 from datetime import datetime, timedelta
 from typing import Optional
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import threading
+import time
+import bcrypt
 from jose import JWTError, jwt
-from passlib.context import CryptContext
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
 import os
 from dotenv import load_dotenv
+from . import models
 
 load_dotenv()
 
@@ -12,13 +20,30 @@ SECRET_KEY = os.getenv("SECRET_KEY", "09d25e094faa6ca2556c818166b7a9563b93f7099f
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# bcrypt is deliberately slow, so hashing gets its own small pool: a burst of
+# logins queues there instead of taking the event loop or request threads
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+# Resolved users are cached per token subject for this many seconds
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "60"))
+PRINCIPAL_CACHE_MAX_ENTRIES = int(os.getenv("PRINCIPAL_CACHE_MAX_ENTRIES", "1024"))
+
+_hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+
+def _secret(password):
+    # bcrypt only uses the first 72 bytes; passlib truncated them the same way
+    return password.encode("utf-8")[:72]
 
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return bcrypt.checkpw(_secret(plain_password), hashed_password.encode("utf-8"))
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return bcrypt.hashpw(_secret(password), bcrypt.gensalt()).decode("utf-8")
+
+async def verify_password_async(plain_password, hashed_password):
+    return await asyncio.wrap_future(_hash_executor.submit(verify_password, plain_password, hashed_password))
+
+async def get_password_hash_async(password):
+    return await asyncio.wrap_future(_hash_executor.submit(get_password_hash, password))
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -29,3 +54,54 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode.update({"exp": expire})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
+
+_principals_lock = threading.Lock()
+_principals = OrderedDict()
+_principals_generation = 0
+
+def principal_generation():
+    with _principals_lock:
+        return _principals_generation
+
+def cached_principal(username):
+    with _principals_lock:
+        entry = _principals.get(username)
+        if entry is None:
+            return None
+        expires_at, principal = entry
+        if expires_at <= time.monotonic():
+            del _principals[username]
+            return None
+        _principals.move_to_end(username)
+        return principal
+
+def cache_principal(username, principal, generation):
+    # A user loaded before an invalidation may be stale, so it is only
+    # stored if no user changed since principal_generation() was read
+    with _principals_lock:
+        if generation != _principals_generation:
+            return
+        _principals[username] = (time.monotonic() + PRINCIPAL_CACHE_TTL, principal)
+        _principals.move_to_end(username)
+        while len(_principals) > PRINCIPAL_CACHE_MAX_ENTRIES:
+            _principals.popitem(last=False)
+
+def invalidate_principals():
+    global _principals_generation
+    with _principals_lock:
+        _principals_generation += 1
+        _principals.clear()
+
+@event.listens_for(models.User, "after_insert")
+@event.listens_for(models.User, "after_update")
+@event.listens_for(models.User, "after_delete")
+def _user_changed(mapper, connection, target):
+    # Invalidate at flush and again at commit, so a request that loaded the
+    # old row in between cannot cache it
+    object_session(target).info["principals_changed"] = True
+    invalidate_principals()
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session):
+    if session.info.pop("principals_changed", False):
+        invalidate_principals()
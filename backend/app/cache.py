@@ -0,0 +1,51 @@
+"""
+In-process cache of dashboard results.
+
+Entries are keyed by report name, parameters and the persisted dataset
+version the caller read (app.dataset.current_version). Every committed
+import, import chunk or rollup rebuild bumps it in the database, so a write
+from any worker or script makes older entries unreachable; they age out of
+the LRU, which is bounded by RESULT_CACHE_MAX_ENTRIES.
+demo/result_cache.py is the demo app's copy; the two apps share no package.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "256"))
+
+_lock = threading.Lock()
+_entries = OrderedDict()
+_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+def get_or_compute(name, params, version, compute):
+    # The caller reads version before computing, so a result that raced with
+    # an import is stored under the older version, never under a newer one
+    key = (name, params, version)
+    with _lock:
+        if key in _entries:
+            _entries.move_to_end(key)
+            _stats["hits"] += 1
+            return _entries[key]
+        _stats["misses"] += 1
+
+    result = compute()
+
+    with _lock:
+        _entries[key] = result
+        _entries.move_to_end(key)
+        while len(_entries) > RESULT_CACHE_MAX_ENTRIES:
+            _entries.popitem(last=False)
+            _stats["evictions"] += 1
+    return result
+
+def clear():
+    with _lock:
+        _entries.clear()
+
+def stats():
+    with _lock:
+        result = dict(_stats)
+        result["entries"] = len(_entries)
+    result["max_entries"] = RESULT_CACHE_MAX_ENTRIES
+    return result
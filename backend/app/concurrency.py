@@ -0,0 +1,21 @@
+"""
+Bounded executor for CPU-heavy work started by request handlers.
+
+Sessions and reports are synchronous, so handlers must not call them on
+the event loop. Cheap queries run in plain def handlers, which FastAPI
+runs in its thread pool. Report computation goes through run_compute(),
+which caps it at COMPUTE_WORKERS threads. demo/concurrency.py is the
+same helper for the demo app.
+"""
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+COMPUTE_WORKERS = int(os.getenv("COMPUTE_WORKERS", "2"))
+
+_executor = ThreadPoolExecutor(max_workers=COMPUTE_WORKERS, thread_name_prefix="compute")
+
+async def run_compute(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
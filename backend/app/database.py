@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
@@ -7,16 +7,62 @@ from dotenv import load_dotenv
 load_dotenv()
 
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./bsm_project.db")
+# Reads may go to a replica; by default they use the primary database
+READ_DATABASE_URL = os.getenv("READ_DATABASE_URL", SQLALCHEMY_DATABASE_URL)
+
+# Applied to every SQLite connection. WAL lets readers run while an import
+# transaction is open, and synchronous=NORMAL drops the fsync on each commit
+# (the database stays consistent; a power loss can undo the last commits).
+# demo/database.py carries the same SQLite profile without the server pool.
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "30000")),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    "cache_size": -int(os.getenv("SQLITE_CACHE_KB", str(64 * 1024))),
+}
+READ_POOL_SIZE = int(os.getenv("READ_POOL_SIZE", "8"))
+WRITE_POOL_TIMEOUT = int(os.getenv("WRITE_POOL_TIMEOUT", "300"))
+
+# Connection pool of server databases such as PostgreSQL
+DB_POOL = {
+    "pool_size": int(os.getenv("DB_POOL_SIZE", "10")),
+    "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "20")),
+    "pool_timeout": int(os.getenv("DB_POOL_TIMEOUT", "30")),
+    "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+    "pool_pre_ping": os.getenv("DB_POOL_PRE_PING", "true").lower() == "true",
+}
+
+def create_sqlite_engine(url, readonly=False):
+    # SQLite allows one writer at a time, so the writer engine holds a single
+    # connection and write transactions queue for it instead of failing with
+    # "database is locked". Readers get a pool of query_only connections.
+    if readonly:
+        pool = {"pool_size": READ_POOL_SIZE, "max_overflow": READ_POOL_SIZE}
+    else:
+        pool = {"pool_size": 1, "max_overflow": 0, "pool_timeout": WRITE_POOL_TIMEOUT}
+    engine = create_engine(url, connect_args={"check_same_thread": False}, **pool)
+
+    @event.listens_for(engine, "connect")
+    def apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        if readonly:
+            cursor.execute("PRAGMA query_only=ON")
+        cursor.close()
+
+    return engine
 
-# For SQLite, we need to add connect_args={"check_same_thread": False}
 if SQLALCHEMY_DATABASE_URL.startswith("sqlite"):
-    engine = create_engine(
-        SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-    )
+    engine = create_sqlite_engine(SQLALCHEMY_DATABASE_URL)
+    read_engine = create_sqlite_engine(READ_DATABASE_URL, readonly=True)
 else:
-    engine = create_engine(SQLALCHEMY_DATABASE_URL)
+    engine = create_engine(SQLALCHEMY_DATABASE_URL, **DB_POOL)
+    read_engine = engine if READ_DATABASE_URL == SQLALCHEMY_DATABASE_URL else create_engine(READ_DATABASE_URL, **DB_POOL)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
 
 Base = declarative_base()
 
@@ -26,3 +72,10 @@ def get_db():
         yield db
     finally:
         db.close()
+
+def get_read_db():
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
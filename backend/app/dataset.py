@@ -0,0 +1,27 @@
+"""
+Persisted version of the imported dataset.
+
+Dashboard responses only change when business data does, so their ETags
+and result cache entries are keyed on this version. It lives in the
+database, so it survives restarts and a write from any worker or script
+moves it for all of them.
+epoch is random per database, so a recreated database never repeats an
+earlier version.
+"""
+import uuid
+from sqlalchemy import insert, update
+from sqlalchemy.orm import Session
+from .models import DatasetVersion
+
+def current_version(db: Session):
+    # "<epoch>.<version>", or None before the first import
+    row = db.query(DatasetVersion.epoch, DatasetVersion.version).filter(DatasetVersion.id == 1).first()
+    return f"{row.epoch}.{row.version}" if row else None
+
+def commit_change(db: Session):
+    # Bumps the version inside the write's transaction, so both commit together
+    table = DatasetVersion.__table__
+    updated = db.execute(update(table).where(table.c.id == 1).values(version=table.c.version + 1)).rowcount
+    if not updated:
+        db.execute(insert(table).values(id=1, epoch=uuid.uuid4().hex, version=1))
+    db.commit()
@@ -1,7 +1,15 @@
 import pandas as pd
+from collections import defaultdict
+from decimal import Decimal
+from openpyxl import load_workbook
+from sqlalchemy import insert, update
 from sqlalchemy.orm import Session
-from . import models, schemas
+from . import dataset, models, schemas
 import datetime
+import time
+
+# Rows converted and committed per transaction by stream_excel_data
+CHUNK_SIZE = 1000
 
 def import_excel_data(file_path: str, db: Session):
     # Read the Excel file
@@ -14,6 +22,7 @@ def import_excel_data(file_path: str, db: Session):
     # loan_amount, guarantee_amount, loan_start_date, loan_due_date, loan_interest_rate, guarantee_fee_rate, outstanding_loan_balance, outstanding_guarantee_balance, loan_status, cooperative_bank, snapshot_year, snapshot_month
     
     imported_count = 0
+    rows = []
     
     for _, row in df.iterrows():
         company_name = str(row.get('enterprise_name', '')).strip()
@@ -52,7 +61,156 @@ def import_excel_data(file_path: str, db: Session):
             snapshot_month=int(row.get('snapshot_month', datetime.datetime.now().month))
         )
         db.add(business_entry)
+        rows.append(business_entry)
         imported_count += 1
         
-    db.commit()
+    _add_to_rollups(db, [r.__dict__ for r in rows])
+    dataset.commit_change(db)
     return imported_count
+
+# monthly_rollups column -> business_data column it totals
+ROLLUP_SOURCES = {
+    'total_loan': 'loan_amount',
+    'total_guarantee': 'guarantee_amount',
+    'total_outstanding_loan': 'outstanding_loan_balance',
+    'total_outstanding_guarantee': 'outstanding_guarantee_balance',
+}
+
+def _amount(value):
+    if value is None or value == '' or pd.isna(value):
+        return Decimal(0)
+    return Decimal(str(value))
+
+def _add_to_rollups(db: Session, rows):
+    # Add the totals of newly inserted business rows to their snapshot months
+    # in monthly_rollups, in the caller's transaction. Only the months touched
+    # by rows are written.
+    deltas = defaultdict(lambda: {'row_count': 0, **{total: Decimal(0) for total in ROLLUP_SOURCES}})
+    for row in rows:
+        delta = deltas[(row['snapshot_year'], row['snapshot_month'])]
+        delta['row_count'] += 1
+        for total, column in ROLLUP_SOURCES.items():
+            delta[total] += _amount(row[column])
+
+    rollup = models.MonthlyRollup.__table__
+    for (year, month), delta in deltas.items():
+        updated = db.execute(
+            update(rollup)
+            .where(rollup.c.snapshot_year == year, rollup.c.snapshot_month == month)
+            .values({key: rollup.c[key] + value for key, value in delta.items()})
+        )
+        if updated.rowcount == 0:
+            db.execute(insert(rollup).values(snapshot_year=year, snapshot_month=month, **delta))
+
+def _to_date(value):
+    if value is None or value == '':
+        return None
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    return pd.to_datetime(value).date()
+
+def _company_name(record):
+    name = record.get('enterprise_name')
+    return str(name).strip() if name is not None else ''
+
+def _iter_chunks(records, size):
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def _import_chunk(records, db: Session):
+    # Resolve the chunk's companies with one SELECT and one INSERT, then insert
+    # its business rows in one executemany and commit
+    names = {_company_name(r) for r in records}
+    company_ids = dict(
+        db.query(models.Company.name, models.Company.id).filter(models.Company.name.in_(names)).all()
+    )
+
+    new_companies = {}
+    for record in records:
+        name = _company_name(record)
+        if name in company_ids or name in new_companies:
+            continue
+        new_companies[name] = {
+            'name': name,
+            'enterprise_size': record.get('enterprise_size'),
+            'establishment_date': _to_date(record.get('establishment_date')),
+            'enterprise_type': record.get('enterprise_type'),
+            'industry_main': record.get('industry_main'),
+            'industry_major': record.get('industry_major'),
+            'is_high_tech': bool(record.get('is_high_tech', False)),
+        }
+    if new_companies:
+        inserted = db.execute(
+            insert(models.Company).returning(models.Company.name, models.Company.id),
+            list(new_companies.values())
+        )
+        company_ids.update({name: company_id for name, company_id in inserted})
+
+    now = datetime.datetime.now()
+    rows = [
+        {
+            'company_id': company_ids[_company_name(record)],
+            'loan_amount': record.get('loan_amount'),
+            'guarantee_amount': record.get('guarantee_amount'),
+            'loan_start_date': _to_date(record.get('loan_start_date')),
+            'loan_due_date': _to_date(record.get('loan_due_date')),
+            'loan_interest_rate': record.get('loan_interest_rate'),
+            'guarantee_fee_rate': record.get('guarantee_fee_rate'),
+            'outstanding_loan_balance': record.get('outstanding_loan_balance'),
+            'outstanding_guarantee_balance': record.get('outstanding_guarantee_balance'),
+            'loan_status': record.get('loan_status'),
+            'cooperative_bank': record.get('cooperative_bank'),
+            'snapshot_year': int(record.get('snapshot_year') or now.year),
+            'snapshot_month': int(record.get('snapshot_month') or now.month),
+        }
+        for record in records
+    ]
+    db.execute(insert(models.BusinessData), rows)
+    _add_to_rollups(db, rows)
+    dataset.commit_change(db)
+
+def stream_excel_data(source, db: Session, chunk_size: int = CHUNK_SIZE, on_chunk=None, timings: dict = None):
+    # Streaming counterpart of import_excel_data for .xlsx files: rows are read
+    # with openpyxl in read-only mode and imported chunk by chunk, so peak
+    # memory depends on chunk_size rather than on the size of the workbook.
+    # source may be a path or a seekable binary file object. on_chunk is called
+    # with the running row count after each committed chunk, and timings (if
+    # given) accumulates seconds spent reading and writing.
+    if timings is None:
+        timings = {}
+    timings.setdefault('read', 0.0)
+    timings.setdefault('write', 0.0)
+    started = time.perf_counter()
+    workbook = load_workbook(source, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return 0
+        header = [str(h).strip() if h is not None else None for h in header]
+
+        records = ({k: v for k, v in zip(header, row) if k} for row in rows)
+        records = (r for r in records if _company_name(r))
+
+        imported_count = 0
+        for chunk in _iter_chunks(records, chunk_size):
+            write_started = time.perf_counter()
+            timings['read'] += write_started - started
+            _import_chunk(chunk, db)
+            imported_count += len(chunk)
+            started = time.perf_counter()
+            timings['write'] += started - write_started
+            if on_chunk:
+                on_chunk(imported_count)
+        timings['read'] += time.perf_counter() - started
+        return imported_count
+    finally:
+        workbook.close()
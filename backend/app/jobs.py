@@ -0,0 +1,96 @@
+import datetime
+import os
+import shutil
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy.orm import Session
+from . import models, reports
+from .database import SessionLocal, ReadSessionLocal
+from .importer import import_excel_data, stream_excel_data
+
+# Uploads are kept here until their job has finished
+IMPORT_JOB_DIR = os.getenv("IMPORT_JOB_DIR", "./import_jobs")
+IMPORT_JOB_WORKERS = int(os.getenv("IMPORT_JOB_WORKERS", "2"))
+
+_executor = ThreadPoolExecutor(max_workers=IMPORT_JOB_WORKERS, thread_name_prefix="import-job")
+
+def submit_import(db: Session, filename: str, fileobj, streaming: bool = True):
+    # Persist the upload and a queued job, then hand the job to the worker pool
+    os.makedirs(IMPORT_JOB_DIR, exist_ok=True)
+    file_path = os.path.join(IMPORT_JOB_DIR, f"{uuid.uuid4().hex}{os.path.splitext(filename)[1]}")
+    with open(file_path, "wb") as f:
+        shutil.copyfileobj(fileobj, f)
+
+    job = models.ImportJob(filename=filename, file_path=file_path, streaming=streaming, status="queued", rows_processed=0)
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    _executor.submit(run_job, job.id, streaming)
+    return job
+
+def run_job(job_id: int, streaming: bool = True):
+    db = SessionLocal()
+    try:
+        job = db.get(models.ImportJob, job_id)
+        if job is None or job.status != "queued":
+            return
+        job.status = "running"
+        job.started_at = datetime.datetime.utcnow()
+        db.commit()
+
+        timings = {}
+        try:
+            if streaming and job.file_path.endswith(".xlsx"):
+                def on_chunk(count):
+                    job.rows_processed = count
+                    db.commit()
+                job.rows_processed = stream_excel_data(job.file_path, db, on_chunk=on_chunk, timings=timings)
+            else:
+                start = time.perf_counter()
+                job.rows_processed = import_excel_data(job.file_path, db)
+                timings["import"] = time.perf_counter() - start
+            job.status = "done"
+        except Exception as e:
+            db.rollback()
+            job.status = "failed"
+            job.error = str(e)
+
+        job.stage_timings = {stage: round(seconds, 3) for stage, seconds in timings.items()}
+        job.finished_at = datetime.datetime.utcnow()
+        db.commit()
+        if os.path.exists(job.file_path):
+            os.remove(job.file_path)
+        if job.status == "done":
+            with ReadSessionLocal() as read_db:
+                reports.warm_cache(read_db)
+    finally:
+        db.close()
+
+def recover_orphaned_jobs():
+    # Called at start-up. Queued jobs whose upload is still on disk are
+    # resubmitted. Running jobs are failed rather than resumed: the streaming
+    # importer commits chunk by chunk and appends rows, so re-running a
+    # partially imported file would duplicate the committed chunks.
+    db = SessionLocal()
+    try:
+        resumed = []
+        orphaned = db.query(models.ImportJob).filter(models.ImportJob.status.in_(["queued", "running"])).all()
+        for job in orphaned:
+            if job.status == "queued" and job.file_path and os.path.exists(job.file_path):
+                resumed.append((job.id, job.streaming))
+                continue
+            job.error = (
+                f"Interrupted by a restart after {job.rows_processed} rows."
+                if job.status == "running" else "Interrupted by a restart and the uploaded file is no longer available."
+            )
+            job.status = "failed"
+            job.finished_at = datetime.datetime.utcnow()
+            if job.file_path and os.path.exists(job.file_path):
+                os.remove(job.file_path)
+        db.commit()
+        for job_id, streaming in resumed:
+            _executor.submit(run_job, job_id, streaming)
+        return [job_id for job_id, _ in resumed]
+    finally:
+        db.close()
@@ -1,8 +1,18 @@
+import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from .api import auth, data, dashboard
+from fastapi.middleware.gzip import GZipMiddleware
+from .api import auth, data, dashboard, jobs as jobs_api
+from .jobs import recover_orphaned_jobs
 
-app = FastAPI(title="BSM Reproduction Guide API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Resume or fail import jobs interrupted by the previous shutdown
+    recover_orphaned_jobs()
+    yield
+
+app = FastAPI(title="BSM Reproduction Guide API", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -10,11 +20,15 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
+# Dashboard JSON above GZIP_MINIMUM_SIZE bytes is sent compressed
+app.add_middleware(GZipMiddleware, minimum_size=int(os.getenv("GZIP_MINIMUM_SIZE", "1024")), compresslevel=6)
 
 app.include_router(auth.router, prefix="/api/auth", tags=["Auth"])
 app.include_router(data.router, prefix="/api/data", tags=["Data"])
 app.include_router(dashboard.router, prefix="/api/dashboard", tags=["Dashboard"])
+app.include_router(jobs_api.router, prefix="/api/jobs", tags=["Jobs"])
 
 @app.get("/")
 async def root():
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, Numeric, Date, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Boolean, Numeric, Date, DateTime, ForeignKey, Index, JSON, Text, UniqueConstraint, true
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from .database import Base
@@ -29,9 +29,10 @@ class Company(Base):
 
 class BusinessData(Base):
     __tablename__ = "business_data"
+    __table_args__ = (Index("ix_business_data_snapshot", "snapshot_year", "snapshot_month"),)
 
     id = Column(Integer, primary_key=True, index=True)
-    company_id = Column(Integer, ForeignKey("companies.id"), nullable=False)
+    company_id = Column(Integer, ForeignKey("companies.id"), nullable=False, index=True)
     loan_amount = Column(Numeric(18, 4), nullable=True)
     guarantee_amount = Column(Numeric(18, 4), nullable=True)
     loan_start_date = Column(Date, nullable=True)
@@ -47,3 +48,41 @@ class BusinessData(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
 
     company = relationship("Company", back_populates="business_data")
+
+class MonthlyRollup(Base):
+    # Per-snapshot totals of business_data, kept up to date by the importer
+    __tablename__ = "monthly_rollups"
+    __table_args__ = (UniqueConstraint("snapshot_year", "snapshot_month", name="uq_monthly_rollups_snapshot"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    snapshot_year = Column(Integer, nullable=False)
+    snapshot_month = Column(Integer, nullable=False)
+    row_count = Column(Integer, nullable=False, default=0)
+    total_loan = Column(Numeric(18, 4), nullable=False, default=0)
+    total_guarantee = Column(Numeric(18, 4), nullable=False, default=0)
+    total_outstanding_loan = Column(Numeric(18, 4), nullable=False, default=0)
+    total_outstanding_guarantee = Column(Numeric(18, 4), nullable=False, default=0)
+
+class ImportJob(Base):
+    __tablename__ = "import_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    filename = Column(String, nullable=False)
+    file_path = Column(String, nullable=True)
+    # Whether .xlsx uploads are read in chunks; kept so a recovered job takes the same path
+    streaming = Column(Boolean, nullable=False, default=True, server_default=true())
+    status = Column(String(20), nullable=False, default="queued", index=True)
+    rows_processed = Column(Integer, nullable=False, default=0)
+    stage_timings = Column(JSON, nullable=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+class DatasetVersion(Base):
+    # Single row counting committed imports; see app.dataset
+    __tablename__ = "dataset_version"
+
+    id = Column(Integer, primary_key=True)
+    epoch = Column(String(32), nullable=False)
+    version = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,70 @@
+from sqlalchemy import func, tuple_
+from sqlalchemy.orm import Session
+from . import cache, dataset
+from .models import BusinessData, Company, MonthlyRollup
+
+ROLLUP_TOTALS = ["total_loan", "total_guarantee", "total_outstanding_loan", "total_outstanding_guarantee"]
+
+def compute_summary(db: Session):
+    # Totals over every snapshot, read from monthly_rollups (one row per month)
+    total_companies = db.query(func.count(Company.id)).scalar()
+
+    business_summary = db.query(
+        *[func.sum(getattr(MonthlyRollup, total)).label(total) for total in ROLLUP_TOTALS]
+    ).first()
+
+    return {
+        "total_companies": total_companies or 0,
+        **{total: float(getattr(business_summary, total) or 0) for total in ROLLUP_TOTALS},
+    }
+
+def compute_growth(db: Session, start: tuple = None, end: tuple = None):
+    # Monthly totals, optionally limited to the (year, month) range start..end
+    snapshot = tuple_(MonthlyRollup.snapshot_year, MonthlyRollup.snapshot_month)
+    query = db.query(MonthlyRollup)
+    if start:
+        query = query.filter(snapshot >= start)
+    if end:
+        query = query.filter(snapshot <= end)
+    growth_data = query.order_by(MonthlyRollup.snapshot_year.asc(), MonthlyRollup.snapshot_month.asc()).all()
+
+    result = []
+    for row in growth_data:
+        result.append({
+            "period": f"{row.snapshot_year}-{row.snapshot_month:02d}",
+            **{total: float(getattr(row, total) or 0) for total in ROLLUP_TOTALS},
+        })
+
+    return result
+
+def rebuild_rollups(db: Session):
+    # Recompute monthly_rollups from business_data, e.g. after rows were
+    # changed outside the importer
+    db.query(MonthlyRollup).delete()
+    months = db.query(
+        BusinessData.snapshot_year,
+        BusinessData.snapshot_month,
+        func.count().label("row_count"),
+        func.coalesce(func.sum(BusinessData.loan_amount), 0).label("total_loan"),
+        func.coalesce(func.sum(BusinessData.guarantee_amount), 0).label("total_guarantee"),
+        func.coalesce(func.sum(BusinessData.outstanding_loan_balance), 0).label("total_outstanding_loan"),
+        func.coalesce(func.sum(BusinessData.outstanding_guarantee_balance), 0).label("total_outstanding_guarantee")
+    ).group_by(BusinessData.snapshot_year, BusinessData.snapshot_month).all()
+    db.add_all([MonthlyRollup(**row._asdict()) for row in months])
+    dataset.commit_change(db)
+    return len(months)
+
+# version: the dataset version the caller already read from db, if any
+
+def get_summary(db: Session, version=None):
+    if version is None: version = dataset.current_version(db)
+    return cache.get_or_compute("summary", (), version, lambda: compute_summary(db))
+
+def get_growth(db: Session, start: tuple = None, end: tuple = None, version=None):
+    if version is None: version = dataset.current_version(db)
+    return cache.get_or_compute("growth", (start, end), version, lambda: compute_growth(db, start, end))
+
+def warm_cache(db: Session):
+    # Called after an import finishes so the next dashboard load is served from the cache
+    get_summary(db)
+    get_growth(db)
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr
-from typing import Optional, List
+from typing import Optional, List, Dict
 from datetime import datetime, date
 from decimal import Decimal
 
@@ -19,6 +19,18 @@ class User(UserBase):
     class Config:
         from_attributes = True
 
+class Principal(BaseModel):
+    # What an authenticated request knows about its user; immutable because
+    # one instance is cached and shared between requests
+    id: int
+    username: str
+    email: str
+    is_active: bool
+
+    class Config:
+        from_attributes = True
+        frozen = True
+
 class Token(BaseModel):
     access_token: str
     token_type: str
@@ -71,3 +83,18 @@ class Company(CompanyBase):
 
     class Config:
         from_attributes = True
+
+class ImportJob(BaseModel):
+    id: int
+    filename: str
+    streaming: bool = True
+    status: str
+    rows_processed: int
+    stage_timings: Optional[Dict[str, float]] = None
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
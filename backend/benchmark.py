@@ -0,0 +1,104 @@
+"""
+Benchmarks for the backend importer.
+
+Each measurement runs in a fresh interpreter against a throwaway SQLite
+database, so the configured DATABASE_URL is never touched. Usage:
+
+    python benchmark.py import-memory --rows 100000
+"""
+import argparse
+import datetime
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from openpyxl import Workbook
+
+COLUMNS = [
+    "enterprise_name", "enterprise_size", "establishment_date", "enterprise_type", "industry_main",
+    "industry_major", "is_high_tech", "loan_amount", "guarantee_amount", "loan_start_date", "loan_due_date",
+    "loan_interest_rate", "guarantee_fee_rate", "outstanding_loan_balance", "outstanding_guarantee_balance",
+    "loan_status", "cooperative_bank", "snapshot_year", "snapshot_month",
+]
+
+
+def build_workbook(path, rows, companies, seed=0):
+    """Write a synthetic import workbook in the backend column layout to path."""
+    rng = random.Random(seed)
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append(COLUMNS)
+    for _ in range(rows):
+        start = datetime.date(rng.randint(2021, 2025), rng.randint(1, 12), rng.randint(1, 28))
+        amount = round(rng.uniform(10, 1000), 2)
+        ws.append([
+            f"测试企业{rng.randrange(companies):06d}有限公司", rng.choice(["小型", "中型"]),
+            datetime.date(2010, 1, 1), "有限责任公司", "制造业", "通用设备制造业", rng.random() < 0.2,
+            amount, round(amount * 0.8, 2), start, start + datetime.timedelta(days=365),
+            0.035, 0.01, round(amount * 0.5, 2), round(amount * 0.4, 2),
+            "正常", rng.choice(["中国银行", "农业银行"]), 2025, 6,
+        ])
+    wb.save(path)
+
+
+def run_import(mode, workbook_path):
+    # Executed in a child process so ru_maxrss only reflects this import
+    db_fd, db_path = tempfile.mkstemp(suffix=".db")
+    os.close(db_fd)
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    from app import models
+    from app.database import SessionLocal, engine
+    from app.importer import import_excel_data, stream_excel_data
+
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    if mode == "streaming":
+        count = stream_excel_data(workbook_path, db)
+    else:
+        count = import_excel_data(workbook_path, db)
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    db.close()
+    os.remove(db_path)
+    print(f"{mode:>9}: {count} rows in {elapsed:.2f}s, peak RSS {peak / 1024:.0f} MiB "
+          f"(+{(peak - baseline) / 1024:.0f} MiB over startup)")
+
+
+def bench_import_memory(args):
+    fd, workbook_path = tempfile.mkstemp(suffix=".xlsx")
+    os.close(fd)
+    try:
+        build_workbook(workbook_path, args.rows, args.companies)
+        size = os.path.getsize(workbook_path) / 1024 / 1024
+        print(f"workbook: {args.rows} rows, {size:.1f} MiB")
+        for mode in ("pandas", "streaming"):
+            subprocess.run([sys.executable, __file__, "_run", mode, workbook_path], check=True)
+    finally:
+        os.remove(workbook_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    memory_parser = subparsers.add_parser("import-memory", help="Compare peak RSS of the pandas and streaming importers")
+    memory_parser.add_argument("--rows", type=int, default=100000)
+    memory_parser.add_argument("--companies", type=int, default=20000)
+    memory_parser.set_defaults(func=bench_import_memory)
+
+    run_parser = subparsers.add_parser("_run")
+    run_parser.add_argument("mode", choices=["pandas", "streaming"])
+    run_parser.add_argument("workbook_path")
+    run_parser.set_defaults(func=lambda args: run_import(args.mode, args.workbook_path))
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
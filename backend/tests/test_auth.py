@@ -0,0 +1,60 @@
+import time
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app import auth, models
+from app.api.auth import get_current_user
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    models.Base.metadata.create_all(bind=engine)
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    session.add(models.User(username="tester", email="tester@example.com", hashed_password=auth.get_password_hash("secret")))
+    session.commit()
+    auth.invalidate_principals()
+    yield session
+    session.close()
+    auth.invalidate_principals()
+
+def count_user_queries(db, run):
+    statements = []
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if "FROM users" in statement:
+            statements.append(statement)
+
+    engine = db.get_bind()
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        result = run()
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+    return result, len(statements)
+
+def test_password_hash_roundtrip():
+    hashed_password = auth.get_password_hash("secret")
+    assert auth.verify_password("secret", hashed_password)
+    assert not auth.verify_password("wrong", hashed_password)
+
+def test_current_user_is_cached(db):
+    token = auth.create_access_token(data={"sub": "tester"})
+    user, queries = count_user_queries(db, lambda: get_current_user(token, db))
+    assert (user.username, queries) == ("tester", 1)
+    user, queries = count_user_queries(db, lambda: get_current_user(token, db))
+    assert (user.username, queries) == ("tester", 0)
+
+def test_user_change_invalidates_cache(db):
+    token = auth.create_access_token(data={"sub": "tester"})
+    get_current_user(token, db)
+    db.query(models.User).filter_by(username="tester").one().email = "changed@example.com"
+    db.commit()
+    user, queries = count_user_queries(db, lambda: get_current_user(token, db))
+    assert (user.email, queries) == ("changed@example.com", 1)
+
+def test_cached_user_expires(db, monkeypatch):
+    token = auth.create_access_token(data={"sub": "tester"})
+    get_current_user(token, db)
+    monkeypatch.setattr(time, "monotonic", lambda now=time.monotonic(): now + auth.PRINCIPAL_CACHE_TTL + 1)
+    _, queries = count_user_queries(db, lambda: get_current_user(token, db))
+    assert queries == 1
@@ -0,0 +1,127 @@
+import math
+import socket
+import threading
+import time
+import bcrypt
+import httpx
+import pytest
+import uvicorn
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app import auth, cache, jobs, models, reports
+from app.api.auth import get_current_user
+from app.database import get_db, get_read_db
+from app.main import app
+from test_importer import make_workbook
+
+def p99(latencies):
+    # Nearest-rank percentile
+    return sorted(latencies)[math.ceil(0.99 * len(latencies)) - 1]
+
+def summary_latencies(client, count):
+    latencies = []
+    for _ in range(count):
+        start = time.perf_counter()
+        assert client.get("/api/dashboard/summary").status_code == 200
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+def serve(app):
+    # A single uvicorn worker, so a handler that blocks the event loop
+    # stalls every other request as it would in production
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run)
+    thread.start()
+    deadline = time.monotonic() + 10
+    while not server.started:
+        if not thread.is_alive() or time.monotonic() > deadline:
+            server.should_exit = True
+            thread.join(5)
+            pytest.fail("uvicorn did not start")
+        time.sleep(0.01)
+    return server, thread, f"http://127.0.0.1:{port}"
+
+@pytest.fixture
+def live_app(tmp_path, monkeypatch):
+    # Serves the app against a temporary database; the job runner and the
+    # startup recovery use it too, so the checked-in database is never opened
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}", connect_args={"check_same_thread": False})
+    models.Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    def get_test_db():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    monkeypatch.setattr(jobs, "SessionLocal", Session)
+    monkeypatch.setattr(jobs, "ReadSessionLocal", Session)
+    monkeypatch.setattr(jobs, "IMPORT_JOB_DIR", str(tmp_path / "jobs"))
+    app.dependency_overrides[get_db] = get_test_db
+    app.dependency_overrides[get_read_db] = get_test_db
+    auth.invalidate_principals()
+    cache.clear()
+    server, thread, url = serve(app)
+    try:
+        yield Session, url
+    finally:
+        server.should_exit = True
+        thread.join()
+        app.dependency_overrides.clear()
+        auth.invalidate_principals()
+        cache.clear()
+
+def test_summary_latency_stays_flat_during_import(live_app, monkeypatch):
+    Session, url = live_app
+    # Stands in for a report over a large table that keeps its handler busy for a second
+    compute_growth = reports.compute_growth
+    monkeypatch.setattr(reports, "compute_growth", lambda *args: time.sleep(1) or compute_growth(*args))
+    app.dependency_overrides[get_current_user] = lambda: models.User(username="tester")
+    with httpx.Client(base_url=url, timeout=30) as client:
+        baseline = p99(summary_latencies(client, 20))
+
+        rows = [[f"企业{i % 50}", "小型", 100 + i, None, 2025, 1 + i % 12] for i in range(3000)]
+        job_id = client.post("/api/data/import", files={"file": ("rows.xlsx", make_workbook(rows))}).json()["job_id"]
+        growth = threading.Thread(target=httpx.get, args=(f"{url}/api/dashboard/growth?from=2025-01&to=2025-12",), kwargs={"timeout": 30})
+        growth.start()
+        time.sleep(0.1)
+        during = p99(summary_latencies(client, 20))
+        growth.join()
+
+        while client.get(f"/api/jobs/{job_id}").json()["status"] in ("queued", "running"):
+            time.sleep(0.05)
+        assert client.get(f"/api/jobs/{job_id}").json()["status"] == "done"
+
+    assert during < max(0.5, 10 * baseline)
+
+def test_summary_latency_stays_flat_during_login_storm(live_app):
+    Session, url = live_app
+    with Session() as db:
+        # Cheaper than the default cost, but each check still takes tens of ms
+        hashed_password = bcrypt.hashpw(b"secret", bcrypt.gensalt(rounds=10)).decode()
+        db.add(models.User(username="tester", email="tester@example.com", hashed_password=hashed_password))
+        db.commit()
+    token = auth.create_access_token(data={"sub": "tester"})
+
+    with httpx.Client(base_url=url, headers={"Authorization": f"Bearer {token}"}, timeout=30) as client:
+        baseline = p99(summary_latencies(client, 20))
+
+        statuses = []
+        def login():
+            response = httpx.post(f"{url}/api/auth/token", data={"username": "tester", "password": "secret"}, timeout=30)
+            statuses.append(response.status_code)
+        logins = [threading.Thread(target=login) for _ in range(16)]
+        for login_thread in logins:
+            login_thread.start()
+        time.sleep(0.05)
+        during = p99(summary_latencies(client, 20))
+        for login_thread in logins:
+            login_thread.join()
+
+    assert statuses == [200] * 16
+    assert during < max(0.5, 10 * baseline)
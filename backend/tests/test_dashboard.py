@@ -0,0 +1,54 @@
+import pytest
+from fastapi.testclient import TestClient
+from app import cache, models, reports
+from app.api.auth import get_current_user
+from app.database import get_read_db
+from app.importer import stream_excel_data
+from app.main import app
+from test_importer import make_session, make_workbook
+
+@pytest.fixture
+def client():
+    # The app's lifespan, which opens the real database, is not run here
+    db = make_session()
+    stream_excel_data(make_workbook([[f"企业{i}", "小型", 100 + i, None, 2020 + i // 12, 1 + i % 12] for i in range(60)]), db)
+
+    def get_test_db():
+        yield db
+
+    app.dependency_overrides[get_read_db] = get_test_db
+    app.dependency_overrides[get_current_user] = lambda: models.User(username="tester")
+    cache.clear()
+    try:
+        yield TestClient(app), db
+    finally:
+        app.dependency_overrides.clear()
+        cache.clear()
+        db.close()
+
+def test_dashboard_answers_if_none_match_until_an_import(client, monkeypatch):
+    client, db = client
+    first = client.get("/api/dashboard/summary")
+    etag = first.headers["etag"]
+    assert first.status_code == 200
+
+    # A current copy is confirmed without computing the report
+    monkeypatch.setattr(reports, "get_summary", lambda *args, **kwargs: pytest.fail("report recomputed"))
+    cached = client.get("/api/dashboard/summary", headers={"If-None-Match": etag})
+    assert (cached.status_code, cached.content, cached.headers["etag"]) == (304, b"", etag)
+    monkeypatch.undo()
+
+    growth = client.get("/api/dashboard/growth?from=2020-01&to=2020-12").headers["etag"]
+    assert growth not in (etag, client.get("/api/dashboard/growth").headers["etag"])
+
+    stream_excel_data(make_workbook([["新企业", "小型", 50, None, 2025, 1]]), db)
+    changed = client.get("/api/dashboard/summary", headers={"If-None-Match": etag})
+    assert changed.status_code == 200 and changed.headers["etag"] != etag
+
+def test_large_dashboard_responses_are_compressed(client):
+    client, db = client
+    compressed = client.get("/api/dashboard/growth", headers={"Accept-Encoding": "gzip"})
+    assert compressed.headers["content-encoding"] == "gzip"
+    assert int(compressed.headers["content-length"]) < len(compressed.content)
+    assert compressed.json() == client.get("/api/dashboard/growth", headers={"Accept-Encoding": "identity"}).json()
+    assert "content-encoding" not in client.get("/api/dashboard/summary", headers={"Accept-Encoding": "gzip"}).headers
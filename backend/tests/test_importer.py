@@ -0,0 +1,77 @@
+import datetime
+import io
+from openpyxl import Workbook
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app import cache, models, reports
+from app.importer import stream_excel_data
+
+def make_session():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    models.Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)()
+
+def make_workbook(rows):
+    wb = Workbook()
+    ws = wb.active
+    ws.append(["enterprise_name", "enterprise_size", "loan_amount", "loan_start_date", "snapshot_year", "snapshot_month"])
+    for row in rows:
+        ws.append(row)
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    buffer.seek(0)
+    return buffer
+
+def test_stream_excel_data_imports_in_chunks():
+    db = make_session()
+    workbook = make_workbook([
+        ["甲公司", "小型", 100, datetime.datetime(2024, 3, 1), 2025, 6],
+        ["乙公司", "中型", 200, None, 2025, 6],
+        [None, None, 999, None, 2025, 6],
+        ["甲公司", "小型", 300, datetime.datetime(2025, 1, 5), 2025, 6],
+    ])
+
+    assert stream_excel_data(workbook, db, chunk_size=2) == 3
+
+    companies = {c.name: c for c in db.query(models.Company).all()}
+    assert set(companies) == {"甲公司", "乙公司"}
+    rows = db.query(models.BusinessData).order_by(models.BusinessData.id).all()
+    assert [float(r.loan_amount) for r in rows] == [100, 200, 300]
+    assert rows[0].loan_start_date == datetime.date(2024, 3, 1)
+    assert rows[2].company_id == companies["甲公司"].id
+    assert {(r.snapshot_year, r.snapshot_month) for r in rows} == {(2025, 6)}
+
+def test_dashboard_cache_is_invalidated_by_imports():
+    db = make_session()
+    cache.clear()
+    assert reports.get_summary(db)["total_loan"] == 0
+    assert reports.get_summary(db) is reports.get_summary(db)
+
+    stream_excel_data(make_workbook([["甲公司", "小型", 100, None, 2025, 6]]), db)
+    assert reports.get_summary(db)["total_loan"] == 100
+    assert reports.get_growth(db) == [{
+        "period": "2025-06", "total_loan": 100.0, "total_guarantee": 0.0,
+        "total_outstanding_loan": 0.0, "total_outstanding_guarantee": 0.0,
+    }]
+
+    # A write from another worker only changes the database, including the
+    # persisted dataset version
+    db.execute(models.MonthlyRollup.__table__.update().values(total_loan=40))
+    db.execute(models.DatasetVersion.__table__.update().values(version=models.DatasetVersion.version + 1))
+    db.commit()
+    assert reports.get_summary(db)["total_loan"] == 40
+
+def test_monthly_rollups_follow_imports():
+    db = make_session()
+    rows = [["甲公司", "小型", 100 + i, None, 2025, 5 + i % 2] for i in range(5)]
+    stream_excel_data(make_workbook(rows), db, chunk_size=2)
+    stream_excel_data(make_workbook([["乙公司", "中型", 50.5, None, 2025, 7]]), db)
+
+    growth = reports.compute_growth(db)
+    assert [(g["period"], g["total_loan"]) for g in growth] == [("2025-05", 306), ("2025-06", 204), ("2025-07", 50.5)]
+    assert reports.compute_summary(db)["total_loan"] == 560.5
+    assert [g["period"] for g in reports.compute_growth(db, (2025, 6), (2025, 7))] == ["2025-06", "2025-07"]
+
+    assert reports.rebuild_rollups(db) == 3
+    assert reports.compute_growth(db) == growth
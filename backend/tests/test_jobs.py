@@ -0,0 +1,96 @@
+import io
+import os
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app import cache, jobs, models
+from test_importer import make_workbook
+
+class RecordingExecutor:
+    # Stands in for the worker pool so each test runs its jobs itself
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, fn, *args):
+        self.submitted.append(args)
+
+@pytest.fixture
+def job_db(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}", connect_args={"check_same_thread": False})
+    models.Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    executor = RecordingExecutor()
+    monkeypatch.setattr(jobs, "SessionLocal", Session)
+    monkeypatch.setattr(jobs, "ReadSessionLocal", Session)
+    monkeypatch.setattr(jobs, "IMPORT_JOB_DIR", str(tmp_path / "jobs"))
+    monkeypatch.setattr(jobs, "_executor", executor)
+    cache.clear()
+    yield Session, executor
+    cache.clear()
+
+def test_job_runs_from_queued_to_done(job_db, monkeypatch):
+    Session, executor = job_db
+    db = Session()
+    workbook = make_workbook([["甲公司", "小型", 100, None, 2025, 6], ["乙公司", "中型", 200, None, 2025, 6]])
+    job = jobs.submit_import(db, "rows.xlsx", workbook)
+    assert job.status == "queued" and os.path.exists(job.file_path)
+    assert executor.submitted == [(job.id, True)]
+
+    seen = []
+    stream_excel_data = jobs.stream_excel_data
+    def tracked(*args, **kwargs):
+        with Session() as other:
+            seen.append(other.get(models.ImportJob, job.id).status)
+        return stream_excel_data(*args, **kwargs)
+    monkeypatch.setattr(jobs, "stream_excel_data", tracked)
+    jobs.run_job(job.id)
+
+    db.refresh(job)
+    assert seen == ["running"]
+    assert (job.status, job.rows_processed, job.error) == ("done", 2, None)
+    assert job.started_at <= job.finished_at and set(job.stage_timings) >= {"read", "write"}
+    assert not os.path.exists(job.file_path)
+    assert db.query(models.BusinessData).count() == 2
+
+    # A finished job is not run again
+    jobs.run_job(job.id)
+    assert db.query(models.BusinessData).count() == 2
+
+def test_failed_job_records_the_error(job_db):
+    Session, executor = job_db
+    db = Session()
+    job = jobs.submit_import(db, "broken.xlsx", io.BytesIO(b"not a workbook"), streaming=False)
+    assert executor.submitted == [(job.id, False)] and job.streaming is False
+    jobs.run_job(job.id)
+
+    db.refresh(job)
+    assert job.status == "failed" and job.error
+    assert job.finished_at is not None and not os.path.exists(job.file_path)
+    assert db.query(models.BusinessData).count() == 0
+
+def test_recover_orphaned_jobs(job_db, tmp_path):
+    Session, executor = job_db
+    db = Session()
+    def upload(name):
+        path = tmp_path / name
+        path.write_bytes(b"upload")
+        return str(path)
+    queued = models.ImportJob(filename="a.xlsx", file_path=upload("a.xlsx"), status="queued")
+    pandas_path = models.ImportJob(filename="e.xlsx", file_path=upload("e.xlsx"), streaming=False, status="queued")
+    lost = models.ImportJob(filename="b.xlsx", file_path=str(tmp_path / "missing.xlsx"), status="queued")
+    running = models.ImportJob(filename="c.xlsx", file_path=upload("c.xlsx"), status="running", rows_processed=500)
+    done = models.ImportJob(filename="d.xlsx", status="done", rows_processed=10)
+    db.add_all([queued, pandas_path, lost, running, done])
+    db.commit()
+
+    # Resumed jobs keep the import path the caller chose
+    assert jobs.recover_orphaned_jobs() == [queued.id, pandas_path.id]
+    assert executor.submitted == [(queued.id, True), (pandas_path.id, False)]
+
+    db.expire_all()
+    assert queued.status == "queued" and os.path.exists(queued.file_path)
+    assert lost.status == "failed" and "no longer available" in lost.error
+    # A partly streamed import is failed rather than appended to twice
+    assert running.status == "failed" and "after 500 rows" in running.error
+    assert not os.path.exists(running.file_path)
+    assert (done.status, done.error) == ("done", None)
@@ -0,0 +1,307 @@
+"""
+Import benchmarks for the demo backend.
+
+Runs against an in-memory SQLite database so the bundled business_data.db
+is never touched. Usage:
+
+    python benchmark.py import --rows 20000 --companies 5000
+    python benchmark.py parse --rows 200000
+    python benchmark.py bulk --files 12 --rows 5000
+    python benchmark.py statistics --years 5 --rows 20000
+    python benchmark.py statistics-batch --years 3 --rows 5000
+    python benchmark.py export --rows 20000
+    python benchmark.py mixed --imports 5 --readers 4
+"""
+import argparse
+import io
+import random
+import tempfile
+import threading
+import time
+import tracemalloc
+import datetime
+from openpyxl import Workbook
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+import database
+import models
+import services
+
+SHEETS = {
+    "线下业务": ["企业名称", "借款金额（万元）", "担保金额（万元）", "借款起始日", "借款到期日", "借款利率",
+                "担保费率", "借款余额（万元）", "担保余额（万元）", "借据状态", "结清日期", "企业划型",
+                "合作银行", "业务年度"],
+    "微众批量业务": ["企业名称", "借款金额（万元）", "借款起始日", "借款到期日", "借款利率", "担保费率",
+                  "借款余额（万元）", "担保余额（万元）", "借据状态", "结清日期", "企业划型"],
+    "建行批量业务": ["企业名称", "借款金额（万元）", "担保金额（万元）", "借款起始日", "借款到期日", "借款利率",
+                  "担保费率", "借款余额（万元）", "担保余额（万元）", "借据状态", "结清日期", "企业划型",
+                  "业务年度"],
+    "工行批量业务": ["企业名称", "借款金额（万元）", "担保金额（万元）", "借款起始日", "借款到期日", "借款利率",
+                  "担保费率", "借款余额（万元）", "担保余额（万元）", "借据状态", "结清日期", "企业划型",
+                  "业务年度"],
+}
+
+
+def build_workbook(rows, companies, seed=0):
+    """Build a synthetic 智融担保项目明细 workbook and return its bytes."""
+    rng = random.Random(seed)
+    names = [f"测试企业{i:06d}有限公司" for i in range(companies)]
+    wb = Workbook()
+    wb.remove(wb.active)
+    per_sheet = rows // len(SHEETS)
+    for sheet_name, columns in SHEETS.items():
+        ws = wb.create_sheet(sheet_name)
+        ws.append([sheet_name])
+        ws.append(columns)
+        for _ in range(per_sheet):
+            start = datetime.date(rng.randint(2021, 2025), rng.randint(1, 12), rng.randint(1, 28))
+            amount = round(rng.uniform(10, 1000), 2)
+            balance = round(amount * rng.random(), 2)
+            settled = rng.random() < 0.3
+            values = {
+                "企业名称": rng.choice(names),
+                "借款金额（万元）": amount,
+                "担保金额（万元）": round(amount * 0.8, 2),
+                "借款起始日": start,
+                "借款到期日": start + datetime.timedelta(days=365),
+                "借款利率": 0.035,
+                "担保费率": 0.01,
+                "借款余额（万元）": 0 if settled else balance,
+                "担保余额（万元）": 0 if settled else round(balance * 0.8, 2),
+                "借据状态": "已结清" if settled else "正常",
+                "结清日期": start + datetime.timedelta(days=300) if settled else None,
+                "企业划型": rng.choice(["微型", "小型", "中型"]),
+                "合作银行": rng.choice(["中国银行", "农业银行", "招商银行"]),
+                "业务年度": start.year,
+            }
+            ws.append([values[c] for c in columns])
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+def make_session():
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    models.Base.metadata.create_all(bind=engine)
+    queries = {"count": 0}
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def count_queries(*args):
+        queries["count"] += 1
+
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)(), queries
+
+
+def bench_import(args):
+    contents = build_workbook(args.rows, args.companies)
+    db, queries = make_session()
+    for month in (1, 2):
+        queries["count"] = 0
+        start = time.perf_counter()
+        count = services.process_excel_import(db, contents, "business_data", 2025, month)
+        elapsed = time.perf_counter() - start
+        print(f"import #{month}: {count} rows in {elapsed:.2f}s, {queries['count']} SQL statements")
+
+
+def bench_parse(args):
+    contents = build_workbook(args.rows, args.companies)
+    print(f"workbook: {args.rows} rows, {len(contents) / 1024 / 1024:.1f} MiB")
+    results = {}
+    for parallel in (False, True):
+        start = time.perf_counter()
+        results[parallel] = services.read_sheets(contents, parallel=parallel)
+        elapsed = time.perf_counter() - start
+        print(f"{'parallel' if parallel else 'serial':>8}: {elapsed:.2f}s")
+    assert all(a.equals(b) for a, b in zip(results[False], results[True]))
+
+
+def bench_bulk(args):
+    contents = build_workbook(args.rows, args.companies)
+    files = [(f"{month:02d}.xlsx", contents, 2025, month) for month in range(1, args.files + 1)]
+
+    db, _ = make_session()
+    start = time.perf_counter()
+    for _, data, year, month in files:
+        services.process_excel_import(db, data, "business_data", year, month)
+    print(f"sequential: {args.files} files in {time.perf_counter() - start:.2f}s")
+
+    db, _ = make_session()
+    start = time.perf_counter()
+    results = services.bulk_import(db, files, "business_data")
+    print(f"bulk_import: {args.files} files in {time.perf_counter() - start:.2f}s "
+          f"({services.BULK_IMPORT_WORKERS} workers, {sum(r['error'] is not None for r in results)} errors)")
+
+
+def bench_statistics(args):
+    contents = build_workbook(args.rows, args.companies)
+    db, queries = make_session()
+    last_year = 2020 + args.years
+    for year in range(2021, last_year + 1):
+        services.process_excel_import(db, contents, "business_data", year, 12 if year < last_year else 6)
+    print(f"{args.years} snapshots of {args.rows} rows")
+    for _ in range(3):
+        queries["count"] = 0
+        start = time.perf_counter()
+        services.get_statistics(db, last_year, 6)
+        print(f"get_statistics: {(time.perf_counter() - start) * 1000:.1f}ms, {queries['count']} SQL statements")
+
+
+def bench_statistics_batch(args):
+    contents = build_workbook(args.rows, args.companies)
+    db, queries = make_session()
+    last_year = 2020 + args.years
+    for year in range(2021, last_year):
+        services.process_excel_import(db, contents, "business_data", year, 12)
+    for month in range(1, 13):
+        services.process_excel_import(db, contents, "business_data", last_year, month)
+    print(f"{args.years - 1} year-end and 12 monthly snapshots of {args.rows} rows")
+    for count in (1, 3, 6, 12):
+        periods = [(last_year, month) for month in range(1, count + 1)]
+        queries["count"] = 0
+        start = time.perf_counter()
+        for period in periods:
+            services.get_statistics(db, *period)
+        single = time.perf_counter() - start
+        single_queries = queries["count"]
+        queries["count"] = 0
+        start = time.perf_counter()
+        services.get_statistics_batch(db, periods)
+        batch = time.perf_counter() - start
+        print(f"{count:>2} periods: one by one {single * 1000:.1f}ms ({single_queries} SQL), "
+              f"batch {batch * 1000:.1f}ms ({queries['count']} SQL)")
+
+
+def bench_export(args):
+    contents = build_workbook(args.rows, args.companies)
+    db, _ = make_session()
+    services.process_excel_import(db, contents, "business_data", 2025, 6)
+    print(f"snapshot of {args.rows} rows")
+    for fmt in services.EXPORT_WRITERS:
+        start = time.perf_counter()
+        first_byte, size = None, 0
+        for chunk in services.export_data_status(db, 2025, 6, fmt):
+            if first_byte is None and chunk:
+                first_byte = time.perf_counter() - start
+            size += len(chunk)
+        elapsed = time.perf_counter() - start
+        # tracemalloc slows allocation down, so memory is measured in a second pass
+        tracemalloc.start()
+        for chunk in services.export_data_status(db, 2025, 6, fmt):
+            pass
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"{fmt:>8}: first byte {first_byte * 1000:.0f}ms, total {elapsed:.2f}s, "
+              f"{size / 1024 / 1024:.1f} MiB, peak Python memory {peak / 1024 / 1024:.1f} MiB")
+
+
+def bench_mixed(args):
+    # Reader threads query statistics and data status pages while a writer
+    # imports snapshots, once with a plain SQLite engine shared by both and
+    # once with the WAL profile and separate reader and writer engines
+    parsed = services.load_workbook_data(build_workbook(args.rows, args.companies))
+    for profile in ("default", "wal"):
+        with tempfile.TemporaryDirectory() as directory:
+            url = f"sqlite:///{directory}/mixed.db"
+            if profile == "wal":
+                writer, reader = database.create_sqlite_engine(url), database.create_sqlite_engine(url, readonly=True)
+            else:
+                writer = reader = create_engine(url, connect_args={"check_same_thread": False})
+            models.Base.metadata.create_all(bind=writer)
+            WriteSession, ReadSession = sessionmaker(bind=writer), sessionmaker(bind=reader)
+            with WriteSession() as db:
+                services.write_business_data(db, parsed, 2025, 1)
+
+            stop = threading.Event()
+            latencies, errors = [], []
+            def read_loop():
+                while not stop.is_set():
+                    with ReadSession() as db:
+                        start = time.perf_counter()
+                        try:
+                            services.get_statistics(db, 2025, 1)
+                            services.get_data_status(db, 2025, 1, limit=500)
+                        except OperationalError as e:
+                            errors.append(e)
+                            continue
+                        latencies.append(time.perf_counter() - start)
+
+            readers = [threading.Thread(target=read_loop) for _ in range(args.readers)]
+            for thread in readers:
+                thread.start()
+            start = time.perf_counter()
+            write_errors = 0
+            with WriteSession() as db:
+                for month in range(2, 2 + args.imports):
+                    try:
+                        services.write_business_data(db, parsed, 2025, month)
+                    except OperationalError:
+                        db.rollback()
+                        write_errors += 1
+            elapsed = time.perf_counter() - start
+            stop.set()
+            for thread in readers:
+                thread.join()
+            writer.dispose()
+            reader.dispose()
+
+        latencies.sort()
+        p50 = latencies[len(latencies) // 2] * 1000 if latencies else 0
+        p99 = latencies[max(0, -(-len(latencies) * 99 // 100) - 1)] * 1000 if latencies else 0
+        print(f"{profile:>8}: {args.imports} imports in {elapsed:.2f}s ({write_errors} failed), "
+              f"{len(latencies)} reads p50 {p50:.1f}ms p99 {p99:.1f}ms, {len(errors)} read errors")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = subparsers.add_parser("import", help="Time process_excel_import and count SQL statements")
+    import_parser.add_argument("--rows", type=int, default=20000)
+    import_parser.add_argument("--companies", type=int, default=5000)
+    import_parser.set_defaults(func=bench_import)
+
+    parse_parser = subparsers.add_parser("parse", help="Compare serial and parallel sheet parsing")
+    parse_parser.add_argument("--rows", type=int, default=200000)
+    parse_parser.add_argument("--companies", type=int, default=20000)
+    parse_parser.set_defaults(func=bench_parse)
+
+    bulk_parser = subparsers.add_parser("bulk", help="Compare a sequential backfill with bulk_import")
+    bulk_parser.add_argument("--files", type=int, default=12)
+    bulk_parser.add_argument("--rows", type=int, default=5000)
+    bulk_parser.add_argument("--companies", type=int, default=2000)
+    bulk_parser.set_defaults(func=bench_bulk)
+
+    statistics_parser = subparsers.add_parser("statistics", help="Time get_statistics over several yearly snapshots")
+    statistics_parser.add_argument("--years", type=int, default=5)
+    statistics_parser.add_argument("--rows", type=int, default=20000)
+    statistics_parser.add_argument("--companies", type=int, default=5000)
+    statistics_parser.set_defaults(func=bench_statistics)
+
+    batch_parser = subparsers.add_parser("statistics-batch", help="Compare per-period and batch statistics")
+    batch_parser.add_argument("--years", type=int, default=3)
+    batch_parser.add_argument("--rows", type=int, default=5000)
+    batch_parser.add_argument("--companies", type=int, default=2000)
+    batch_parser.set_defaults(func=bench_statistics_batch)
+
+    export_parser = subparsers.add_parser("export", help="Time-to-first-byte and peak memory of each export format")
+    export_parser.add_argument("--rows", type=int, default=20000)
+    export_parser.add_argument("--companies", type=int, default=5000)
+    export_parser.set_defaults(func=bench_export)
+
+    mixed_parser = subparsers.add_parser("mixed", help="Reads during imports with the default and WAL SQLite profiles")
+    mixed_parser.add_argument("--imports", type=int, default=5)
+    mixed_parser.add_argument("--readers", type=int, default=4)
+    mixed_parser.add_argument("--rows", type=int, default=20000)
+    mixed_parser.add_argument("--companies", type=int, default=5000)
+    mixed_parser.set_defaults(func=bench_mixed)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+"""
+Bounded executors for heavy work started by request handlers.
+
+The services are synchronous (SQLAlchemy sessions, pandas), so handlers
+must not call them on the event loop. Cheap queries run in plain def
+handlers, which FastAPI runs in its thread pool. Report computation goes
+through run_compute(), capped at COMPUTE_WORKERS threads. Bulk imports and
+synchronization can take minutes, so they go through run_write() and its
+own WRITE_WORKERS threads; a long write never leaves reports queued behind
+it. Writes are serialized on the single writer connection anyway, so more
+write threads only add waiting.
+"""
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+COMPUTE_WORKERS = int(os.getenv("COMPUTE_WORKERS", "2"))
+WRITE_WORKERS = int(os.getenv("WRITE_WORKERS", "2"))
+
+_executor = ThreadPoolExecutor(max_workers=COMPUTE_WORKERS, thread_name_prefix="compute")
+_write_executor = ThreadPoolExecutor(max_workers=WRITE_WORKERS, thread_name_prefix="write")
+
+async def run_compute(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+async def run_write(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_write_executor, functools.partial(func, *args, **kwargs))
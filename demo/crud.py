@@ -1,57 +1,88 @@
+import uuid
+from sqlalchemy import insert, update
 from sqlalchemy.orm import Session
 import models
 
+def get_dataset_version(db: Session):
+    # "<epoch>.<version>", or None before the first write
+    row = db.query(models.DatasetVersion.epoch, models.DatasetVersion.version) \
+        .filter(models.DatasetVersion.id == 1).first()
+    return f"{row.epoch}.{row.version}" if row else None
+
+
+def bump_dataset_version(db: Session):
+    table = models.DatasetVersion.__table__
+    updated = db.execute(update(table).where(table.c.id == 1).values(version=table.c.version + 1)).rowcount
+    if not updated:
+        db.execute(insert(table).values(id=1, epoch=uuid.uuid4().hex, version=1))
+
+
+def commit_dataset_change(db: Session):
+    # The version is bumped inside the write's transaction, so it commits (or
+    # rolls back) together with the data
+    bump_dataset_version(db)
+    db.commit()
+
+
 # Bulk create functions
 def bulk_create_business_data(db: Session, business_data_list: list[dict]):
     # Filter keys to only include those present in the model
     valid_keys = models.BusinessData.__table__.columns.keys()
     filtered_data = [{k: v for k, v in item.items() if k in valid_keys} for item in business_data_list]
     db.bulk_insert_mappings(models.BusinessData, filtered_data)
-    db.commit()
+    commit_dataset_change(db)
+
+
+def _last_per_company(rows: list[dict]):
+    # Staging tables hold one row per company name; the last row of a
+    # duplicated name wins
+    return list({item['company_name']: item for item in rows}.values())
 
 
 def bulk_create_qcc_industry(db: Session, qcc_industry_list: list[dict]):
     valid_keys = models.QCCIndustry.__table__.columns.keys()
-    filtered_data = [{k: v for k, v in item.items() if k in valid_keys} for item in qcc_industry_list]
+    filtered_data = _last_per_company([{k: v for k, v in item.items() if k in valid_keys} for item in qcc_industry_list])
     db.bulk_insert_mappings(models.QCCIndustry, filtered_data)
-    db.commit()
+    commit_dataset_change(db)
 
 
 def bulk_create_qcc_tech(db: Session, qcc_tech_list: list[dict]):
     valid_keys = models.QCCTech.__table__.columns.keys()
-    filtered_data = [{k: v for k, v in item.items() if k in valid_keys} for item in qcc_tech_list]
+    filtered_data = _last_per_company([{k: v for k, v in item.items() if k in valid_keys} for item in qcc_tech_list])
     db.bulk_insert_mappings(models.QCCTech, filtered_data)
-    db.commit()
+    commit_dataset_change(db)
 
 
 def bulk_create_qyjh_list(db: Session, qyjh_list: list[dict]):
     valid_keys = models.QYJHList.__table__.columns.keys()
-    filtered_data = [{k: v for k, v in item.items() if k in valid_keys} for item in qyjh_list]
+    filtered_data = _last_per_company([{k: v for k, v in item.items() if k in valid_keys} for item in qyjh_list])
     db.bulk_insert_mappings(models.QYJHList, filtered_data)
-    db.commit()
+    commit_dataset_change(db)
 
 
-def delete_business_data_by_snapshot(db: Session, year: int, month: int):
-    db.query(models.BusinessData).filter(
+def delete_business_data_by_snapshot(db: Session, year: int, month: int, commit: bool = True):
+    deleted = db.query(models.BusinessData).filter(
         models.BusinessData.snapshot_year == year,
         models.BusinessData.snapshot_month == month
     ).delete()
-    db.commit()
+    if commit:
+        commit_dataset_change(db)
+    return deleted
 
 
 def clear_qcc_industry(db: Session):
     db.query(models.QCCIndustry).delete()
-    db.commit()
+    commit_dataset_change(db)
 
 
 def clear_qcc_tech(db: Session):
     db.query(models.QCCTech).delete()
-    db.commit()
+    commit_dataset_change(db)
 
 
 def clear_qyjh_list(db: Session):
     db.query(models.QYJHList).delete()
-    db.commit()
+    commit_dataset_change(db)
 
 
 
@@ -1,13 +1,48 @@
-from sqlalchemy import create_engine
+import os
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
 SQLALCHEMY_DATABASE_URL = "sqlite:///./business_data.db"
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+# Applied to every SQLite connection. WAL lets readers run while an import
+# transaction is open, and synchronous=NORMAL drops the fsync on each commit
+# (the database stays consistent; a power loss can undo the last commits).
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "30000")),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    "cache_size": -int(os.getenv("SQLITE_CACHE_KB", str(64 * 1024))),
+}
+READ_POOL_SIZE = int(os.getenv("READ_POOL_SIZE", "8"))
+WRITE_POOL_TIMEOUT = int(os.getenv("WRITE_POOL_TIMEOUT", "300"))
+
+def create_sqlite_engine(url, readonly=False):
+    # SQLite allows one writer at a time, so the writer engine holds a single
+    # connection and write transactions queue for it instead of failing with
+    # "database is locked". Readers get a pool of query_only connections.
+    if readonly:
+        pool = {"pool_size": READ_POOL_SIZE, "max_overflow": READ_POOL_SIZE}
+    else:
+        pool = {"pool_size": 1, "max_overflow": 0, "pool_timeout": WRITE_POOL_TIMEOUT}
+    engine = create_engine(url, connect_args={"check_same_thread": False}, **pool)
+
+    @event.listens_for(engine, "connect")
+    def apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        if readonly:
+            cursor.execute("PRAGMA query_only=ON")
+        cursor.close()
+
+    return engine
+
+engine = create_sqlite_engine(SQLALCHEMY_DATABASE_URL)
+read_engine = create_sqlite_engine(SQLALCHEMY_DATABASE_URL, readonly=True)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
 
 Base = declarative_base()
 
@@ -17,3 +52,10 @@ def get_db():
         yield db
     finally:
         db.close()
+
+def get_read_db():
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
@@ -0,0 +1,134 @@
+"""
+Background import jobs.
+
+Uploads are written to IMPORT_JOB_DIR and recorded as ImportJob rows; a
+local thread pool runs them outside the request. Job state lives in the
+database so it survives restarts: recover_orphaned_jobs() requeues jobs
+that were queued or running when the process stopped.
+"""
+import datetime
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy.orm import Session
+from database import SessionLocal, ReadSessionLocal
+import models
+import services
+
+IMPORT_JOB_DIR = os.getenv("IMPORT_JOB_DIR", "./import_jobs")
+IMPORT_JOB_WORKERS = int(os.getenv("IMPORT_JOB_WORKERS", "2"))
+
+_executor = ThreadPoolExecutor(max_workers=IMPORT_JOB_WORKERS, thread_name_prefix="import-job")
+
+def submit_import(db: Session, filename: str, contents: bytes, schema_type: str, year: int = None, month: int = None, incremental: bool = False):
+    now = datetime.datetime.now()
+    os.makedirs(IMPORT_JOB_DIR, exist_ok=True)
+    file_path = os.path.join(IMPORT_JOB_DIR, f"{uuid.uuid4().hex}{os.path.splitext(filename)[1]}")
+    with open(file_path, 'wb') as f:
+        f.write(contents)
+
+    job = models.ImportJob(
+        filename=filename,
+        schema_type=schema_type,
+        snapshot_year=year if year is not None else now.year,
+        snapshot_month=month if month is not None else now.month,
+        incremental=incremental,
+        file_path=file_path,
+        status="queued",
+        rows_processed=0,
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    _executor.submit(run_job, job.id)
+    return job
+
+def run_job(job_id: int):
+    db = SessionLocal()
+    try:
+        job = db.get(models.ImportJob, job_id)
+        if job is None or job.status not in ("queued", "running"):
+            return
+        job.status = "running"
+        job.started_at = datetime.datetime.utcnow()
+        job.error = None
+        # Read before committing: touching the expired job afterwards would
+        # reload it, holding the single writer connection while parsing and
+        # before write_business_data takes the writer lock, the reverse of
+        # the order bulk_import takes them in
+        file_path, schema_type = job.file_path, job.schema_type
+        year, month, incremental = job.snapshot_year, job.snapshot_month, job.incremental
+        db.commit()
+
+        timings = {}
+        try:
+            with open(file_path, 'rb') as f:
+                contents = f.read()
+
+            if schema_type == 'business_data':
+                start = time.perf_counter()
+                parsed_data = services.load_workbook_data(contents)
+                timings['parse'] = round(time.perf_counter() - start, 3)
+
+                start = time.perf_counter()
+                changes = {}
+                job.rows_processed = services.write_business_data(
+                    db, parsed_data, year, month, incremental, changes
+                )
+                job.change_counts = changes
+                timings['write'] = round(time.perf_counter() - start, 3)
+            else:
+                job.rows_processed = services.process_excel_import(db, contents, schema_type, year, month)
+            job.status = "done"
+        except Exception as e:
+            db.rollback()
+            job.status = "failed"
+            job.error = str(e)
+
+        job.stage_timings = timings
+        job.finished_at = datetime.datetime.utcnow()
+        done = job.status == "done"
+        db.commit()
+        _remove_file(file_path)
+        if done and schema_type == 'business_data':
+            with ReadSessionLocal() as read_db:
+                services.warm_statistics_cache(read_db)
+    finally:
+        db.close()
+
+def _remove_file(file_path):
+    if file_path and os.path.exists(file_path):
+        os.remove(file_path)
+
+def recover_orphaned_jobs():
+    # Called at start-up. Snapshot writes are transactional and replace the
+    # whole snapshot, so an interrupted job can simply be run again as long as
+    # its upload is still on disk.
+    db = SessionLocal()
+    try:
+        orphaned = db.query(models.ImportJob).filter(models.ImportJob.status.in_(["queued", "running"])).all()
+        resumed = []
+        for job in orphaned:
+            if job.file_path and os.path.exists(job.file_path):
+                job.status = "queued"
+                resumed.append(job.id)
+            else:
+                job.status = "failed"
+                job.error = "Interrupted by a restart and the uploaded file is no longer available."
+                job.finished_at = datetime.datetime.utcnow()
+        db.commit()
+        for job_id in resumed:
+            _executor.submit(run_job, job_id)
+        return resumed
+    finally:
+        db.close()
+
+def get_job(db: Session, job_id: int):
+    return db.get(models.ImportJob, job_id)
+
+def list_jobs(db: Session, status: str = None, limit: int = 50):
+    query = db.query(models.ImportJob)
+    if status:
+        query = query.filter(models.ImportJob.status == status)
+    return query.order_by(models.ImportJob.id.desc()).limit(limit).all()
@@ -1,13 +1,24 @@
 import io
-from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, Query
+import hashlib
+from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, Query, Request, Response
 from fastapi.responses import FileResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from starlette.middleware.gzip import DEFAULT_EXCLUDED_CONTENT_TYPES
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 import os
+from contextlib import asynccontextmanager
 import models
+import schemas
 import services
-from database import engine, get_db
+import crud
+import jobs
+import parse_cache
+import result_cache
+from concurrency import run_compute, run_write
+from database import engine, get_db, get_read_db, SessionLocal, ReadSessionLocal
 import secrets
 
 # 认证配置
@@ -32,18 +43,59 @@ def get_current_username(credentials: HTTPBasicCredentials = Depends(security)):
         )
     return credentials.username
 
-# Create the database tables
-models.Base.metadata.create_all(bind=engine)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Create the database tables
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        services.ensure_indexes(db)
+        services.ensure_snapshot_aggregates(db)
+        services.ensure_dataset_version(db)
+    finally:
+        db.close()
+    # Resume import jobs interrupted by the previous shutdown
+    jobs.recover_orphaned_jobs()
+    yield
 
-app = FastAPI(title="Normalized Business Data Import API (Demo)")
+app = FastAPI(title="Normalized Business Data Import API (Demo)", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"], # Allow all for demo
     allow_methods=["GET", "POST", "DELETE"],
-    allow_headers=["Content-Type"],
+    allow_headers=["Content-Type", "If-None-Match"],
+    expose_headers=["ETag"],
+)
+
+# JSON and CSV responses above GZIP_MINIMUM_SIZE bytes are compressed;
+# xlsx and parquet exports already are
+GZIP_MINIMUM_SIZE = int(os.getenv("GZIP_MINIMUM_SIZE", "1024"))
+app.add_middleware(
+    GZipMiddleware,
+    minimum_size=GZIP_MINIMUM_SIZE,
+    compresslevel=6,
+    exclude_content_types=(*DEFAULT_EXCLUDED_CONTENT_TYPES, services.EXPORT_MEDIA_TYPES['xlsx'], services.EXPORT_MEDIA_TYPES['parquet']),
 )
 
+def report_etag(version, name: str, params: tuple):
+    # Reports only change with the dataset, so the dataset version and the
+    # request parameters identify a response. Weak, as gzip changes the bytes.
+    # Handlers read the version once, before the report, and key the result
+    # cache on it too, so a write racing with the request can only make the
+    # tag older than the data, never newer.
+    digest = hashlib.sha1(repr((name, params)).encode()).hexdigest()[:16]
+    return f'W/"{version or 0}-{digest}"'
+
+def not_modified(request: Request, response: Response, etag: str):
+    # Sets the validators on response and returns a 304 if the client's copy is current
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "private, no-cache"
+    tags = [tag.strip().removeprefix("W/") for tag in request.headers.get("if-none-match", "").split(",")]
+    if "*" in tags or etag.removeprefix("W/") in tags:
+        return Response(status_code=304, headers=dict(response.headers))
+    return None
+
 @app.get("/")
 async def read_index():
     return FileResponse('index.html')
@@ -58,18 +110,35 @@ async def import_data(
     schema_type: str = Query(..., description="Type of schema"),
     snapshot_year: int = Query(None, description="Snapshot year"),
     snapshot_month: int = Query(None, description="Snapshot month"),
+    incremental: bool = Query(False, description="Apply only the differences to the stored snapshot"),
     db: Session = Depends(get_db),
     username: str = Depends(get_current_username)
 ):
     if not file.filename.endswith(('.xlsx', '.xls')):
         raise HTTPException(status_code=400, detail="Invalid file format.")
     contents = await file.read()
-    try:
-        count = services.process_excel_import(db, contents, schema_type, snapshot_year, snapshot_month)
-        return {"detail": f"Successfully imported {count} records."}
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(status_code=500, detail=str(e))
+    job = await run_in_threadpool(jobs.submit_import, db, file.filename, contents, schema_type, snapshot_year, snapshot_month, incremental)
+    return {"detail": f"Import job {job.id} queued.", "job_id": job.id}
+
+@app.get("/jobs", response_model=list[schemas.ImportJob])
+def list_import_jobs(
+    status: str = Query(None, description="Filter by status: queued, running, done or failed"),
+    limit: int = Query(50, description="Max jobs"),
+    db: Session = Depends(get_read_db),
+    username: str = Depends(get_current_username)
+):
+    return jobs.list_jobs(db, status, limit)
+
+@app.get("/jobs/{job_id}", response_model=schemas.ImportJob)
+def get_import_job(
+    job_id: int,
+    db: Session = Depends(get_read_db),
+    username: str = Depends(get_current_username)
+):
+    job = jobs.get_job(db, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return job
 
 @app.post("/bulk_import/")
 async def bulk_import_data(
@@ -77,34 +146,42 @@ async def bulk_import_data(
     schema_type: str = Query(..., description="Type of schema"),
     snapshot_years: list[str] = File(..., description="Snapshot years"),
     snapshot_months: list[str] = File(..., description="Snapshot months"),
+    incremental: bool = Query(False, description="Apply only the differences to the stored snapshots"),
     db: Session = Depends(get_db),
     username: str = Depends(get_current_username)
 ):
-    total_count = 0
-    for i in range(len(files)):
-        file = files[i]
-        snapshot_year = int(snapshot_years[i])
-        snapshot_month = int(snapshot_months[i])
-        contents = await file.read()
-        try:
-            count = services.process_excel_import(db, contents, schema_type, snapshot_year, snapshot_month)
-            total_count += count
-        except Exception as e:
-            db.rollback()
-            raise HTTPException(status_code=500, detail=f"Error in {file.filename}: {str(e)}")
-    return {"detail": f"Successfully imported total of {total_count} records."}
+    files_to_import = []
+    for file, snapshot_year, snapshot_month in zip(files, snapshot_years, snapshot_months):
+        files_to_import.append((file.filename, await file.read(), int(snapshot_year), int(snapshot_month)))
+
+    results = await run_write(services.bulk_import, db, files_to_import, schema_type, incremental)
+
+    total_count = sum(r['rows'] for r in results)
+    detail = f"Successfully imported total of {total_count} records."
+    failed = [r['filename'] for r in results if r['error']]
+    if failed:
+        detail += f" Failed files: {', '.join(failed)}"
+    return {"detail": detail, "results": results}
+
+@app.get("/parse_cache/stats")
+async def get_parse_cache_stats(username: str = Depends(get_current_username)):
+    return parse_cache.stats()
+
+@app.get("/result_cache/stats")
+async def get_result_cache_stats(username: str = Depends(get_current_username)):
+    return result_cache.stats()
 
 @app.post("/sync/")
 async def sync_data(db: Session = Depends(get_db), username: str = Depends(get_current_username)):
     try:
-        count = services.sync_all_business_data(db)
-        return {"detail": f"Successfully synchronized {count} companies."}
+        count = await run_write(services.sync_all_business_data, db)
+        return {"detail": f"Successfully synchronized {count} changed companies."}
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.delete("/delete/")
-async def delete_data(
+def delete_data(
     snapshot_year: int = Query(..., description="Snapshot year"),
     snapshot_month: int = Query(..., description="Snapshot month"),
     db: Session = Depends(get_db),
@@ -119,45 +196,150 @@ async def delete_data(
 
 @app.get("/statistics/")
 async def get_statistics(
+    request: Request,
+    response: Response,
     snapshot_year: int = Query(..., description="Snapshot year"),
     snapshot_month: int = Query(..., description="Snapshot month"),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     username: str = Depends(get_current_username)
 ):
+    version = await run_in_threadpool(crud.get_dataset_version, db)
+    if cached := not_modified(request, response, report_etag(version, "statistics", (snapshot_year, snapshot_month))):
+        return cached
     try:
-        return services.get_statistics(db, snapshot_year, snapshot_month)
+        return await run_compute(services.cached_statistics, db, snapshot_year, snapshot_month, version)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/data_status/")
-async def get_data_status(
-    snapshot_year: int = Query(..., description="Snapshot year"),
-    snapshot_month: int = Query(..., description="Snapshot month"),
-    limit: int = Query(None, description="Max records"),
-    db: Session = Depends(get_db),
+MAX_STATISTICS_PERIODS = 120
+
+def parse_period(value: str):
+    year, month = (int(part) for part in value.split('-'))
+    if not 1 <= month <= 12:
+        raise ValueError(value)
+    return year, month
+
+@app.get("/statistics/batch/")
+async def get_statistics_batch(
+    periods: list[str] = Query(None, description="Periods as YYYY-MM"),
+    start: str = Query(None, description="First period of a range, YYYY-MM"),
+    end: str = Query(None, description="Last period of a range, YYYY-MM"),
+    db: Session = Depends(get_read_db),
     username: str = Depends(get_current_username)
 ):
     try:
-        return services.get_data_status(db, snapshot_year, snapshot_month, limit)
+        requested = [parse_period(p) for p in periods or []]
+        if start and end:
+            requested += services.period_range(parse_period(start), parse_period(end))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Periods must be given as YYYY-MM.")
+    if not requested or len(requested) > MAX_STATISTICS_PERIODS:
+        raise HTTPException(status_code=400, detail=f"Request between 1 and {MAX_STATISTICS_PERIODS} periods.")
+    try:
+        version = await run_in_threadpool(crud.get_dataset_version, db)
+        results = await run_compute(services.cached_statistics_batch, db, requested, version)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    return {f"{year}-{month:02d}": result for (year, month), result in results.items()}
 
-@app.get("/export_data_status/")
-async def export_data_status(
+def available_dates(db: Session, version):
+    return result_cache.get_or_compute("available_dates", (), version, lambda: services.get_available_dates(db))
+
+@app.get("/api/available-dates")
+def get_available_dates(db: Session = Depends(get_read_db), username: str = Depends(get_current_username)):
+    months = available_dates(db, crud.get_dataset_version(db))
+    return {"years": sorted({m["year"] for m in months}), "months": months}
+
+@app.get("/api/compare")
+async def compare_snapshots(
+    year_month1: str = Query(..., description="First period, YYYY-MM"),
+    year_month2: str = Query(..., description="Second period, YYYY-MM"),
+    limit: int = Query(1000, ge=1, le=10000, description="Companies per list"),
+    offset: int = Query(0, ge=0, description="Offset into the company lists"),
+    db: Session = Depends(get_read_db),
+    username: str = Depends(get_current_username)
+):
+    try:
+        period1, period2 = parse_period(year_month1), parse_period(year_month2)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Periods must be given as YYYY-MM.")
+    version = await run_in_threadpool(crud.get_dataset_version, db)
+    available = {(d["year"], d["month"]) for d in await run_in_threadpool(available_dates, db, version)}
+    missing = [ym for ym, period in ((year_month1, period1), (year_month2, period2)) if period not in available]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"No data for {', '.join(missing)}.")
+    try:
+        return await run_compute(
+            result_cache.get_or_compute, "compare", (period1, period2, limit, offset), version,
+            lambda: services.compare_snapshots(db, period1, period2, limit, offset)
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+MAX_DATA_STATUS_PAGE_SIZE = 5000
+
+@app.get("/data_status/")
+def get_data_status(
+    request: Request,
+    response: Response,
     snapshot_year: int = Query(..., description="Snapshot year"),
     snapshot_month: int = Query(..., description="Snapshot month"),
-    db: Session = Depends(get_db),
+    after_id: int = Query(None, description="Last id of the previous page"),
+    limit: int = Query(None, ge=1, le=MAX_DATA_STATUS_PAGE_SIZE, description="Records per page"),
+    bank: str = Query(None, description="Cooperative bank"),
+    business_type: str = Query(None, description="Business type"),
+    loan_status: str = Query(None, description="Loan status"),
+    company_name: str = Query(None, description="Part of the company name"),
+    columns: str = Query(None, description="Comma-separated columns to return"),
+    db: Session = Depends(get_read_db),
     username: str = Depends(get_current_username)
 ):
+    filters = {"bank": bank, "business_type": business_type, "loan_status": loan_status, "company_name": company_name}
+    etag = report_etag(crud.get_dataset_version(db), "data_status", (snapshot_year, snapshot_month, after_id, limit, tuple(filters.items()), columns))
+    if cached := not_modified(request, response, etag):
+        return cached
     try:
-        buffer = services.export_data_status_to_excel(db, snapshot_year, snapshot_month)
-        return StreamingResponse(
-            buffer,
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            headers={"Content-Disposition": f"attachment; filename=data_status_{snapshot_year}_{snapshot_month}.xlsx"}
+        items = services.get_data_status(
+            db, snapshot_year, snapshot_month, limit, after_id, filters,
+            [c.strip() for c in columns.split(",") if c.strip()] if columns else None
         )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    # Without limit or after_id the whole snapshot is returned as a plain
+    # list, as before pagination was added
+    if limit is None and after_id is None:
+        return items
+    return {"items": items, "next_after_id": items[-1]["id"] if items and len(items) == limit else None}
+
+def stream_export(year: int, month: int, fmt: str):
+    # The response body is produced after the request's session is closed,
+    # so the export reads through its own session
+    db = ReadSessionLocal()
+    try:
+        yield from services.export_data_status(db, year, month, fmt)
+    finally:
+        db.close()
+
+@app.get("/export_data_status/")
+def export_data_status(
+    snapshot_year: int = Query(..., description="Snapshot year"),
+    snapshot_month: int = Query(..., description="Snapshot month"),
+    format: str = Query("xlsx", pattern="^(xlsx|csv|parquet)$", description="xlsx, csv or parquet"),
+    db: Session = Depends(get_read_db),
+    username: str = Depends(get_current_username)
+):
+    """csv and parquet are streamed as rows are read. xlsx is assembled in
+    full first, since its zip container is written only once the sheet is
+    complete, and then sent in chunks."""
+    if not services.get_data_status(db, snapshot_year, snapshot_month, limit=1, columns=["id"]):
+        raise HTTPException(status_code=404, detail="No data found")
+    return StreamingResponse(
+        stream_export(snapshot_year, snapshot_month, format),
+        media_type=services.EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f"attachment; filename=data_status_{snapshot_year}_{snapshot_month}.{format}"}
+    )
 
 if __name__ == "__main__":
     import uvicorn
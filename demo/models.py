@@ -1,5 +1,5 @@
 import datetime
-from sqlalchemy import Column, Integer, String, Numeric, Date, Boolean, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Numeric, Date, Boolean, DateTime, ForeignKey, JSON, Text, LargeBinary, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from database import Base
 
@@ -27,10 +27,20 @@ class Company(Base):
     business_records = relationship("BusinessData", back_populates="company")
 
 class BusinessData(Base):
+    # Every report reads one or two snapshots: ix_business_data_snapshot serves
+    # the per-type aggregates and snapshot deletes, ix_business_data_snapshot_id
+    # the keyset-paginated data status pages, and the covering
+    # ix_business_data_snapshot_company the per-company loan totals of
+    # compare_snapshots without touching the table.
     __tablename__ = "business_data"
+    __table_args__ = (
+        Index("ix_business_data_snapshot", "snapshot_year", "snapshot_month", "business_type", "business_year"),
+        Index("ix_business_data_snapshot_id", "snapshot_year", "snapshot_month", "id"),
+        Index("ix_business_data_snapshot_company", "snapshot_year", "snapshot_month", "company_id", "loan_status", "loan_amount"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    company_id = Column(Integer, ForeignKey("companies.id"), nullable=False)
+    company_id = Column(Integer, ForeignKey("companies.id"), nullable=False, index=True)
     loan_amount = Column(Numeric(18, 6), nullable=True)
     guarantee_amount = Column(Numeric(18, 6), nullable=True)
     loan_start_date = Column(Date, nullable=True)
@@ -55,7 +65,7 @@ class QCCIndustry(Base):
     __tablename__ = "qcc_industry"
 
     id = Column(Integer, primary_key=True, index=True)
-    company_name = Column(String(255), nullable=False, index=True)
+    company_name = Column(String(255), nullable=False, unique=True, index=True)
     enterprise_scale = Column(String(50), nullable=True)
     enterprise_type = Column(String(100), nullable=True)
     national_standard_industry_category_main = Column(String(100), nullable=True)
@@ -67,7 +77,7 @@ class QCCTech(Base):
     __tablename__ = "qcc_tech"
 
     id = Column(Integer, primary_key=True, index=True)
-    company_name = Column(String(255), nullable=False, index=True)
+    company_name = Column(String(255), nullable=False, unique=True, index=True)
     is_little_giant_enterprise = Column(Boolean, nullable=True)
     is_srun_sme = Column(Boolean, nullable=True)
     is_high_tech_enterprise = Column(Boolean, nullable=True)
@@ -78,5 +88,57 @@ class QYJHList(Base):
     __tablename__ = "qyjh_list"
 
     id = Column(Integer, primary_key=True, index=True)
-    company_name = Column(String(255), nullable=False, index=True)
+    company_name = Column(String(255), nullable=False, unique=True, index=True)
     qyjh_category = Column(String(100), nullable=True)
+
+class ImportJob(Base):
+    __tablename__ = "import_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    filename = Column(String(255), nullable=False)
+    schema_type = Column(String(50), nullable=False)
+    snapshot_year = Column(Integer, nullable=False)
+    snapshot_month = Column(Integer, nullable=False)
+    incremental = Column(Boolean, nullable=False, default=False)
+    file_path = Column(String(500), nullable=True)
+    status = Column(String(20), nullable=False, default="queued", index=True)
+    rows_processed = Column(Integer, nullable=False, default=0)
+    stage_timings = Column(JSON, nullable=True)
+    change_counts = Column(JSON, nullable=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow, nullable=True)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+class SnapshotAggregate(Base):
+    # Pre-aggregated business_data per snapshot, maintained on every write.
+    # Rows marked 未放款 are excluded; companies are kept as bitmaps indexed by
+    # company id (see services.company_bitmap) so distinct and merged counts
+    # are bitset unions.
+    __tablename__ = "snapshot_aggregates"
+    __table_args__ = (
+        UniqueConstraint("snapshot_year", "snapshot_month", "business_type", "business_year", name="uq_snapshot_aggregate"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    snapshot_year = Column(Integer, nullable=False)
+    snapshot_month = Column(Integer, nullable=False)
+    business_type = Column(String(100), nullable=True)
+    business_year = Column(Integer, nullable=True)
+    row_count = Column(Integer, nullable=False, default=0)
+    loan_amount = Column(Numeric(18, 6), nullable=False, default=0)
+    guarantee_amount = Column(Numeric(18, 6), nullable=False, default=0)
+    loan_balance = Column(Numeric(18, 6), nullable=False, default=0)
+    guarantee_balance = Column(Numeric(18, 6), nullable=False, default=0)
+    guaranteed_companies = Column(LargeBinary, nullable=False, default=b'')
+    in_force_companies = Column(LargeBinary, nullable=False, default=b'')
+
+class DatasetVersion(Base):
+    # A single row counting committed writes to the dataset (see
+    # crud.commit_dataset_change). epoch is random per database, so a
+    # recreated database never repeats an earlier version.
+    __tablename__ = "dataset_version"
+
+    id = Column(Integer, primary_key=True)
+    epoch = Column(String(32), nullable=False)
+    version = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,88 @@
+"""
+Content-addressed cache of parsed workbooks.
+
+Entries are Parquet files named after the SHA-256 of the uploaded bytes and
+the reader version, so re-uploading the same workbook skips Excel parsing.
+The directory is bounded by PARSE_CACHE_MAX_BYTES; the least recently used
+entries (by mtime, refreshed on every hit) are evicted first.
+"""
+import hashlib
+import logging
+import os
+import threading
+import uuid
+import pandas as pd
+
+PARSE_CACHE_DIR = os.getenv("PARSE_CACHE_DIR", "./parse_cache")
+PARSE_CACHE_MAX_BYTES = int(os.getenv("PARSE_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0, "errors": 0}
+
+def cache_key(contents: bytes, reader_version) -> str:
+    return f"{hashlib.sha256(contents).hexdigest()}-v{reader_version}"
+
+def _path(key):
+    return os.path.join(PARSE_CACHE_DIR, f"{key}.parquet")
+
+def get(key):
+    path = _path(key)
+    try:
+        df = pd.read_parquet(path)
+        os.utime(path)
+    except FileNotFoundError:
+        with _lock:
+            _stats["misses"] += 1
+        return None
+    except Exception:
+        logger.exception("Unreadable parse cache entry %s", path)
+        with _lock:
+            _stats["misses"] += 1
+            _stats["errors"] += 1
+        return None
+    with _lock:
+        _stats["hits"] += 1
+    return df
+
+def put(key, df):
+    os.makedirs(PARSE_CACHE_DIR, exist_ok=True)
+    tmp_path = os.path.join(PARSE_CACHE_DIR, f".{uuid.uuid4().hex}.tmp")
+    try:
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, _path(key))
+    except Exception:
+        # A frame that cannot be stored is simply parsed again next time
+        logger.exception("Could not write parse cache entry %s", key)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        with _lock:
+            _stats["errors"] += 1
+        return
+    with _lock:
+        _stats["writes"] += 1
+        _evict()
+
+def _evict():
+    entries = []
+    for name in os.listdir(PARSE_CACHE_DIR):
+        if name.endswith(".parquet"):
+            stat = os.stat(os.path.join(PARSE_CACHE_DIR, name))
+            entries.append((stat.st_mtime, stat.st_size, name))
+    total = sum(size for _, size, _ in entries)
+    for _, size, name in sorted(entries):
+        if total <= PARSE_CACHE_MAX_BYTES:
+            break
+        os.remove(os.path.join(PARSE_CACHE_DIR, name))
+        total -= size
+        _stats["evictions"] += 1
+
+def stats():
+    with _lock:
+        result = dict(_stats)
+    entries = [n for n in os.listdir(PARSE_CACHE_DIR) if n.endswith(".parquet")] if os.path.isdir(PARSE_CACHE_DIR) else []
+    result["entries"] = len(entries)
+    result["bytes"] = sum(os.path.getsize(os.path.join(PARSE_CACHE_DIR, n)) for n in entries)
+    result["max_bytes"] = PARSE_CACHE_MAX_BYTES
+    return result
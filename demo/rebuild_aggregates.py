@@ -0,0 +1,13 @@
+from database import SessionLocal, engine
+import models
+import services
+
+# Recompute snapshot_aggregates from business_data, e.g. after editing rows by hand
+models.Base.metadata.create_all(bind=engine)
+db = SessionLocal()
+try:
+    count = services.rebuild_snapshot_aggregates(db)
+finally:
+    db.close()
+
+print(f"Rebuilt statistics aggregates for {count} snapshots.")
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, ConfigDict
 from datetime import date, datetime
-from typing import Optional
+from typing import Optional, Dict
 from decimal import Decimal
 
 # Company schemas
@@ -92,3 +92,22 @@ class QCCTechCreate(QCCTechBase):
 class QCCTech(QCCTechBase):
     id: int
     model_config = ConfigDict(from_attributes=True)
+
+# ImportJob schemas
+class ImportJob(BaseModel):
+    id: int
+    filename: str
+    schema_type: str
+    snapshot_year: int
+    snapshot_month: int
+    incremental: bool = False
+    status: str
+    rows_processed: int
+    stage_timings: Optional[Dict[str, float]] = None
+    change_counts: Optional[Dict[str, int]] = None
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    model_config = ConfigDict(from_attributes=True)
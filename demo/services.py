@@ -1,32 +1,49 @@
 from collections import defaultdict
 from fastapi import HTTPException
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import csv
 import io
+import logging
+import os
+import tempfile
 import datetime
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from decimal import Decimal
-from sqlalchemy import or_, func
+from openpyxl import Workbook
+from sqlalchemy import Boolean, Date, DateTime, Integer, Numeric, or_, case, func, insert, inspect, select, delete, tuple_
 from sqlalchemy.orm import Session
 import crud
 import models
+import parse_cache
+import result_cache
+
+logger = logging.getLogger(__name__)
 
 def read_sheet_data(excel_source, sheet_name, header, columns, business_type, bank_name=None):
-    try:
-        if isinstance(excel_source, pd.ExcelFile):
-            sheet_names = excel_source.sheet_names
-        else:
-            xl = pd.ExcelFile(excel_source)
-            sheet_names = xl.sheet_names
-            excel_source = xl
-
-        actual_sheet_name = None
-        for s in sheet_names:
-            if s.strip() == sheet_name:
-                actual_sheet_name = s
-                break
-        
-        if not actual_sheet_name:
-            return pd.DataFrame(columns=columns)
+    # A missing sheet yields an empty frame; a sheet that cannot be parsed
+    # raises a ValueError naming it
+    if isinstance(excel_source, pd.ExcelFile):
+        sheet_names = excel_source.sheet_names
+    else:
+        excel_source = pd.ExcelFile(excel_source)
+        sheet_names = excel_source.sheet_names
+
+    actual_sheet_name = None
+    for s in sheet_names:
+        if s.strip() == sheet_name:
+            actual_sheet_name = s
+            break
 
+    if not actual_sheet_name:
+        return pd.DataFrame(columns=columns)
+
+    try:
         raw_data = pd.read_excel(excel_source, sheet_name=actual_sheet_name, header=header)
         existing_cols = [col for col in columns if col in raw_data.columns]
         raw_data = raw_data[existing_cols]
@@ -40,8 +57,8 @@ def read_sheet_data(excel_source, sheet_name, header, columns, business_type, ba
             raw_data["合作银行"] = bank_name
         
         return raw_data
-    except Exception:
-        return pd.DataFrame(columns=columns)
+    except Exception as e:
+        raise ValueError(f"Sheet {sheet_name}: {e}") from e
 
 def get_or_create_company(db: Session, company_name: str) -> models.Company:
     company = db.query(models.Company).filter_by(company_name=company_name).first()
@@ -51,109 +68,259 @@ def get_or_create_company(db: Session, company_name: str) -> models.Company:
         db.flush()
     return company
 
+def _clean(val):
+    return None if pd.isna(val) else val
+
+def company_attributes(row):
+    # Company attributes as produced by merge_qcc_data for one workbook row
+    qyjh_category = _clean(row.get('千亿计划'))
+    return {
+        'enterprise_size': _clean(row.get('企业规模')),
+        'enterprise_institution_type': _clean(row.get('企业（机构）类型')),
+        'national_standard_industry_category_main': _clean(row.get('国标行业门类')),
+        'national_standard_industry_category_major': _clean(row.get('国标行业大类')),
+        'qichacha_industry_category_main': _clean(row.get('企查查行业门类')),
+        'qichacha_industry_category_major': _clean(row.get('企查查行业大类')),
+        'is_little_giant_enterprise': row.get('专精特新“小巨人”企业') == '是',
+        'is_srun_sme': row.get('专精特新中小企业') == '是',
+        'is_high_tech_enterprise': row.get('高新技术企业') == '是',
+        'is_innovative_sme': row.get('创新型中小企业') == '是',
+        'is_tech_based_sme': row.get('科技型中小企业') == '是',
+        'is_technology_enterprise': row.get('科技企业') == '是',
+        'qyjh_category': qyjh_category if qyjh_category != '否' else None,
+    }
+
+def resolve_companies(db: Session, df) -> dict:
+    # Set-based replacement for calling get_or_create_company per row:
+    # one SELECT for the name -> id map, one bulk INSERT for the missing
+    # names and one bulk UPDATE applying each company's attributes once.
+    if df.empty:
+        return {}
+
+    # The last row of a company wins, as with the previous per-row updates
+    latest = df.drop_duplicates(subset='企业名称', keep='last')
+    names = latest['企业名称'].tolist()
+
+    name_to_id = dict(db.query(models.Company.company_name, models.Company.id).all())
+    missing = [{'company_name': n} for n in names if n not in name_to_id]
+    if missing:
+        inserted = db.execute(
+            insert(models.Company).returning(models.Company.company_name, models.Company.id),
+            missing
+        )
+        name_to_id.update({name: company_id for name, company_id in inserted})
+
+    updates = [
+        {'id': name_to_id[row['企业名称']], **company_attributes(row)}
+        for row in latest.to_dict('records')
+    ]
+    db.bulk_update_mappings(models.Company, updates)
+    return name_to_id
+
+QCC_INDUSTRY_COLUMNS = {
+    'enterprise_scale': '企业规模',
+    'enterprise_type': '企业（机构）类型',
+    'national_standard_industry_category_main': '国标行业门类',
+    'national_standard_industry_category_major': '国标行业大类',
+    'qcc_industry_category_main': '企查查行业门类',
+    'qcc_industry_category_major': '企查查行业大类',
+}
+
+QCC_TECH_COLUMNS = {
+    'is_little_giant_enterprise': '专精特新“小巨人”企业',
+    'is_srun_sme': '专精特新中小企业',
+    'is_high_tech_enterprise': '高新技术企业',
+    'is_innovative_sme': '创新型中小企业',
+    'is_tech_based_sme': '科技型中小企业',
+}
+
+def _staging_frame(db: Session, model, companies, columns, keep='last'):
+    # Master-data rows for the given companies, indexed by company name.
+    # keep selects which row of a duplicated name wins.
+    rows = db.query(model.company_name, *[getattr(model, c) for c in columns]) \
+        .filter(model.company_name.in_(companies)).order_by(model.id).all()
+    frame = pd.DataFrame(rows, columns=['company_name', *columns])
+    return frame.drop_duplicates(subset='company_name', keep=keep).set_index('company_name')
+
 def merge_qcc_data(df, db: Session):
     # This logic now prepares attributes for the Company table
     companies = df['企业名称'].unique().tolist()
     if not companies:
         return df
 
-    industries = {i.company_name: i for i in db.query(models.QCCIndustry).filter(models.QCCIndustry.company_name.in_(companies)).all()}
-    techs = {t.company_name: t for t in db.query(models.QCCTech).filter(models.QCCTech.company_name.in_(companies)).all()}
-    qyjh = {e.company_name: e for e in db.query(models.QYJHList).filter(models.QYJHList.company_name.in_(companies)).all()}
+    df = df.copy()
+    names = df['企业名称']
 
-    def apply_qcc(row):
-        name = row['企业名称']
-        ind = industries.get(name)
-        tech = techs.get(name)
-        qyjh_item = qyjh.get(name)
-        
-        if ind:
-            row['企业规模'] = ind.enterprise_scale
-            row['企业（机构）类型'] = ind.enterprise_type
-            row['国标行业门类'] = ind.national_standard_industry_category_main
-            row['国标行业大类'] = ind.national_standard_industry_category_major
-            row['企查查行业门类'] = ind.qcc_industry_category_main
-            row['企查查行业大类'] = ind.qcc_industry_category_major
-
-        if tech:
-            row['专精特新“小巨人”企业'] = '是' if tech.is_little_giant_enterprise else '否'
-            row['专精特新中小企业'] = '是' if tech.is_srun_sme else '否'
-            row['高新技术企业'] = '是' if tech.is_high_tech_enterprise else '否'
-            row['创新型中小企业'] = '是' if tech.is_innovative_sme else '否'
-            row['科技型中小企业'] = '是' if tech.is_tech_based_sme else '否'
-
-        row['千亿计划'] = qyjh_item.qyjh_category if qyjh_item else None
-        is_tech = any(row.get(c) == '是' for c in ['专精特新“小巨人”企业', '专精特新中小企业', '高新技术企业', '创新型中小企业', '科技型中小企业']) or pd.notna(row['千亿计划'])
-        row['科技企业'] = '是' if is_tech else '否'
-        
-        return row
+    def left_join(frame):
+        # Align the master-data frame to the rows of df (a left join on the name)
+        joined = frame.reindex(names)
+        joined.index = df.index
+        return joined, names.isin(frame.index)
 
-    return df.apply(apply_qcc, axis=1)
+    industries, has_industry = left_join(_staging_frame(db, models.QCCIndustry, companies, list(QCC_INDUSTRY_COLUMNS)))
+    for src, dst in QCC_INDUSTRY_COLUMNS.items():
+        df[dst] = industries[src].where(has_industry, df[dst] if dst in df.columns else None)
 
-def sync_all_business_data(db: Session):
-    # Synchronize all Company records with latest master data
-    companies = db.query(models.Company).all()
-    if not companies:
-        return 0
+    techs, has_tech = left_join(_staging_frame(db, models.QCCTech, companies, list(QCC_TECH_COLUMNS)))
+    for src, dst in QCC_TECH_COLUMNS.items():
+        flags = pd.Series(np.where(techs[src].fillna(False).astype(bool), '是', '否'), index=df.index)
+        df[dst] = flags.where(has_tech, df[dst] if dst in df.columns else None)
+
+    qyjh, _ = left_join(_staging_frame(db, models.QYJHList, companies, ['qyjh_category']))
+    df['千亿计划'] = qyjh['qyjh_category']
+
+    is_tech = (df[list(QCC_TECH_COLUMNS.values())] == '是').any(axis=1) | df['千亿计划'].notna()
+    df['科技企业'] = np.where(is_tech, '是', '否')
+    return df
+
+SYNC_CHUNK_SIZE = 1000
+
+# QCCIndustry column -> Company column
+COMPANY_INDUSTRY_FIELDS = {
+    'enterprise_scale': 'enterprise_size',
+    'enterprise_type': 'enterprise_institution_type',
+    'national_standard_industry_category_main': 'national_standard_industry_category_main',
+    'national_standard_industry_category_major': 'national_standard_industry_category_major',
+    'qcc_industry_category_main': 'qichacha_industry_category_main',
+    'qcc_industry_category_major': 'qichacha_industry_category_major',
+}
+
+COMPANY_SYNC_FIELDS = [*COMPANY_INDUSTRY_FIELDS.values(), *QCC_TECH_COLUMNS, 'qyjh_category', 'is_technology_enterprise']
+
+def _sync_company_chunk(db: Session, companies):
+    # Returns bulk-update mappings for the companies in this chunk whose
+    # attributes differ from the master data
+    names = companies['company_name'].tolist()
+    synced = companies.copy()
+
+    # Master data lookups used .first(), so the first staging row of a name wins
+    industries = _staging_frame(db, models.QCCIndustry, names, list(COMPANY_INDUSTRY_FIELDS), keep='first')
+    has_industry = synced['company_name'].isin(industries.index)
+    industries = industries.reindex(synced['company_name']).set_axis(synced.index)
+    for src, dst in COMPANY_INDUSTRY_FIELDS.items():
+        synced[dst] = industries[src].where(has_industry, synced[dst])
+
+    techs = _staging_frame(db, models.QCCTech, names, list(QCC_TECH_COLUMNS), keep='first')
+    has_tech = synced['company_name'].isin(techs.index)
+    techs = techs.reindex(synced['company_name']).set_axis(synced.index)
+    for col in QCC_TECH_COLUMNS:
+        synced[col] = techs[col].where(has_tech, synced[col])
+
+    qyjh = _staging_frame(db, models.QYJHList, names, ['qyjh_category'], keep='first')
+    synced['qyjh_category'] = qyjh['qyjh_category'].reindex(synced['company_name']).set_axis(synced.index)
 
+    synced['is_technology_enterprise'] = (
+        synced[list(QCC_TECH_COLUMNS)].fillna(False).astype(bool).any(axis=1) | synced['qyjh_category'].notna()
+    )
+
+    before, after = companies[COMPANY_SYNC_FIELDS], synced[COMPANY_SYNC_FIELDS]
+    unchanged = ((before == after) | (before.isna() & after.isna())).all(axis=1)
+    changed = synced.loc[~unchanged, COMPANY_SYNC_FIELDS].astype(object)
+    changed = changed.where(changed.notna(), None)
+    return [{'id': company_id, **attrs} for company_id, attrs in changed.to_dict('index').items()]
+
+def sync_all_business_data(db: Session):
+    # Synchronize all Company records with latest master data. Companies are
+    # processed in id-ordered chunks so memory stays bounded by SYNC_CHUNK_SIZE;
+    # only companies whose attributes actually changed are written and counted.
+    columns = [models.Company.id, models.Company.company_name, *[getattr(models.Company, c) for c in COMPANY_SYNC_FIELDS]]
     count = 0
-    for company in companies:
-        # Industry
-        ind = db.query(models.QCCIndustry).filter_by(company_name=company.company_name).first()
-        if ind:
-            company.enterprise_size = ind.enterprise_scale
-            company.enterprise_institution_type = ind.enterprise_type
-            company.national_standard_industry_category_main = ind.national_standard_industry_category_main
-            company.national_standard_industry_category_major = ind.national_standard_industry_category_major
-            company.qichacha_industry_category_main = ind.qcc_industry_category_main
-            company.qichacha_industry_category_major = ind.qcc_industry_category_major
-        
-        # Tech
-        tech = db.query(models.QCCTech).filter_by(company_name=company.company_name).first()
-        if tech:
-            company.is_little_giant_enterprise = tech.is_little_giant_enterprise
-            company.is_srun_sme = tech.is_srun_sme
-            company.is_high_tech_enterprise = tech.is_high_tech_enterprise
-            company.is_innovative_sme = tech.is_innovative_sme
-            company.is_tech_based_sme = tech.is_tech_based_sme
-        
-        # QYJH
-        qyjh_item = db.query(models.QYJHList).filter_by(company_name=company.company_name).first()
-        company.qyjh_category = qyjh_item.qyjh_category if qyjh_item else None
-        
-        # Derived Technology Flag
-        company.is_technology_enterprise = any([
-            company.is_little_giant_enterprise, company.is_srun_sme,
-            company.is_high_tech_enterprise, company.is_innovative_sme,
-            company.is_tech_based_sme, pd.notna(company.qyjh_category)
-        ])
-        count += 1
-    
-    db.commit()
+    last_id = 0
+    while True:
+        rows = db.query(*columns).filter(models.Company.id > last_id) \
+            .order_by(models.Company.id).limit(SYNC_CHUNK_SIZE).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+
+        companies = pd.DataFrame(rows, columns=[c.key for c in columns], dtype=object).set_index('id')
+        updates = _sync_company_chunk(db, companies)
+        if updates:
+            db.bulk_update_mappings(models.Company, updates)
+            count += len(updates)
+
+    if count:
+        crud.commit_dataset_change(db)
+    else:
+        db.commit()
     return count
 
-def read_data(file, db: Session):
-    xl = pd.ExcelFile(file)
-    
-    data_1 = read_sheet_data(xl, "线下业务", 1,
-                             ["企业名称", "借款金额（万元）", "担保金额（万元）", "借款起始日", "借款到期日", "借款利率",
-                              "担保费率", "借款余额（万元）", "担保余额（万元）", "借据状态", "结清日期", "企业划型",
-                              "合作银行", "业务年度"], "常规业务")
-    
-    data_2 = read_sheet_data(xl, "微众批量业务", 1,
-                             ["企业名称", "借款金额（万元）", "借款起始日", "借款到期日", "借款利率", "担保费率",
-                              "借款余额（万元）", "担保余额（万元）", "借据状态", "结清日期", "企业划型"], "微众批量业务",
-                             "微众银行")
-    
-    data_3 = read_sheet_data(xl, "建行批量业务", 1,
-                             ["企业名称", "借款金额（万元）", "担保金额（万元）", "借款起始日", "借款到期日", "借款利率",
-                              "担保费率", "借款余额（万元）", "担保余额（万元）", "借据状态", "结清日期", "企业划型",
-                              "业务年度"], "建行批量业务", "建设银行")
-    
-    data_4 = read_sheet_data(xl, "工行批量业务", 1,
-                             ["企业名称", "借款金额（万元）", "担保金额（万元）", "借款起始日", "借款到期日", "借款利率",
-                              "担保费率", "借款余额（万元）", "担保余额（万元）", "借据状态", "结清日期", "企业划型",
-                              "业务年度"], "工行批量业务", "工商银行")
+# (sheet name, header row, columns, business type, bank name) in result order
+SHEET_SPECS = [
+    ("线下业务", 1,
+     ["企业名称", "借款金额（万元）", "担保金额（万元）", "借款起始日", "借款到期日", "借款利率",
+      "担保费率", "借款余额（万元）", "担保余额（万元）", "借据状态", "结清日期", "企业划型",
+      "合作银行", "业务年度"], "常规业务", None),
+    ("微众批量业务", 1,
+     ["企业名称", "借款金额（万元）", "借款起始日", "借款到期日", "借款利率", "担保费率",
+      "借款余额（万元）", "担保余额（万元）", "借据状态", "结清日期", "企业划型"], "微众批量业务",
+     "微众银行"),
+    ("建行批量业务", 1,
+     ["企业名称", "借款金额（万元）", "担保金额（万元）", "借款起始日", "借款到期日", "借款利率",
+      "担保费率", "借款余额（万元）", "担保余额（万元）", "借据状态", "结清日期", "企业划型",
+      "业务年度"], "建行批量业务", "建设银行"),
+    ("工行批量业务", 1,
+     ["企业名称", "借款金额（万元）", "担保金额（万元）", "借款起始日", "借款到期日", "借款利率",
+      "担保费率", "借款余额（万元）", "担保余额（万元）", "借据状态", "结清日期", "企业划型",
+      "业务年度"], "工行批量业务", "工商银行"),
+]
+
+# Workbooks smaller than this are parsed serially; process start-up would
+# cost more than it saves
+PARALLEL_PARSE_MIN_BYTES = 2 * 1024 * 1024
+
+_worker_contents = None
+
+def _init_parse_worker(contents):
+    # Each worker receives the workbook bytes once, not once per sheet
+    global _worker_contents
+    _worker_contents = contents
+
+def _read_sheet(excel_source, spec):
+    # (frame, error): an unreadable sheet is imported as empty and its
+    # error returned, so the caller can report it even from a worker process
+    try:
+        return read_sheet_data(excel_source, *spec), None
+    except ValueError as e:
+        return pd.DataFrame(columns=spec[2]), str(e)
+
+def _parse_sheet_in_worker(spec):
+    return _read_sheet(io.BytesIO(_worker_contents), spec)
+
+def read_sheets(contents: bytes, parallel=None):
+    # Parse the business sheets, returned in SHEET_SPECS order. parallel=None
+    # parses in a process pool only for large .xlsx files: legacy .xls files
+    # are decoded as a whole by xlrd, so splitting them by sheet gains nothing.
+    if parallel is None:
+        parallel = contents[:2] == b'PK' and len(contents) >= PARALLEL_PARSE_MIN_BYTES
+
+    results = None
+    if parallel:
+        workers = min(len(SHEET_SPECS), os.cpu_count() or 1)
+        try:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_parse_worker, initargs=(contents,)) as executor:
+                # map yields results in submission order regardless of completion order
+                results = list(executor.map(_parse_sheet_in_worker, SHEET_SPECS))
+        except (OSError, NotImplementedError, BrokenProcessPool) as e:
+            # No usable multiprocessing here (e.g. a sandbox without semaphores)
+            # or a worker died
+            logger.warning("Parsing sheets serially, the process pool failed: %s", e)
+
+    if results is None:
+        xl = pd.ExcelFile(io.BytesIO(contents))
+        results = [_read_sheet(xl, spec) for spec in SHEET_SPECS]
+    for _, error in results:
+        if error:
+            logger.warning("Imported an unreadable sheet as empty: %s", error)
+    return [frame for frame, _ in results]
+
+# Bump when parse_workbook's output changes so cached parses are not reused
+PARSE_READER_VERSION = 2
+
+def parse_workbook(contents: bytes, parallel=None):
+    # Parse and clean the business sheets. Needs no database session, so it
+    # can run in a worker process.
+    data_1, data_2, data_3, data_4 = read_sheets(contents, parallel)
 
     if not data_2.empty:
         if '借款起始日' in data_2.columns:
@@ -182,193 +349,836 @@ def read_data(file, db: Session):
     for col in numeric_cols:
         if col in result_total.columns:
             result_total[col] = pd.to_numeric(result_total[col], errors='coerce').fillna(0)
+    # Sheets mixing text and Excel dates leave object columns that the parse
+    # cache cannot store as Parquet
+    for col in ["借款起始日", "借款到期日", "结清日期"]:
+        if col in result_total.columns:
+            result_total[col] = pd.to_datetime(result_total[col], format='mixed')
+
+    return result_total
 
-    raw_data = merge_qcc_data(result_total, db)
+def load_workbook_data(contents: bytes, parallel=None):
+    # parse_workbook behind the content-addressed parse cache
+    key = parse_cache.cache_key(contents, PARSE_READER_VERSION)
+    parsed_data = parse_cache.get(key)
+    if parsed_data is None:
+        parsed_data = parse_workbook(contents, parallel)
+        parse_cache.put(key, parsed_data)
+    return parsed_data
+
+def read_data(file, db: Session, parallel=None):
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, 'rb') as f:
+            contents = f.read()
+    else:
+        contents = file if isinstance(file, bytes) else file.read()
+
+    raw_data = merge_qcc_data(load_workbook_data(contents, parallel), db)
     return raw_data
 
-def process_excel_import(db: Session, file_contents: bytes, schema_type: str, year: int = None, month: int = None):
+# Serializes snapshot writes across requests and bulk imports
+_writer_lock = threading.Lock()
+
+def write_business_data(db: Session, parsed_data, year: int, month: int, incremental: bool = False, counts: dict = None):
+    # Replace the (year, month) snapshot with the rows of a parsed workbook in
+    # one transaction: a failure rolls back to the previous snapshot. With
+    # incremental=True only the differences to the stored snapshot are written.
+    # counts (if given) receives the inserted/updated/deleted/unchanged totals.
+    with _writer_lock:
+        processed_data = merge_qcc_data(parsed_data, db)
+        name_to_id = resolve_companies(db, processed_data)
+        business_rows = build_business_rows(processed_data, name_to_id, year, month)
+
+        if incremental:
+            changes = apply_snapshot_diff(db, business_rows, year, month)
+        else:
+            deleted = crud.delete_business_data_by_snapshot(db, year, month, commit=False)
+            insert_business_rows(db, business_rows)
+            changes = {'inserted': len(business_rows), 'updated': 0, 'deleted': deleted, 'unchanged': 0}
+        refresh_snapshot_aggregates(db, year, month)
+        crud.commit_dataset_change(db)
+
+        if counts is not None:
+            counts.update(changes)
+        return len(business_rows)
+
+# Columns identifying a loan within a snapshot for incremental re-imports
+SNAPSHOT_ROW_KEY = ['company_id', 'loan_start_date', 'cooperative_bank', 'business_type', 'loan_amount']
+SNAPSHOT_VALUE_COLUMNS = [
+    'company_id', 'loan_amount', 'guarantee_amount', 'loan_start_date', 'loan_due_date', 'loan_interest_rate',
+    'guarantee_fee_rate', 'outstanding_loan_balance', 'outstanding_guarantee_balance', 'loan_status',
+    'settlement_date', 'enterprise_classification', 'cooperative_bank', 'business_year', 'business_type',
+]
+
+def _comparable(rows):
+    # String form of the value columns in which Decimals are quantized to the
+    # column scale, so freshly parsed and stored values compare equal
+    columns = models.BusinessData.__table__.columns
+    result = pd.DataFrame(index=rows.index)
+    for col in SNAPSHOT_VALUE_COLUMNS:
+        scale = getattr(columns[col].type, 'scale', None)
+        if scale is not None:
+            quantum = Decimal(1).scaleb(-scale)
+            result[col] = rows[col].map(lambda v: str(Decimal(v).quantize(quantum)) if v is not None else 'None')
+        else:
+            result[col] = rows[col].astype(object).map(str)
+    return result.astype(str)
+
+def _row_keys(comparable):
+    # Identical loans are told apart by their order of appearance
+    key = comparable[SNAPSHOT_ROW_KEY[0]]
+    for col in SNAPSHOT_ROW_KEY[1:]:
+        key = key + '|' + comparable[col]
+    return key + '|' + key.groupby(key).cumcount().astype(str)
+
+def apply_snapshot_diff(db: Session, business_rows, year: int, month: int):
+    table = models.BusinessData.__table__
+    stored = pd.DataFrame(
+        db.execute(
+            select(table.c.id, *[table.c[c] for c in SNAPSHOT_VALUE_COLUMNS])
+            .where(table.c.snapshot_year == year, table.c.snapshot_month == month)
+            .order_by(table.c.id)
+        ).all(),
+        columns=['id', *SNAPSHOT_VALUE_COLUMNS],
+        dtype=object,
+    )
+
+    new_values = _comparable(business_rows)
+    new_values['_key'] = _row_keys(new_values)
+    new_values['_pos'] = range(len(new_values))
+    old_values = _comparable(stored)
+    old_values['_key'] = _row_keys(old_values)
+    old_values['id'] = stored['id']
+
+    diff = new_values.merge(old_values, on='_key', how='outer', suffixes=('', '_old'), indicator=True)
+    to_insert = diff.loc[diff['_merge'] == 'left_only', '_pos'].astype(int)
+    to_delete = diff.loc[diff['_merge'] == 'right_only', 'id'].astype(int).tolist()
+
+    matched = diff[diff['_merge'] == 'both']
+    differs = pd.Series(False, index=matched.index)
+    for col in SNAPSHOT_VALUE_COLUMNS:
+        differs |= matched[col] != matched[f'{col}_old']
+    changed = matched[differs]
+
+    for start in range(0, len(to_delete), INSERT_BATCH_SIZE):
+        db.execute(delete(table).where(table.c.id.in_(to_delete[start:start + INSERT_BATCH_SIZE])))
+    if len(changed):
+        updates = business_rows.iloc[changed['_pos'].astype(int)][SNAPSHOT_VALUE_COLUMNS].to_dict('records')
+        for update_row, row_id in zip(updates, changed['id'].astype(int)):
+            update_row['id'] = row_id
+        db.bulk_update_mappings(models.BusinessData, updates)
+    insert_business_rows(db, business_rows.iloc[to_insert])
+
+    return {
+        'inserted': len(to_insert),
+        'updated': len(changed),
+        'deleted': len(to_delete),
+        'unchanged': len(matched) - len(changed),
+    }
+
+INSERT_BATCH_SIZE = 5000
+
+def _decimal_column(df, col):
+    # Decimal(str(x)) per value, as the stored Numeric columns expect; missing
+    # columns and empty values become Decimal('0')
+    if col not in df.columns:
+        return pd.Series([Decimal('0')] * len(df), index=df.index, dtype=object)
+    values = pd.to_numeric(df[col], errors='coerce')
+    return values.astype(str).map(Decimal).where(values.notna(), Decimal('0')).astype(object)
+
+def _date_column(df, col):
+    if col not in df.columns:
+        return pd.Series([None] * len(df), index=df.index, dtype=object)
+    dates = pd.to_datetime(df[col], format='mixed')
+    return dates.dt.date.astype(object).where(dates.notna(), None)
+
+def _text_column(df, col):
+    if col not in df.columns:
+        return pd.Series([None] * len(df), index=df.index, dtype=object)
+    values = df[col].astype(object)
+    return values.where(values.notna(), None)
+
+def build_business_rows(processed_data, name_to_id: dict, year: int, month: int):
+    # Convert a merged workbook frame into business_data rows column by column
+    rows = pd.DataFrame(index=processed_data.index)
+    rows['company_id'] = processed_data['企业名称'].map(name_to_id).astype(int)
+    rows['loan_amount'] = _decimal_column(processed_data, '借款金额（万元）')
+    rows['guarantee_amount'] = _decimal_column(processed_data, '担保金额（万元）')
+    rows['loan_start_date'] = _date_column(processed_data, '借款起始日')
+    rows['loan_due_date'] = _date_column(processed_data, '借款到期日')
+    rows['loan_interest_rate'] = _decimal_column(processed_data, '借款利率')
+    rows['guarantee_fee_rate'] = _decimal_column(processed_data, '担保费率')
+    rows['outstanding_loan_balance'] = _decimal_column(processed_data, '借款余额（万元）')
+    rows['outstanding_guarantee_balance'] = _decimal_column(processed_data, '担保余额（万元）')
+    rows['loan_status'] = _text_column(processed_data, '借据状态')
+    rows['settlement_date'] = _date_column(processed_data, '结清日期')
+    rows['enterprise_classification'] = _text_column(processed_data, '企业划型')
+    rows['cooperative_bank'] = _text_column(processed_data, '合作银行')
+    rows['snapshot_year'] = year
+    rows['snapshot_month'] = month
+
+    # 业务年度 when present and non-zero, else the loan start year, else the snapshot year
+    business_year = pd.to_numeric(processed_data.get('业务年度'), errors='coerce') \
+        if '业务年度' in processed_data.columns else pd.Series(0, index=processed_data.index)
+    start_year = pd.to_datetime(rows['loan_start_date']).dt.year
+    business_year = business_year.where(business_year.notna() & (business_year != 0), start_year)
+    rows['business_year'] = business_year.fillna(year).astype(int)
+
+    rows['business_type'] = _text_column(processed_data, '业务类型')
+    return rows.reset_index(drop=True)
+
+def insert_business_rows(db: Session, rows, batch_size: int = INSERT_BATCH_SIZE):
+    # Core executemany INSERT in fixed-size batches, no ORM bookkeeping
+    statement = insert(models.BusinessData.__table__)
+    for start in range(0, len(rows), batch_size):
+        db.execute(statement, rows.iloc[start:start + batch_size].to_dict('records'))
+
+def process_excel_import(db: Session, file_contents: bytes, schema_type: str, year: int = None, month: int = None, incremental: bool = False):
     now = datetime.datetime.now()
     if year is None: year = now.year
     if month is None: month = now.month
 
     if schema_type == 'business_data':
-        file_obj = io.BytesIO(file_contents)
-        processed_data = read_data(file_obj, db)
-        
-        crud.delete_business_data_by_snapshot(db, year, month)
-
-        data_to_insert = []
-        for _, row in processed_data.iterrows():
-            name = row['企业名称']
-            company = get_or_create_company(db, name)
-            
-            # Update company attributes from latest import
-            company.enterprise_size = row.get('企业规模')
-            company.enterprise_institution_type = row.get('企业（机构）类型')
-            company.national_standard_industry_category_main = row.get('国标行业门类')
-            company.national_standard_industry_category_major = row.get('国标行业大类')
-            company.qichacha_industry_category_main = row.get('企查查行业门类')
-            company.qichacha_industry_category_major = row.get('企查查行业大类')
-            company.is_little_giant_enterprise = row.get('专精特新“小巨人”企业') == '是'
-            company.is_srun_sme = row.get('专精特新中小企业') == '是'
-            company.is_high_tech_enterprise = row.get('高新技术企业') == '是'
-            company.is_innovative_sme = row.get('创新型中小企业') == '是'
-            company.is_tech_based_sme = row.get('科技型中小企业') == '是'
-            company.is_technology_enterprise = row.get('科技企业') == '是'
-            company.qyjh_category = row.get('千亿计划') if pd.notna(row.get('千亿计划')) and row.get('千亿计划') != '否' else None
-
-            loan_start = pd.to_datetime(row.get('借款起始日')).date() if pd.notna(row.get('借款起始日')) else None
-            
-            def to_decimal(val):
-                try: return Decimal(str(val)) if pd.notna(val) and str(val).strip() != "" else Decimal('0')
-                except: return Decimal('0')
-
-            record = {
-                'company_id': company.id,
-                'loan_amount': to_decimal(row.get('借款金额（万元）')),
-                'guarantee_amount': to_decimal(row.get('担保金额（万元）')),
-                'loan_start_date': loan_start,
-                'loan_due_date': pd.to_datetime(row.get('借款到期日')).date() if pd.notna(row.get('借款到期日')) else None,
-                'loan_interest_rate': to_decimal(row.get('借款利率')),
-                'guarantee_fee_rate': to_decimal(row.get('担保费率')),
-                'outstanding_loan_balance': to_decimal(row.get('借款余额（万元）')),
-                'outstanding_guarantee_balance': to_decimal(row.get('担保余额（万元）')),
-                'loan_status': row.get('借据状态'),
-                'settlement_date': pd.to_datetime(row.get('结清日期')).date() if pd.notna(row.get('结清日期')) else None,
-                'enterprise_classification': row.get('企业划型'),
-                'cooperative_bank': row.get('合作银行'),
-                'snapshot_year': year,
-                'snapshot_month': month,
-                'business_year': int(row['业务年度']) if pd.notna(row['业务年度']) and row['业务年度'] != 0 else (loan_start.year if loan_start else year),
-                'business_type': row.get('业务类型')
-            }
-            data_to_insert.append(record)
-
-        db.bulk_insert_mappings(models.BusinessData, data_to_insert)
-        db.commit()
-        return len(data_to_insert)
+        return write_business_data(db, load_workbook_data(file_contents), year, month, incremental)
 
     # Master data imports (Industry/Tech/QYJH) remain similar but should update models.Company if applicable
     # (Leaving them mostly as is for now as they are staging tables in this demo)
     return 0
 
+BULK_IMPORT_WORKERS = os.cpu_count() or 1
+
+def _parse_workbook_timed(contents: bytes):
+    start = time.perf_counter()
+    # Workers already run in parallel, so each parses its sheets serially
+    return parse_workbook(contents, parallel=False), time.perf_counter() - start
+
+def bulk_import(db: Session, files: list, schema_type: str, incremental: bool = False):
+    # files is a list of (filename, contents, year, month). Workbooks are parsed
+    # in parallel worker processes while this thread writes the parsed
+    # snapshots one at a time, in input order, each in its own transaction, so
+    # a bad file is reported without affecting the others.
+    results = [
+        {'filename': filename, 'snapshot_year': year, 'snapshot_month': month, 'rows': 0, 'changes': None, 'duration': 0.0, 'error': None}
+        for filename, _, year, month in files
+    ]
+    if schema_type != 'business_data' or not files:
+        return results
+
+    # Previously parsed workbooks come straight from the parse cache
+    keys = [parse_cache.cache_key(contents, PARSE_READER_VERSION) for _, contents, _, _ in files]
+    cached = [parse_cache.get(key) for key in keys]
+    to_parse = [i for i, parsed_data in enumerate(cached) if parsed_data is None]
+
+    executor, futures = None, {}
+    if to_parse:
+        try:
+            executor = ProcessPoolExecutor(max_workers=max(1, min(len(to_parse), BULK_IMPORT_WORKERS)))
+            futures = {i: executor.submit(_parse_workbook_timed, files[i][1]) for i in to_parse}
+        except (OSError, NotImplementedError, BrokenProcessPool) as e:
+            # As in read_sheets, the files are then parsed in this thread
+            logger.warning("Parsing workbooks serially, the process pool failed: %s", e)
+            futures = {}
+    try:
+        for i, result in enumerate(results):
+            parse_seconds = write_seconds = 0.0
+            try:
+                parsed_data = cached[i]
+                if parsed_data is None:
+                    try:
+                        parsed_data, parse_seconds = futures[i].result() if i in futures else _parse_workbook_timed(files[i][1])
+                    except BrokenProcessPool as e:
+                        logger.warning("Parsing workbooks serially, the process pool failed: %s", e)
+                        futures = {}
+                        parsed_data, parse_seconds = _parse_workbook_timed(files[i][1])
+                    parse_cache.put(keys[i], parsed_data)
+                start = time.perf_counter()
+                changes = {}
+                result['rows'] = write_business_data(db, parsed_data, result['snapshot_year'], result['snapshot_month'], incremental, changes)
+                result['changes'] = changes
+                write_seconds = time.perf_counter() - start
+            except Exception as e:
+                db.rollback()
+                result['error'] = str(e)
+            result['duration'] = round(parse_seconds + write_seconds, 3)
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+    warm_statistics_cache(db)
+    return results
+
 def delete_data(db: Session, snapshot_year: int, snapshot_month: int):
-    crud.delete_business_data_by_snapshot(db, snapshot_year, snapshot_month)
+    crud.delete_business_data_by_snapshot(db, snapshot_year, snapshot_month, commit=False)
+    refresh_snapshot_aggregates(db, snapshot_year, snapshot_month)
+    crud.commit_dataset_change(db)
 
-def get_statistics(db: Session, year, month):
-    target_year, target_month = int(year), int(month)
-    
-    # Query with JOIN
-    query = db.query(models.BusinessData).join(models.Company).filter(
-        or_(
-            (models.BusinessData.snapshot_year < target_year) & (models.BusinessData.snapshot_month == 12),
-            (models.BusinessData.snapshot_year == target_year) & (models.BusinessData.snapshot_month == target_month)
-        )
+STATISTICS_BUSINESS_TYPES = ['常规业务', '建行批量业务', '微众批量业务', '工行批量业务']
+AGGREGATE_AMOUNTS = {
+    'loan_amount': 'loan_amount',
+    'guarantee_amount': 'guarantee_amount',
+    'loan_balance': 'outstanding_loan_balance',
+    'guarantee_balance': 'outstanding_guarantee_balance',
+}
+
+def company_bitmap(ids) -> bytes:
+    # Company ids are dense integers, so a set of companies is stored as a
+    # little-endian bitmap in which bit i is set for company id i
+    ids = np.asarray(ids, dtype=np.int64)
+    if not len(ids): return b''
+    flags = np.zeros(int(ids.max()) + 1, dtype=bool)
+    flags[ids] = True
+    return np.packbits(flags, bitorder='little').tobytes()
+
+def company_bitset(bitmap: bytes) -> int:
+    # Bitsets are Python ints: union is |, difference is & ~, size is bitset_count
+    return int.from_bytes(bitmap or b'', 'little')
+
+def bitset_count(bits: int) -> int:
+    return bin(bits).count('1')
+
+def bitset_ids(bits: int) -> list:
+    if not bits: return []
+    flags = np.unpackbits(np.frombuffer(bits.to_bytes((bits.bit_length() + 7) // 8, 'little'), dtype=np.uint8), bitorder='little')
+    return flags.nonzero()[0].tolist()
+
+def _amount_sum(column, condition=None):
+    # Stored amounts are read back rounded to the column scale, so round per
+    # row before summing to match the values the ORM reports
+    amount = func.round(column, column.type.scale)
+    return func.sum(case((condition, amount)) if condition is not None else amount)
+
+def _flag(condition):
+    return func.max(case((condition, 1), else_=0))
+
+def refresh_snapshot_aggregates(db: Session, year: int, month: int):
+    # Recompute the snapshot_aggregates rows of one snapshot from
+    # business_data. Runs inside the caller's transaction; the caller commits.
+    aggregates = models.SnapshotAggregate.__table__
+    db.execute(delete(aggregates).where(aggregates.c.snapshot_year == year, aggregates.c.snapshot_month == month))
+
+    c = models.BusinessData.__table__.c
+    group = (c.business_type, c.business_year)
+    conditions = [
+        c.snapshot_year == year, c.snapshot_month == month,
+        or_(c.loan_status.is_(None), c.loan_status != '未放款'),
+    ]
+    sums = db.execute(
+        select(*group, func.count().label('row_count'),
+               *[_amount_sum(c[col]).label(key) for key, col in AGGREGATE_AMOUNTS.items()])
+        .where(*conditions).group_by(*group)
+    ).mappings().all()
+    if not sums: return 0
+
+    guaranteed, in_force = defaultdict(list), defaultdict(list)
+    companies = db.execute(
+        select(*group, c.company_id, _flag(c.guarantee_amount > 0), _flag(c.outstanding_guarantee_balance > 0))
+        .where(*conditions, or_(c.guarantee_amount > 0, c.outstanding_guarantee_balance > 0))
+        .group_by(*group, c.company_id)
+    ).all()
+    for b_type, b_year, company_id, has_guarantee, has_balance in companies:
+        if has_guarantee: guaranteed[(b_type, b_year)].append(company_id)
+        if has_balance: in_force[(b_type, b_year)].append(company_id)
+
+    db.execute(insert(aggregates), [
+        {
+            **row,
+            'snapshot_year': year,
+            'snapshot_month': month,
+            **{key: row[key] or 0 for key in AGGREGATE_AMOUNTS},
+            'guaranteed_companies': company_bitmap(guaranteed[(row['business_type'], row['business_year'])]),
+            'in_force_companies': company_bitmap(in_force[(row['business_type'], row['business_year'])]),
+        }
+        for row in sums
+    ])
+    return len(sums)
+
+def rebuild_snapshot_aggregates(db: Session):
+    # Recompute snapshot_aggregates for every snapshot in business_data
+    c = models.BusinessData.__table__.c
+    db.execute(delete(models.SnapshotAggregate.__table__))
+    snapshots = db.execute(select(c.snapshot_year, c.snapshot_month).distinct()).all()
+    for year, month in snapshots:
+        refresh_snapshot_aggregates(db, year, month)
+    crud.commit_dataset_change(db)
+    return len(snapshots)
+
+def ensure_snapshot_aggregates(db: Session):
+    # Databases created before snapshot_aggregates existed are backfilled once
+    if db.query(models.SnapshotAggregate.id).first() or not db.query(models.BusinessData.id).first():
+        return 0
+    return rebuild_snapshot_aggregates(db)
+
+def ensure_dataset_version(db: Session):
+    # Report ETags embed the dataset version, so it exists before the first request
+    if crud.get_dataset_version(db) is None:
+        crud.commit_dataset_change(db)
+
+def ensure_indexes(db: Session):
+    # create_all() skips tables that already exist, so indexes added to the
+    # models later are created here; an index whose uniqueness changed is
+    # rebuilt. A unique index the existing rows violate is left as it was.
+    bind = db.get_bind()
+    inspector = inspect(bind)
+    created = []
+    for table in models.Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name): continue
+        existing = {index['name']: bool(index['unique']) for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if existing.get(index.name) == bool(index.unique): continue
+            with bind.begin() as conn:
+                columns = list(index.columns)
+                if index.unique and conn.execute(select(*columns).group_by(*columns).having(func.count() > 1).limit(1)).first():
+                    logger.warning("Not creating unique index %s: %s has duplicate rows", index.name, table.name)
+                    continue
+                if index.name in existing: index.drop(conn)
+                index.create(conn)
+            created.append(index.name)
+    return created
+
+def _aggregate_entry():
+    # Amount sums and company bitsets default to 0
+    return defaultdict(lambda: 0)
+
+def _statistics_summary(types, current_year_only):
+    # types: business type -> aggregates of one snapshot. With
+    # current_year_only the new business figures only cover loans whose
+    # business_year is the snapshot year. Sums are rounded back to the column
+    # scale to drop floating point noise.
+    scale = models.BusinessData.__table__.c.loan_amount.type.scale
+    prefix = 'year_' if current_year_only else ''
+    empty = _aggregate_entry()
+    summary = {}
+    for b_type in STATISTICS_BUSINESS_TYPES:
+        row = types.get(b_type, empty)
+        summary[b_type] = {
+            'loan_amount': round(float(row[prefix + 'loan_amount']), scale),
+            'guarantee_amount': round(float(row[prefix + 'guarantee_amount']), scale),
+            'company_count': bitset_count(row[prefix + 'guaranteed']),
+            'cumulative_company_count': bitset_count(row['guaranteed']),
+            'in_force_companies_count': bitset_count(row['in_force']),
+            'loan_balance': round(float(row['loan_balance']), scale),
+            'guarantee_balance': round(float(row['guarantee_balance']), scale),
+        }
+    summary['合计'] = {
+        key: sum(summary[b_type][key] for b_type in STATISTICS_BUSINESS_TYPES)
+        for key in summary[STATISTICS_BUSINESS_TYPES[0]]
+    }
+    for key in AGGREGATE_AMOUNTS:
+        summary['合计'][key] = round(summary['合计'][key], scale)
+
+    def merged(key):
+        bits = 0
+        for b_type in STATISTICS_BUSINESS_TYPES:
+            bits |= types.get(b_type, empty)[key]
+        return bitset_count(bits)
+
+    summary['merged_unique_company'] = merged(prefix + 'guaranteed')
+    summary['merged_cumlative_unique_company'] = merged('guaranteed')
+    summary['merged_unique_company_count_in_force'] = merged('in_force')
+    return summary
+
+def year_end_snapshots(db: Session, before_year: int):
+    # year -> month of the snapshot representing that year: December, or the
+    # latest month imported for the year when December is missing
+    a = models.SnapshotAggregate
+    return dict(
+        db.query(a.snapshot_year, func.max(a.snapshot_month))
+        .filter(a.snapshot_year < before_year).group_by(a.snapshot_year).all()
     )
-    
-    records = query.all()
-    if not records: return {}
-
-    # Flatten joined results into a list of dicts for Pandas
-    data = []
-    for r in records:
-        d = r.__dict__.copy()
-        d.pop('_sa_instance_state', None)
-        d['company_name'] = r.company.company_name # Essential for unique counts
-        data.append(d)
-        
-    df = pd.DataFrame(data)
-    df = df[~(df['loan_status'] == '未放款')]
-    if df.empty: return {}
-
-    for col in ['loan_amount', 'guarantee_amount', 'outstanding_loan_balance', 'outstanding_guarantee_balance']:
-        df[col] = df[col].apply(lambda x: Decimal(str(x)) if pd.notna(x) else Decimal('0'))
-
-    business_types = ['常规业务', '建行批量业务', '微众批量业务', '工行批量业务']
-
-    def calculate_summary(year_df, full_df):
-        summary = {}
-        sum_company_count = 0
-        sum_cumulative_company_count = 0
-        sum_in_force_companies_count = 0
-
-        for b_type in business_types:
-            type_df = year_df[year_df['business_type'] == b_type]
-            type_full_df = full_df[full_df['business_type'] == b_type]
-            
-            c_count = int(type_df[type_df['guarantee_amount'] > 0]['company_name'].nunique())
-            cum_c_count = int(type_full_df[type_full_df['guarantee_amount'] > 0]['company_name'].nunique())
-            inf_c_count = int(type_full_df[type_full_df['outstanding_guarantee_balance'] > 0]['company_name'].nunique())
-
-            summary[b_type] = {
-                'loan_amount': float(type_df['loan_amount'].sum()),
-                'guarantee_amount': float(type_df['guarantee_amount'].sum()),
-                'company_count': c_count,
-                'cumulative_company_count': cum_c_count,
-                'in_force_companies_count': inf_c_count,
-                'loan_balance': float(type_full_df['outstanding_loan_balance'].sum()),
-                'guarantee_balance': float(type_full_df['outstanding_guarantee_balance'].sum()),
-            }
-            sum_company_count += c_count
-            sum_cumulative_company_count += cum_c_count
-            sum_in_force_companies_count += inf_c_count
-
-        total_df = year_df[year_df['business_type'].isin(business_types)]
-        total_full_df = full_df[full_df['business_type'].isin(business_types)]
-        
-        summary['合计'] = {
-            'loan_amount': float(total_df['loan_amount'].sum()),
-            'guarantee_amount': float(total_df['guarantee_amount'].sum()),
-            'company_count': sum_company_count,
-            'cumulative_company_count': sum_cumulative_company_count,
-            'in_force_companies_count': sum_in_force_companies_count,
-            'loan_balance': float(total_full_df['outstanding_loan_balance'].sum()),
-            'guarantee_balance': float(total_full_df['outstanding_guarantee_balance'].sum()),
+
+def get_statistics(db: Session, year, month):
+    # The yearly summaries read the year-end snapshot of each earlier year and
+    # the requested snapshot for the target year
+    return get_statistics_batch(db, [(year, month)])[(int(year), int(month))]
+
+def period_range(start: tuple, end: tuple):
+    # Every (year, month) from start to end inclusive
+    periods = []
+    year, month = start
+    while (year, month) <= end:
+        periods.append((year, month))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return periods
+
+def get_statistics_batch(db: Session, periods):
+    # Statistics of several (year, month) periods, each laid out as
+    # get_statistics returns it. The snapshot_aggregates rows of all targets
+    # and year-end snapshots are loaded with one query and folded in one pass,
+    # and a year-end summary shared by several periods is built once.
+    targets = list(dict.fromkeys((int(y), int(m)) for y, m in periods))
+    if not targets: return {}
+    year_ends = year_end_snapshots(db, max(y for y, _ in targets))
+
+    a = models.SnapshotAggregate
+    rows = db.query(a).filter(
+        tuple_(a.snapshot_year, a.snapshot_month).in_([*targets, *year_ends.items()])
+    ).all()
+
+    # (snapshot year, month) -> business type -> sums and company bitsets,
+    # with year_* covering business_year == snapshot_year only
+    snapshots = defaultdict(dict)
+    for r in rows:
+        entry = snapshots[(r.snapshot_year, r.snapshot_month)].setdefault(r.business_type, _aggregate_entry())
+        guaranteed = company_bitset(r.guaranteed_companies)
+        for key in AGGREGATE_AMOUNTS:
+            entry[key] += getattr(r, key)
+        if r.business_year == r.snapshot_year:
+            entry['year_loan_amount'] += r.loan_amount
+            entry['year_guarantee_amount'] += r.guarantee_amount
+            entry['year_guaranteed'] |= guaranteed
+        entry['guaranteed'] |= guaranteed
+        entry['in_force'] |= company_bitset(r.in_force_companies)
+
+    yearly_cache = {}
+    def yearly(key):
+        if key not in yearly_cache:
+            yearly_cache[key] = _statistics_summary(snapshots[key], True)
+        return yearly_cache[key]
+
+    results = {}
+    for target_year, target_month in targets:
+        target = (target_year, target_month)
+        keys = [(y, m) for y, m in sorted(year_ends.items()) if y < target_year] + [target]
+        if not any(key in snapshots for key in keys):
+            results[target] = {}
+            continue
+
+        yearly_summaries = {}
+        for key in keys:
+            if key[0] >= 2021 and key in snapshots:
+                yearly_summaries[str(key[0])] = yearly(key)
+        results[target] = {
+            "overall_summary": _statistics_summary(snapshots.get(target, {}), False),
+            "yearly_summaries": yearly_summaries,
         }
-        summary['merged_unique_company'] = int(total_df[total_df['guarantee_amount'] > 0]['company_name'].nunique())
-        summary['merged_cumlative_unique_company'] = int(total_full_df[total_full_df['guarantee_amount'] > 0]['company_name'].nunique())
-        summary['merged_unique_company_count_in_force'] = int(total_full_df[total_full_df['outstanding_guarantee_balance'] > 0]['company_name'].nunique())
-        return summary
+    return results
 
-    df_overall = df[(df['snapshot_year'] == target_year) & (df['snapshot_month'] == target_month)]
-    overall_summary = calculate_summary(df_overall, df_overall)
-    
-    yearly_summaries = {}
-    for y in range(2021, target_year + 1):
-        df_snapshot = df[(df['snapshot_year'] == y) & (df['snapshot_month'] == 12)] if y < target_year else df_overall
-        if not df_snapshot.empty:
-            df_year = df_snapshot[df_snapshot['business_year'] == y]
-            yearly_summaries[str(int(y))] = calculate_summary(df_year, df_snapshot)
-        
-    return {"overall_summary": overall_summary, "yearly_summaries": yearly_summaries}
+def snapshot_company_bitsets(db: Session, year: int, month: int, business_types=STATISTICS_BUSINESS_TYPES):
+    # Bitsets of the guaranteed and in-force companies of one snapshot
+    a = models.SnapshotAggregate
+    bits = {'guaranteed': 0, 'in_force': 0}
+    rows = db.query(a.guaranteed_companies, a.in_force_companies).filter(
+        a.snapshot_year == year, a.snapshot_month == month, a.business_type.in_(business_types)
+    )
+    for guaranteed, in_force in rows:
+        bits['guaranteed'] |= company_bitset(guaranteed)
+        bits['in_force'] |= company_bitset(in_force)
+    return bits
 
-def get_data_status(db: Session, year, month, limit=None):
-    query = db.query(models.BusinessData).join(models.Company).filter(
-        models.BusinessData.snapshot_year == year,
-        models.BusinessData.snapshot_month == month
+def company_changes(db: Session, before: tuple, after: tuple):
+    # Companies gained and lost between two snapshots: new ones are guaranteed
+    # in after but not in before, churned ones were in force in before and
+    # no longer are in after
+    old = snapshot_company_bitsets(db, *before)
+    new = snapshot_company_bitsets(db, *after)
+    return {
+        'new_companies': bitset_ids(new['guaranteed'] & ~old['guaranteed']),
+        'churned_companies': bitset_ids(old['in_force'] & ~new['in_force']),
+    }
+
+def cached_statistics(db: Session, year, month, version=None):
+    # version: the dataset version the caller already read from db, if any
+    if version is None: version = crud.get_dataset_version(db)
+    return result_cache.get_or_compute(
+        'statistics', (int(year), int(month)), version, lambda: get_statistics(db, year, month)
     )
+
+def cached_statistics_batch(db: Session, periods, version=None):
+    if version is None: version = crud.get_dataset_version(db)
+    periods = tuple((int(y), int(m)) for y, m in periods)
+    return result_cache.get_or_compute('statistics_batch', periods, version, lambda: get_statistics_batch(db, periods))
+
+def warm_statistics_cache(db: Session):
+    # Precompute the statistics of the latest snapshot, the one the
+    # statistics page opens with after an import
+    a = models.SnapshotAggregate
+    latest = db.query(a.snapshot_year, a.snapshot_month) \
+        .order_by(a.snapshot_year.desc(), a.snapshot_month.desc()).first()
+    if latest:
+        cached_statistics(db, *latest)
+    return latest
+
+def get_available_dates(db: Session):
+    # Snapshot catalogue from snapshot_aggregates, which has a handful of rows
+    # per snapshot instead of one per loan
+    a = models.SnapshotAggregate
+    rows = db.query(a.snapshot_year, a.snapshot_month).distinct() \
+        .order_by(a.snapshot_year, a.snapshot_month).all()
+    return [{'year': year, 'month': month} for year, month in rows]
+
+COMPARISON_METRICS = [
+    'total_loan_amount', 'total_guarantee_amount', 'new_companies_this_year_loan',
+    'new_companies_this_year_guarantee_amount', 'new_companies_this_year_count',
+    'total_loan_balance', 'total_guarantee_balance', 'business_count', 'company_count',
+]
+
+def _snapshot_conditions(table, year, month):
+    c = table.c
+    return [c.snapshot_year == year, c.snapshot_month == month, or_(c.loan_status.is_(None), c.loan_status != '未放款')]
+
+def _comparison_summary(db: Session, year: int, month: int):
+    c = models.BusinessData.__table__.c
+    current_year = c.business_year == c.snapshot_year
+    types = db.execute(
+        select(
+            c.business_type,
+            func.count().label('business_count'),
+            _amount_sum(c.loan_amount).label('total_loan_amount'),
+            _amount_sum(c.guarantee_amount).label('total_guarantee_amount'),
+            _amount_sum(c.loan_amount, current_year).label('new_companies_this_year_loan'),
+            _amount_sum(c.guarantee_amount, current_year).label('new_companies_this_year_guarantee_amount'),
+            _amount_sum(c.outstanding_loan_balance).label('total_loan_balance'),
+            _amount_sum(c.outstanding_guarantee_balance).label('total_guarantee_balance'),
+            func.count(func.distinct(c.company_id)).label('company_count'),
+            func.count(func.distinct(case((current_year, c.company_id)))).label('new_companies_this_year_count'),
+        ).where(*_snapshot_conditions(models.BusinessData.__table__, year, month)).group_by(c.business_type)
+    ).mappings().all()
+    companies = db.execute(
+        select(
+            func.count(func.distinct(c.company_id)),
+            func.count(func.distinct(case((current_year, c.company_id)))),
+        ).where(*_snapshot_conditions(models.BusinessData.__table__, year, month))
+    ).one()
+
+    scale = c.loan_amount.type.scale
+    def metrics(values):
+        return {key: values[key] if key.endswith('_count') else round(float(values[key] or 0), scale) for key in COMPARISON_METRICS}
+
+    by_type = {row['business_type']: metrics(row) for row in types}
+    summary = metrics({key: sum(t[key] for t in by_type.values()) for key in COMPARISON_METRICS})
+    summary['company_count'], summary['new_companies_this_year_count'] = companies
+    return summary, by_type
+
+def _changes(before, after):
+    scale = models.BusinessData.__table__.c.loan_amount.type.scale
+    changes = {
+        f'{key}_change': after[key] - before[key] if key.endswith('_count') else round(after[key] - before[key], scale)
+        for key in COMPARISON_METRICS
+    }
+    # None marks a metric that was zero in the first period
+    percentages = {
+        key: (after[key] - before[key]) / before[key] * 100 if before[key] else None
+        for key in COMPARISON_METRICS
+    }
+    return changes, percentages
+
+def _company_difference(db: Session, present: tuple, absent: tuple, limit: int, offset: int):
+    # Companies with loans in the present snapshot but none in the absent one,
+    # largest loan total first, with the count and loan total of all of them
+    table = models.BusinessData.__table__
+    c = table.c
+    def snapshot_companies(year, month):
+        return select(c.company_id, _amount_sum(c.loan_amount).label('loan_amount')) \
+            .where(*_snapshot_conditions(table, year, month)).group_by(c.company_id).subquery()
+
+    present_q, absent_q = snapshot_companies(*present), snapshot_companies(*absent)
+    difference = select(present_q.c.company_id, present_q.c.loan_amount) \
+        .select_from(present_q.outerjoin(absent_q, present_q.c.company_id == absent_q.c.company_id)) \
+        .where(absent_q.c.company_id.is_(None)).subquery()
+
+    count, loan = db.execute(select(func.count(), func.sum(difference.c.loan_amount))).one()
+    company = models.Company.__table__.c
+    rows = db.execute(
+        select(company.id, company.company_name, company.is_technology_enterprise, difference.c.loan_amount)
+        .join_from(difference, models.Company.__table__, company.id == difference.c.company_id)
+        .order_by(difference.c.loan_amount.desc(), company.id).limit(limit).offset(offset)
+    ).mappings().all()
+    scale = c.loan_amount.type.scale
+    companies = [
+        {**row, 'is_technology_enterprise': bool(row['is_technology_enterprise']), 'loan_amount': round(float(row['loan_amount'] or 0), scale)}
+        for row in rows
+    ]
+    return companies, count, round(float(loan or 0), scale)
+
+def compare_snapshots(db: Session, period1: tuple, period2: tuple, limit: int = 1000, offset: int = 0):
+    # Totals, per business type metrics and their changes from period1 to
+    # period2, plus a page of the companies that are new in period2 and of
+    # those that exited (present in period1 only)
+    summary1, types1 = _comparison_summary(db, *period1)
+    summary2, types2 = _comparison_summary(db, *period2)
+    changes, percentages = _changes(summary1, summary2)
+
+    empty = {key: 0 for key in COMPARISON_METRICS}
+    business_types = {}
+    for b_type in sorted(set(types1) | set(types2), key=lambda t: (t is None, t or '')):
+        before, after = types1.get(b_type, empty), types2.get(b_type, empty)
+        business_types[b_type or '未分类'] = {'period1': before, 'period2': after, 'changes': _changes(before, after)[0]}
+
+    new_companies, new_count, new_loan = _company_difference(db, period2, period1, limit, offset)
+    exited_companies, exited_count, exited_loan = _company_difference(db, period1, period2, limit, offset)
+    return {
+        'summary1': summary1,
+        'summary2': summary2,
+        'changes': changes,
+        'percentage_changes': percentages,
+        'business_types': business_types,
+        'company_analysis': {
+            'new_companies': new_companies,
+            'new_companies_count': new_count,
+            'new_companies_loan': new_loan,
+            'exited_companies': exited_companies,
+            'exited_companies_count': exited_count,
+            'exited_companies_loan': exited_loan,
+            'limit': limit,
+            'offset': offset,
+        },
+    }
+
+def _data_status_columns():
+    # Output key -> column: business_data columns under their own name,
+    # company columns prefixed with company_ (company_id stays the foreign key)
+    columns = {c.name: c for c in models.BusinessData.__table__.c}
+    for c in models.Company.__table__.c:
+        columns.setdefault(f"company_{c.name}", c)
+    return columns
+
+DATA_STATUS_COLUMNS = _data_status_columns()
+DATA_STATUS_FILTERS = {
+    'bank': models.BusinessData.__table__.c.cooperative_bank,
+    'business_type': models.BusinessData.__table__.c.business_type,
+    'loan_status': models.BusinessData.__table__.c.loan_status,
+    'company_name': models.Company.__table__.c.company_name,
+}
+
+def _data_status_query(year, month, filters=None, columns=None):
+    names = list(DATA_STATUS_COLUMNS) if not columns else ['id', *[n for n in columns if n != 'id']]
+    unknown = [n for n in names if n not in DATA_STATUS_COLUMNS]
+    if unknown: raise ValueError(f"Unknown columns: {', '.join(unknown)}")
+
+    business, company = models.BusinessData.__table__, models.Company.__table__
+    query = select(*[DATA_STATUS_COLUMNS[n].label(n) for n in names]) \
+        .join_from(business, company, business.c.company_id == company.c.id) \
+        .where(business.c.snapshot_year == year, business.c.snapshot_month == month)
+    for key, value in (filters or {}).items():
+        if value is None: continue
+        if key not in DATA_STATUS_FILTERS: raise ValueError(f"Unknown filter: {key}")
+        column = DATA_STATUS_FILTERS[key]
+        query = query.where(column.contains(value, autoescape=True) if key == 'company_name' else column == value)
+    return query.order_by(business.c.id), names
+
+def _data_status_converters(names, dates=True):
+    # Per output column: dates as ISO strings, Numeric as float, else None
+    converters = []
+    for n in names:
+        column_type = DATA_STATUS_COLUMNS[n].type
+        if dates and isinstance(column_type, (Date, DateTime)): converters.append(lambda value: value.isoformat())
+        elif isinstance(column_type, Numeric): converters.append(float)
+        else: converters.append(None)
+    return converters
+
+def _convert_row(row, converters):
+    return [value if convert is None or value is None else convert(value) for value, convert in zip(row, converters)]
+
+def get_data_status(db: Session, year, month, limit=None, after_id=None, filters=None, columns=None):
+    # A page of one snapshot's loans joined to their companies, in id order.
+    # Pages are keyset-paginated: after_id is the last id of the previous
+    # page. filters maps DATA_STATUS_FILTERS keys to values (company_name
+    # matches a substring); columns selects output keys, id is always included.
+    query, names = _data_status_query(year, month, filters, columns)
+    if after_id is not None: query = query.where(models.BusinessData.__table__.c.id > after_id)
     if limit: query = query.limit(limit)
-    
-    result = query.all()
-    data = []
-    for r in result:
-        item = {col.name: getattr(r, col.name) for col in r.__table__.columns}
-        # Add company attributes
-        for col in r.company.__table__.columns:
-            item[f"company_{col.name}"] = getattr(r.company, col.name)
-        
-        for key, value in item.items():
-            if isinstance(value, (datetime.date, datetime.datetime)): item[key] = value.isoformat()
-            elif isinstance(value, Decimal): item[key] = float(value)
-        data.append(item)
-    return data
-
-def export_data_status_to_excel(db: Session, year, month):
-    data = get_data_status(db, year, month)
-    if not data: raise ValueError("No data found")
-    df = pd.DataFrame(data)
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='Data Status')
-    output.seek(0)
-    return output
+    converters = _data_status_converters(names)
+    return [dict(zip(names, _convert_row(row, converters))) for row in db.execute(query)]
+
+EXPORT_CHUNK_SIZE = 5000
+# Finished xlsx files up to this size are sent from memory, larger ones from disk
+EXPORT_SPOOL_BYTES = 8 * 1024 * 1024
+EXPORT_READ_BYTES = 1024 * 1024
+EXPORT_MEDIA_TYPES = {
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'csv': 'text/csv; charset=utf-8',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+class _StreamBuffer:
+    # Write-only file object that hands out what was written so far
+    closed = False
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def writable(self):
+        return True
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+def _export_csv(names, chunks):
+    # UTF-8 with a BOM so Excel detects the encoding of the Chinese text
+    converters = _data_status_converters(names)
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(names)
+    yield output.getvalue().encode('utf-8-sig')
+    for rows in chunks:
+        output.seek(0)
+        output.truncate()
+        writer.writerows(_convert_row(row, converters) for row in rows)
+        yield output.getvalue().encode('utf-8')
+
+def _arrow_type(column_type):
+    if isinstance(column_type, Boolean): return pa.bool_()
+    if isinstance(column_type, Integer): return pa.int64()
+    if isinstance(column_type, Numeric): return pa.float64()
+    if isinstance(column_type, DateTime): return pa.timestamp('us')
+    if isinstance(column_type, Date): return pa.date32()
+    return pa.string()
+
+def _export_parquet(names, chunks):
+    # One row group per chunk; dates keep their native types
+    schema = pa.schema([(n, _arrow_type(DATA_STATUS_COLUMNS[n].type)) for n in names])
+    converters = _data_status_converters(names, dates=False)
+    sink = _StreamBuffer()
+    with pq.ParquetWriter(sink, schema) as writer:
+        for rows in chunks:
+            columns = zip(*[_convert_row(row, converters) for row in rows])
+            writer.write_table(pa.table(dict(zip(names, columns)), schema=schema))
+            yield sink.drain()
+    yield sink.drain()
+
+def _export_xlsx(names, chunks):
+    # openpyxl's write-only mode spools the sheet to a temporary file, so
+    # memory stays bounded. The zip container can only be written once the
+    # sheet is complete, so unlike csv and parquet nothing is sent until the
+    # last row is read; the file is then sent EXPORT_READ_BYTES at a time.
+    converters = _data_status_converters(names)
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Data Status')
+    sheet.append(names)
+    for rows in chunks:
+        for row in rows:
+            sheet.append(_convert_row(row, converters))
+    with tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_BYTES) as output:
+        workbook.save(output)
+        output.seek(0)
+        while block := output.read(EXPORT_READ_BYTES):
+            yield block
+
+EXPORT_WRITERS = {'xlsx': _export_xlsx, 'csv': _export_csv, 'parquet': _export_parquet}
+
+def _partitions(db: Session, query, chunk_size):
+    # yield_per streams the result through a server-side cursor
+    yield from db.execute(query.execution_options(yield_per=chunk_size)).partitions()
+
+def export_data_status(db: Session, year, month, fmt='xlsx', chunk_size=EXPORT_CHUNK_SIZE):
+    # The data status of one snapshot as an iterator of file chunks. Rows are
+    # read chunk_size at a time and written as they arrive.
+    if fmt not in EXPORT_WRITERS: raise ValueError(f"Unsupported export format: {fmt}")
+    query, names = _data_status_query(year, month)
+    return EXPORT_WRITERS[fmt](names, _partitions(db, query, chunk_size))
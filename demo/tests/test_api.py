@@ -0,0 +1,121 @@
+import threading
+import time
+import pytest
+from fastapi.testclient import TestClient
+import concurrency
+import crud
+import main
+import models
+import result_cache
+import services
+from test_services import make_session, sample_frame
+
+@pytest.fixture
+def client():
+    # The app's lifespan, which opens the real database, is not run here
+    db = make_session()
+    services.write_business_data(db, sample_frame(), 2025, 6)
+
+    def get_test_db():
+        yield db
+
+    main.app.dependency_overrides[main.get_db] = get_test_db
+    main.app.dependency_overrides[main.get_read_db] = get_test_db
+    main.app.dependency_overrides[main.get_current_username] = lambda: "admin"
+    result_cache.clear()
+    try:
+        yield TestClient(main.app), db
+    finally:
+        main.app.dependency_overrides.clear()
+        result_cache.clear()
+        db.close()
+
+def test_reports_answer_if_none_match_until_the_data_changes(client, monkeypatch):
+    client, db = client
+    url = "/statistics/?snapshot_year=2025&snapshot_month=6"
+    first = client.get(url)
+    etag = first.headers["etag"]
+    assert first.status_code == 200 and first.json()
+
+    # A current copy is confirmed without computing the report
+    monkeypatch.setattr(services, "cached_statistics", lambda *args: pytest.fail("report recomputed"))
+    cached = client.get(url, headers={"If-None-Match": etag})
+    assert (cached.status_code, cached.content, cached.headers["etag"]) == (304, b"", etag)
+    monkeypatch.undo()
+
+    assert client.get("/statistics/?snapshot_year=2025&snapshot_month=7").headers["etag"] != etag
+    services.write_business_data(db, sample_frame().iloc[:2], 2025, 6)
+    changed = client.get(url, headers={"If-None-Match": etag})
+    assert changed.status_code == 200 and changed.headers["etag"] != etag
+
+def test_data_status_etag_depends_on_the_page(client):
+    client, db = client
+    url = "/data_status/?snapshot_year=2025&snapshot_month=6&limit=2"
+    etag = client.get(url).headers["etag"]
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+    next_page = client.get(url + "&after_id=2", headers={"If-None-Match": etag})
+    assert next_page.status_code == 200 and next_page.headers["etag"] != etag
+
+    services.delete_data(db, 2025, 6)
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 200
+
+def test_large_reports_are_compressed(client):
+    client, db = client
+    url = "/data_status/?snapshot_year=2025&snapshot_month=6"
+    compressed = client.get(url, headers={"Accept-Encoding": "gzip"})
+    assert compressed.headers["content-encoding"] == "gzip"
+    assert int(compressed.headers["content-length"]) < len(compressed.content)
+    assert compressed.json() == client.get(url, headers={"Accept-Encoding": "identity"}).json()
+    assert "content-encoding" not in client.get(url, headers={"Accept-Encoding": "identity"}).headers
+
+def test_available_dates_lists_years_and_months(client):
+    client, db = client
+    services.write_business_data(db, sample_frame(), 2024, 12)
+    assert client.get("/api/available-dates").json() == {
+        "years": [2024, 2025],
+        "months": [{"year": 2024, "month": 12}, {"year": 2025, "month": 6}],
+    }
+
+def test_data_status_without_paging_returns_every_row(client):
+    client, db = client
+    url = "/data_status/?snapshot_year=2025&snapshot_month=6"
+    rows = client.get(url).json()
+    assert isinstance(rows, list) and len(rows) == len(sample_frame())
+
+    first = client.get(url + "&limit=2").json()
+    rest = client.get(url + f"&after_id={first['next_after_id']}").json()
+    assert first["items"] + rest["items"] == rows
+    assert rest["next_after_id"] is None
+
+def test_etag_and_body_follow_writes_from_other_processes(client):
+    client, db = client
+    url = "/statistics/?snapshot_year=2025&snapshot_month=6"
+    first = client.get(url)
+    assert first.json()
+
+    # Another worker or script clears the snapshot; only the database changes
+    for table in (models.BusinessData.__table__, models.SnapshotAggregate.__table__):
+        db.execute(table.delete())
+    crud.bump_dataset_version(db)
+    db.commit()
+    changed = client.get(url, headers={"If-None-Match": first.headers["etag"]})
+    assert changed.status_code == 200 and changed.headers["etag"] != first.headers["etag"]
+    assert changed.json() == {}
+
+def test_reports_do_not_queue_behind_long_writes(client, monkeypatch):
+    client, db = client
+    release = threading.Event()
+    monkeypatch.setattr(services, "sync_all_business_data", lambda db: release.wait(30) and 0)
+    writes = [threading.Thread(target=client.post, args=("/sync/",)) for _ in range(concurrency.WRITE_WORKERS)]
+    for thread in writes:
+        thread.start()
+    try:
+        time.sleep(0.2)
+        report = threading.Thread(target=client.get, args=("/statistics/?snapshot_year=2025&snapshot_month=6",))
+        report.start()
+        report.join(5)
+        assert not report.is_alive()
+    finally:
+        release.set()
+        for thread in writes:
+            thread.join()
@@ -0,0 +1,162 @@
+import io
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+import pandas as pd
+import pytest
+from openpyxl import Workbook
+from sqlalchemy import create_engine, func
+from sqlalchemy.orm import sessionmaker
+import models
+import parse_cache
+import services
+from test_services import make_session
+
+def make_workbook(sheets):
+    # sheets: name -> rows below a title row and the header row
+    wb = Workbook()
+    wb.remove(wb.active)
+    for name, rows in sheets.items():
+        ws = wb.create_sheet(name)
+        ws.append([f"{name}明细"])
+        for row in rows:
+            ws.append(row)
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+def business_workbook(offset=0):
+    header = ["企业名称", "借款金额（万元）", "担保金额（万元）", "借款起始日", "借据状态", "业务年度"]
+    return make_workbook({
+        "线下业务": [header, [f"甲公司{offset}", 100, 80, "2024-03-01", "否", 2024], [f"乙公司{offset}", 50, 40, None, "是", 2023]],
+        "微众批量业务": [header[:2] + header[3:5], [f"丙公司{offset}", 20, "2025-01-05", "否"]],
+        "建行批量业务": [header, [f"丁公司{offset}", 30, 24, None, "否", 2025]],
+        "工行批量业务": [header, [f"戊公司{offset}", 40, 32, None, "否", 2025], [f"己公司{offset}", 10, 8, None, "否", 2025]],
+    })
+
+def test_parallel_and_serial_parses_match():
+    contents = business_workbook()
+    serial = services.read_sheets(contents, parallel=False)
+    parallel = services.read_sheets(contents, parallel=True)
+
+    assert [frame['业务类型'].iloc[0] for frame in parallel] == [spec[3] for spec in services.SHEET_SPECS]
+    assert [len(frame) for frame in parallel] == [2, 1, 1, 2]
+    for a, b in zip(serial, parallel):
+        pd.testing.assert_frame_equal(a, b)
+
+def test_failed_process_pool_falls_back_to_serial_parse(monkeypatch, caplog):
+    class NoProcesses:
+        def __init__(self, *args, **kwargs):
+            raise OSError("Function not implemented")
+
+    contents = business_workbook()
+    expected = services.read_sheets(contents, parallel=False)
+    monkeypatch.setattr(services, "ProcessPoolExecutor", NoProcesses)
+    with caplog.at_level(logging.WARNING, logger="services"):
+        frames = services.read_sheets(contents, parallel=True)
+
+    for a, b in zip(expected, frames):
+        pd.testing.assert_frame_equal(a, b)
+    assert "process pool failed" in caplog.text
+
+def test_unreadable_sheet_is_reported(caplog):
+    # 微众批量业务 holds only its title row, so there is no header to read
+    contents = make_workbook({
+        "线下业务": [["企业名称", "借款金额（万元）"], ["甲公司", 100]],
+        "微众批量业务": [],
+    })
+    for parallel in (False, True):
+        caplog.clear()
+        with caplog.at_level(logging.WARNING, logger="services"):
+            frames = services.read_sheets(contents, parallel=parallel)
+        assert [len(frame) for frame in frames] == [1, 0, 0, 0]
+        assert "Sheet 微众批量业务" in caplog.text
+
+@pytest.fixture
+def parse_cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(parse_cache, "PARSE_CACHE_DIR", str(tmp_path / "parse_cache"))
+    return tmp_path / "parse_cache"
+
+def test_bulk_import_reports_a_bad_file_and_commits_the_others(parse_cache_dir):
+    db = make_session()
+    files = [
+        ("2025-01.xlsx", business_workbook(1), 2025, 1),
+        ("broken.xlsx", b"not a workbook", 2025, 2),
+        ("2025-03.xlsx", business_workbook(3), 2025, 3),
+    ]
+    results = services.bulk_import(db, files, 'business_data')
+
+    assert [r['rows'] for r in results] == [6, 0, 6]
+    assert [bool(r['error']) for r in results] == [False, True, False]
+    # Each file commits on its own, so the good snapshots survive the bad one
+    other = sessionmaker(bind=db.get_bind())()
+    snapshots = other.query(models.BusinessData.snapshot_month, func.count()).group_by(models.BusinessData.snapshot_month).all()
+    assert sorted(snapshots) == [(1, 6), (3, 6)]
+
+def test_bulk_import_parses_serially_without_a_process_pool(parse_cache_dir, monkeypatch, caplog):
+    class NoProcesses:
+        def __init__(self, *args, **kwargs):
+            raise OSError("Function not implemented")
+
+    monkeypatch.setattr(services, "ProcessPoolExecutor", NoProcesses)
+    files = [
+        ("2025-01.xlsx", business_workbook(1), 2025, 1),
+        ("broken.xlsx", b"not a workbook", 2025, 2),
+        ("2025-03.xlsx", business_workbook(3), 2025, 3),
+    ]
+    with caplog.at_level(logging.WARNING, logger="services"):
+        results = services.bulk_import(make_session(), files, 'business_data')
+
+    assert [r['rows'] for r in results] == [6, 0, 6]
+    assert [bool(r['error']) for r in results] == [False, True, False]
+    assert "process pool failed" in caplog.text
+
+def test_bulk_import_parses_serially_after_a_worker_dies(parse_cache_dir, monkeypatch):
+    class DeadWorkers:
+        def __init__(self, *args, **kwargs):
+            pass
+        def submit(self, fn, *args):
+            future = Future()
+            future.set_exception(BrokenProcessPool("A process in the process pool was terminated abruptly"))
+            return future
+        def shutdown(self, **kwargs):
+            pass
+
+    monkeypatch.setattr(services, "ProcessPoolExecutor", DeadWorkers)
+    files = [("2025-01.xlsx", business_workbook(1), 2025, 1), ("2025-02.xlsx", business_workbook(2), 2025, 2)]
+    results = services.bulk_import(make_session(), files, 'business_data')
+    assert [(r['rows'], r['error']) for r in results] == [(6, None), (6, None)]
+
+def test_concurrent_snapshot_writes_are_serialized(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}", connect_args={"check_same_thread": False})
+    models.Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    # The merge only reads, so SQLite's own write lock would not keep two
+    # writers apart there; only the writer lock does
+    active, overlaps = [0], []
+    merge_qcc_data = services.merge_qcc_data
+    def tracked_merge(*args, **kwargs):
+        active[0] += 1
+        overlaps.append(active[0])
+        time.sleep(0.2)
+        try:
+            return merge_qcc_data(*args, **kwargs)
+        finally:
+            active[0] -= 1
+    monkeypatch.setattr(services, "merge_qcc_data", tracked_merge)
+
+    def write(month):
+        with Session() as db:
+            services.write_business_data(db, services.parse_workbook(business_workbook(month)), 2025, month)
+    threads = [threading.Thread(target=write, args=(month,)) for month in (1, 2, 3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert overlaps == [1, 1, 1]
+    with Session() as db:
+        assert db.query(models.BusinessData).count() == 18
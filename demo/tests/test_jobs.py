@@ -0,0 +1,103 @@
+import os
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+import jobs
+import models
+import parse_cache
+import result_cache
+import services
+from test_import import business_workbook
+
+class RecordingExecutor:
+    # Stands in for the worker pool so each test runs its jobs itself
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, fn, *args):
+        self.submitted.append(args)
+
+@pytest.fixture
+def job_db(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}", connect_args={"check_same_thread": False})
+    models.Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    executor = RecordingExecutor()
+    monkeypatch.setattr(jobs, "SessionLocal", Session)
+    monkeypatch.setattr(jobs, "ReadSessionLocal", Session)
+    monkeypatch.setattr(jobs, "IMPORT_JOB_DIR", str(tmp_path / "jobs"))
+    monkeypatch.setattr(jobs, "_executor", executor)
+    monkeypatch.setattr(parse_cache, "PARSE_CACHE_DIR", str(tmp_path / "parse_cache"))
+    result_cache.clear()
+    yield Session, executor
+    result_cache.clear()
+
+def test_job_runs_from_queued_to_done(job_db, monkeypatch):
+    Session, executor = job_db
+    db = Session()
+    job = jobs.submit_import(db, "2025-06.xlsx", business_workbook(), 'business_data', 2025, 6)
+    assert job.status == "queued" and os.path.exists(job.file_path)
+    assert executor.submitted == [(job.id,)]
+
+    seen = []
+    load_workbook_data = services.load_workbook_data
+    def tracked(*args, **kwargs):
+        with Session() as other:
+            seen.append(other.get(models.ImportJob, job.id).status)
+        return load_workbook_data(*args, **kwargs)
+    monkeypatch.setattr(services, "load_workbook_data", tracked)
+    # The job's session must not hold the writer connection when the write
+    # starts, or it would wait on the writer lock while holding it
+    in_transaction = []
+    write_business_data = services.write_business_data
+    def tracked_write(db, *args, **kwargs):
+        in_transaction.append(db.in_transaction())
+        return write_business_data(db, *args, **kwargs)
+    monkeypatch.setattr(services, "write_business_data", tracked_write)
+    jobs.run_job(job.id)
+
+    db.refresh(job)
+    assert seen == ["running"] and in_transaction == [False]
+    assert (job.status, job.rows_processed, job.error) == ("done", 6, None)
+    assert job.started_at <= job.finished_at and set(job.stage_timings) == {"parse", "write"}
+    assert not os.path.exists(job.file_path)
+    assert db.query(models.BusinessData).filter_by(snapshot_year=2025, snapshot_month=6).count() == 6
+
+    # A finished job is not run again
+    jobs.run_job(job.id)
+    assert seen == ["running"]
+
+def test_failed_job_records_the_error(job_db):
+    Session, executor = job_db
+    db = Session()
+    job = jobs.submit_import(db, "broken.xlsx", b"not a workbook", 'business_data', 2025, 6)
+    jobs.run_job(job.id)
+
+    db.refresh(job)
+    assert job.status == "failed" and job.error
+    assert job.finished_at is not None and not os.path.exists(job.file_path)
+    assert db.query(models.BusinessData).count() == 0
+
+def test_recover_orphaned_jobs(job_db, tmp_path):
+    Session, executor = job_db
+    db = Session()
+    def make_job(status, file_path):
+        return models.ImportJob(filename="upload.xlsx", schema_type='business_data', snapshot_year=2025,
+                                snapshot_month=6, file_path=file_path, status=status)
+    upload = tmp_path / "upload.xlsx"
+    upload.write_bytes(b"upload")
+    queued = make_job("queued", str(upload))
+    running = make_job("running", str(upload))
+    lost = make_job("running", str(tmp_path / "missing.xlsx"))
+    done = make_job("done", None)
+    db.add_all([queued, running, lost, done])
+    db.commit()
+
+    # Snapshot writes replace the whole snapshot, so interrupted runs are requeued too
+    assert jobs.recover_orphaned_jobs() == [queued.id, running.id]
+    assert executor.submitted == [(queued.id,), (running.id,)]
+
+    db.expire_all()
+    assert (queued.status, running.status) == ("queued", "queued")
+    assert lost.status == "failed" and "no longer available" in lost.error
+    assert (done.status, done.error) == ("done", None)
@@ -0,0 +1,58 @@
+import os
+import pandas as pd
+import pytest
+import parse_cache
+import services
+from test_import import business_workbook
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(parse_cache, "PARSE_CACHE_DIR", str(tmp_path))
+    return tmp_path
+
+def stat_changes(before):
+    after = parse_cache.stats()
+    return {name: after[name] - before[name] for name in ("hits", "misses", "writes", "evictions")}
+
+def test_cached_parse_matches_a_fresh_parse(cache_dir, monkeypatch):
+    contents = business_workbook()
+    before = parse_cache.stats()
+    fresh = services.load_workbook_data(contents)
+    monkeypatch.setattr(services, "parse_workbook", lambda *args: pytest.fail("workbook parsed again"))
+    cached = services.load_workbook_data(contents)
+
+    assert stat_changes(before) == {"hits": 1, "misses": 1, "writes": 1, "evictions": 0}
+    # Same columns in the same order with the same dtypes
+    pd.testing.assert_frame_equal(fresh, cached)
+
+def test_changed_contents_miss_the_cache(cache_dir):
+    services.load_workbook_data(business_workbook(1))
+    before = parse_cache.stats()
+    parsed = services.load_workbook_data(business_workbook(2))
+
+    assert stat_changes(before) == {"hits": 0, "misses": 1, "writes": 1, "evictions": 0}
+    assert parsed['企业名称'].str.endswith("2").all()
+    assert parse_cache.cache_key(b"a", 1) != parse_cache.cache_key(b"a", 2)
+
+def test_least_recently_used_entries_are_evicted(cache_dir, monkeypatch):
+    frame = pd.DataFrame({"企业名称": ["甲公司"] * 100, "借款金额（万元）": range(100)})
+    parse_cache.put("a", frame)
+    size = os.path.getsize(cache_dir / "a.parquet")
+    monkeypatch.setattr(parse_cache, "PARSE_CACHE_MAX_BYTES", 2 * size)
+    parse_cache.put("b", frame)
+    os.utime(cache_dir / "a.parquet", (0, 0))
+    os.utime(cache_dir / "b.parquet", (1, 1))
+    # A hit refreshes the entry, so b is now the oldest
+    assert parse_cache.get("a") is not None
+
+    before = parse_cache.stats()
+    parse_cache.put("c", frame)
+    assert stat_changes(before)["evictions"] == 1
+    assert sorted(os.listdir(cache_dir)) == ["a.parquet", "c.parquet"]
+    assert parse_cache.get("b") is None
+
+def test_unreadable_entry_is_a_miss(cache_dir):
+    (cache_dir / "bad.parquet").write_bytes(b"not parquet")
+    before = parse_cache.stats()
+    assert parse_cache.get("bad") is None
+    assert stat_changes(before)["misses"] == 1
@@ -0,0 +1,74 @@
+import re
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+import crud
+import models
+import services
+from test_services import sample_frame
+
+# Tables whose hot queries must be served by an index
+INDEXED_TABLES = {'business_data', 'companies', 'qcc_industry', 'qcc_tech', 'qyjh_list'}
+FULL_SCAN = re.compile(r'SCAN (\w+?)(?:_\d+)?')
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    models.Base.metadata.create_all(bind=engine)
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    services.write_business_data(session, sample_frame(), 2024, 12)
+    services.write_business_data(session, sample_frame(), 2025, 6)
+    yield session
+    session.close()
+
+def query_plans(db, run):
+    # (plan line, statement) for every query run() issues
+    statements = []
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE')):
+            statements.append((statement, parameters[0] if executemany else parameters))
+
+    engine = db.get_bind()
+    event.listen(engine, 'before_cursor_execute', capture)
+    try:
+        run()
+    finally:
+        event.remove(engine, 'before_cursor_execute', capture)
+
+    assert statements
+    return [
+        (row[-1], statement)
+        for statement, parameters in statements
+        for row in db.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)
+    ]
+
+def full_scans(db, run):
+    # Plan lines that scan one of INDEXED_TABLES without an index
+    scans = []
+    for line, statement in query_plans(db, run):
+        match = FULL_SCAN.fullmatch(line)
+        if match and match.group(1) in INDEXED_TABLES:
+            scans.append((line, statement))
+    return scans
+
+def test_snapshot_delete_uses_index(db):
+    assert full_scans(db, lambda: crud.delete_business_data_by_snapshot(db, 2025, 6, commit=False)) == []
+
+def test_data_status_uses_index(db):
+    assert full_scans(db, lambda: services.get_data_status(db, 2025, 6)) == []
+
+def test_data_status_pages_need_no_sort(db):
+    page = lambda: services.get_data_status(db, 2025, 6, limit=2, after_id=0, filters={'bank': '中国银行'})
+    assert not [line for line, _ in query_plans(db, page) if 'TEMP B-TREE' in line]
+
+def test_snapshot_write_uses_index(db):
+    assert full_scans(db, lambda: services.write_business_data(db, sample_frame(), 2025, 6)) == []
+    assert full_scans(db, lambda: services.write_business_data(db, sample_frame(), 2025, 6, incremental=True)) == []
+
+def test_statistics_use_index(db):
+    assert full_scans(db, lambda: services.get_statistics(db, 2025, 6)) == []
+    assert full_scans(db, lambda: services.compare_snapshots(db, (2024, 12), (2025, 6))) == []
+
+def test_staging_lookups_use_index(db):
+    assert full_scans(db, lambda: services.merge_qcc_data(sample_frame(), db)) == []
@@ -0,0 +1,511 @@
+import datetime
+import io
+from decimal import Decimal
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+from openpyxl import load_workbook
+from sqlalchemy import create_engine, or_
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+import crud
+import models
+import services
+import result_cache
+
+def make_session():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    models.Base.metadata.create_all(bind=engine)
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+
+def legacy_record(row, company_id, year, month):
+    # The per-row conversion process_excel_import used before the columnar path
+    def to_decimal(val):
+        try: return Decimal(str(val)) if pd.notna(val) and str(val).strip() != "" else Decimal('0')
+        except: return Decimal('0')
+
+    def to_date(val):
+        return pd.to_datetime(val).date() if pd.notna(val) else None
+
+    loan_start = to_date(row.get('借款起始日'))
+    return {
+        'company_id': company_id,
+        'loan_amount': to_decimal(row.get('借款金额（万元）')),
+        'guarantee_amount': to_decimal(row.get('担保金额（万元）')),
+        'loan_start_date': loan_start,
+        'loan_due_date': to_date(row.get('借款到期日')),
+        'loan_interest_rate': to_decimal(row.get('借款利率')),
+        'guarantee_fee_rate': to_decimal(row.get('担保费率')),
+        'outstanding_loan_balance': to_decimal(row.get('借款余额（万元）')),
+        'outstanding_guarantee_balance': to_decimal(row.get('担保余额（万元）')),
+        'loan_status': row.get('借据状态'),
+        'settlement_date': to_date(row.get('结清日期')),
+        'enterprise_classification': row.get('企业划型'),
+        'cooperative_bank': row.get('合作银行'),
+        'snapshot_year': year,
+        'snapshot_month': month,
+        'business_year': int(row['业务年度']) if pd.notna(row['业务年度']) and row['业务年度'] != 0 else (loan_start.year if loan_start else year),
+        'business_type': row.get('业务类型'),
+    }
+
+def legacy_statistics(db, year, month):
+    # get_statistics as it was before the aggregation moved into SQL
+    target_year, target_month = int(year), int(month)
+    records = db.query(models.BusinessData).join(models.Company).filter(
+        or_(
+            (models.BusinessData.snapshot_year < target_year) & (models.BusinessData.snapshot_month == 12),
+            (models.BusinessData.snapshot_year == target_year) & (models.BusinessData.snapshot_month == target_month)
+        )
+    ).all()
+    if not records: return {}
+    data = []
+    for r in records:
+        d = r.__dict__.copy()
+        d.pop('_sa_instance_state', None)
+        d['company_name'] = r.company.company_name
+        data.append(d)
+    df = pd.DataFrame(data)
+    df = df[~(df['loan_status'] == '未放款')]
+    if df.empty: return {}
+    for col in ['loan_amount', 'guarantee_amount', 'outstanding_loan_balance', 'outstanding_guarantee_balance']:
+        df[col] = df[col].apply(lambda x: Decimal(str(x)) if pd.notna(x) else Decimal('0'))
+
+    business_types = ['常规业务', '建行批量业务', '微众批量业务', '工行批量业务']
+
+    def calculate_summary(year_df, full_df):
+        summary = {}
+        totals = {'company_count': 0, 'cumulative_company_count': 0, 'in_force_companies_count': 0}
+        for b_type in business_types:
+            type_df = year_df[year_df['business_type'] == b_type]
+            type_full_df = full_df[full_df['business_type'] == b_type]
+            summary[b_type] = {
+                'loan_amount': float(type_df['loan_amount'].sum()),
+                'guarantee_amount': float(type_df['guarantee_amount'].sum()),
+                'company_count': int(type_df[type_df['guarantee_amount'] > 0]['company_name'].nunique()),
+                'cumulative_company_count': int(type_full_df[type_full_df['guarantee_amount'] > 0]['company_name'].nunique()),
+                'in_force_companies_count': int(type_full_df[type_full_df['outstanding_guarantee_balance'] > 0]['company_name'].nunique()),
+                'loan_balance': float(type_full_df['outstanding_loan_balance'].sum()),
+                'guarantee_balance': float(type_full_df['outstanding_guarantee_balance'].sum()),
+            }
+            for key in totals:
+                totals[key] += summary[b_type][key]
+        total_df = year_df[year_df['business_type'].isin(business_types)]
+        total_full_df = full_df[full_df['business_type'].isin(business_types)]
+        summary['合计'] = {
+            'loan_amount': float(total_df['loan_amount'].sum()),
+            'guarantee_amount': float(total_df['guarantee_amount'].sum()),
+            **totals,
+            'loan_balance': float(total_full_df['outstanding_loan_balance'].sum()),
+            'guarantee_balance': float(total_full_df['outstanding_guarantee_balance'].sum()),
+        }
+        summary['merged_unique_company'] = int(total_df[total_df['guarantee_amount'] > 0]['company_name'].nunique())
+        summary['merged_cumlative_unique_company'] = int(total_full_df[total_full_df['guarantee_amount'] > 0]['company_name'].nunique())
+        summary['merged_unique_company_count_in_force'] = int(total_full_df[total_full_df['outstanding_guarantee_balance'] > 0]['company_name'].nunique())
+        return summary
+
+    df_overall = df[(df['snapshot_year'] == target_year) & (df['snapshot_month'] == target_month)]
+    yearly_summaries = {}
+    for y in range(2021, target_year + 1):
+        df_snapshot = df[(df['snapshot_year'] == y) & (df['snapshot_month'] == 12)] if y < target_year else df_overall
+        if not df_snapshot.empty:
+            yearly_summaries[str(int(y))] = calculate_summary(df_snapshot[df_snapshot['business_year'] == y], df_snapshot)
+    return {"overall_summary": calculate_summary(df_overall, df_overall), "yearly_summaries": yearly_summaries}
+
+def sample_frame():
+    return pd.DataFrame({
+        '企业名称': ['甲公司', '乙公司', '甲公司', '丙公司'],
+        '借款金额（万元）': [100.5, 0.0, 1234.567891, 20.0],
+        '担保金额（万元）': [80.4, 0.0, 987.654313, 16.0],
+        '借款起始日': pd.to_datetime(['2024-03-01', None, '2023-12-31', None]),
+        '借款到期日': pd.to_datetime(['2025-03-01', '2025-06-30', None, None]),
+        '借款利率': [0.035, 0.04, 0.0, 0.1],
+        '担保费率': [0.01, 0.0, 0.008, 0.0],
+        '借款余额（万元）': [50.25, 0.0, 0.0, 20.0],
+        '担保余额（万元）': [40.2, 0.0, 0.0, 16.0],
+        '借据状态': ['正常', '已结清', '已结清', None],
+        '结清日期': pd.to_datetime([None, '2025-01-15', '2024-12-31', None]),
+        '企业划型': ['小型', '微型', '小型', '中型'],
+        '合作银行': ['中国银行', '微众银行', '中国银行', None],
+        '业务年度': [2024, 0, 0, 0],
+        '业务类型': ['常规业务', '微众批量业务', '常规业务', '建行批量业务'],
+    })
+
+def stored_rows(db):
+    columns = [c for c in models.BusinessData.__table__.columns.keys() if c not in ('id', 'created_at')]
+    return [
+        {c: getattr(r, c) for c in columns}
+        for r in db.query(models.BusinessData).order_by(models.BusinessData.id).all()
+    ]
+
+def legacy_sync(db):
+    # The per-company sync_all_business_data used before the chunked version
+    for company in db.query(models.Company).all():
+        ind = db.query(models.QCCIndustry).filter_by(company_name=company.company_name).first()
+        if ind:
+            company.enterprise_size = ind.enterprise_scale
+            company.enterprise_institution_type = ind.enterprise_type
+            company.national_standard_industry_category_main = ind.national_standard_industry_category_main
+            company.national_standard_industry_category_major = ind.national_standard_industry_category_major
+            company.qichacha_industry_category_main = ind.qcc_industry_category_main
+            company.qichacha_industry_category_major = ind.qcc_industry_category_major
+        tech = db.query(models.QCCTech).filter_by(company_name=company.company_name).first()
+        if tech:
+            company.is_little_giant_enterprise = tech.is_little_giant_enterprise
+            company.is_srun_sme = tech.is_srun_sme
+            company.is_high_tech_enterprise = tech.is_high_tech_enterprise
+            company.is_innovative_sme = tech.is_innovative_sme
+            company.is_tech_based_sme = tech.is_tech_based_sme
+        qyjh_item = db.query(models.QYJHList).filter_by(company_name=company.company_name).first()
+        company.qyjh_category = qyjh_item.qyjh_category if qyjh_item else None
+        company.is_technology_enterprise = any([
+            company.is_little_giant_enterprise, company.is_srun_sme,
+            company.is_high_tech_enterprise, company.is_innovative_sme,
+            company.is_tech_based_sme, pd.notna(company.qyjh_category)
+        ])
+    db.commit()
+
+def test_sync_writes_only_changed_companies(monkeypatch):
+    monkeypatch.setattr(services, 'SYNC_CHUNK_SIZE', 2)
+    synced = []
+    for sync in (services.sync_all_business_data, legacy_sync):
+        db = make_session()
+        db.add_all([
+            models.Company(company_name='甲公司', enterprise_size='小型'),
+            # Already matches its master data
+            models.Company(company_name='乙公司', enterprise_size='中型', is_high_tech_enterprise=True,
+                           is_technology_enterprise=True),
+            models.Company(company_name='丙公司', qyjh_category='第一批', is_technology_enterprise=True),
+            models.Company(company_name='丁公司', is_technology_enterprise=False),
+            models.Company(company_name='戊公司', is_srun_sme=True, is_technology_enterprise=True),
+        ])
+        db.commit()
+        crud.bulk_create_qcc_industry(db, [
+            {'company_name': '甲公司', 'enterprise_scale': '中型', 'enterprise_type': '民企'},
+            {'company_name': '乙公司', 'enterprise_scale': '中型'},
+        ])
+        crud.bulk_create_qcc_tech(db, [
+            {'company_name': '乙公司', 'is_high_tech_enterprise': True},
+            {'company_name': '戊公司', 'is_srun_sme': False},
+        ])
+        crud.bulk_create_qyjh_list(db, [{'company_name': '丁公司', 'qyjh_category': '第二批'}])
+        if sync is legacy_sync:
+            sync(db)
+        else:
+            # 甲 (industry), 丙 (left the qyjh list), 丁 (joined it) and 戊 (tech flags) change
+            assert sync(db) == 4
+            assert sync(db) == 0
+        synced.append(stored_companies(db))
+
+    assert synced[0] == synced[1]
+
+def test_columnar_insert_matches_row_wise_conversion():
+    frame = sample_frame()
+    name_to_id = {'甲公司': 1, '乙公司': 2, '丙公司': 3}
+
+    db = make_session()
+    services.insert_business_rows(db, services.build_business_rows(frame, name_to_id, 2025, 6), batch_size=3)
+    db.commit()
+    columnar = stored_rows(db)
+
+    db = make_session()
+    db.bulk_insert_mappings(models.BusinessData, [
+        legacy_record(row, name_to_id[row['企业名称']], 2025, 6) for _, row in frame.iterrows()
+    ])
+    db.commit()
+    row_wise = stored_rows(db)
+
+    assert columnar == row_wise
+    assert [r['business_year'] for r in columnar] == [2024, 2025, 2023, 2025]
+    assert columnar[1]['loan_start_date'] is None
+    assert columnar[0]['loan_due_date'] == datetime.date(2025, 3, 1)
+
+def legacy_merge_qcc_data(df, db):
+    # The row-by-row merge_qcc_data used before the columnar join
+    companies = df['企业名称'].unique().tolist()
+    industries = {i.company_name: i for i in db.query(models.QCCIndustry).filter(models.QCCIndustry.company_name.in_(companies)).all()}
+    techs = {t.company_name: t for t in db.query(models.QCCTech).filter(models.QCCTech.company_name.in_(companies)).all()}
+    qyjh = {e.company_name: e for e in db.query(models.QYJHList).filter(models.QYJHList.company_name.in_(companies)).all()}
+
+    def apply_qcc(row):
+        name = row['企业名称']
+        ind = industries.get(name)
+        tech = techs.get(name)
+        qyjh_item = qyjh.get(name)
+        if ind:
+            row['企业规模'] = ind.enterprise_scale
+            row['企业（机构）类型'] = ind.enterprise_type
+            row['国标行业门类'] = ind.national_standard_industry_category_main
+            row['国标行业大类'] = ind.national_standard_industry_category_major
+            row['企查查行业门类'] = ind.qcc_industry_category_main
+            row['企查查行业大类'] = ind.qcc_industry_category_major
+        if tech:
+            row['专精特新“小巨人”企业'] = '是' if tech.is_little_giant_enterprise else '否'
+            row['专精特新中小企业'] = '是' if tech.is_srun_sme else '否'
+            row['高新技术企业'] = '是' if tech.is_high_tech_enterprise else '否'
+            row['创新型中小企业'] = '是' if tech.is_innovative_sme else '否'
+            row['科技型中小企业'] = '是' if tech.is_tech_based_sme else '否'
+        row['千亿计划'] = qyjh_item.qyjh_category if qyjh_item else None
+        is_tech = any(row.get(c) == '是' for c in ['专精特新“小巨人”企业', '专精特新中小企业', '高新技术企业', '创新型中小企业', '科技型中小企业']) or pd.notna(row['千亿计划'])
+        row['科技企业'] = '是' if is_tech else '否'
+        return row
+
+    return df.apply(apply_qcc, axis=1)
+
+def test_merge_qcc_data_matches_row_by_row_merge():
+    db = make_session()
+    # The master data lists 甲公司 twice; the last entry is kept. 丁公司 has
+    # no master data at all, and missing values are NULL.
+    crud.bulk_create_qcc_industry(db, [
+        {'company_name': '甲公司', 'enterprise_scale': '大型', 'enterprise_type': '国企'},
+        {'company_name': '乙公司', 'enterprise_scale': None, 'qcc_industry_category_main': '制造业'},
+        {'company_name': '甲公司', 'enterprise_scale': '中型', 'enterprise_type': None},
+    ])
+    crud.bulk_create_qcc_tech(db, [
+        {'company_name': '甲公司', 'is_high_tech_enterprise': True, 'is_srun_sme': None},
+        {'company_name': '丙公司', 'is_tech_based_sme': False},
+    ])
+    crud.bulk_create_qyjh_list(db, [
+        {'company_name': '乙公司', 'qyjh_category': '第一批'},
+        {'company_name': '丙公司', 'qyjh_category': None},
+    ])
+    frame = pd.DataFrame({
+        '企业名称': ['甲公司', '乙公司', '丙公司', '丁公司', '甲公司'],
+        '企业规模': ['小型', None, '微型', float('nan'), '小型'],
+        '高新技术企业': [None, '是', None, '否', None],
+        '借款金额（万元）': [1.0, 2.0, float('nan'), 4.0, 5.0],
+    })
+
+    def normalized(df):
+        df = df[sorted(df.columns)].astype(object)
+        return df.where(df.notna(), None)
+
+    merged = services.merge_qcc_data(frame, db)
+    pd.testing.assert_frame_equal(normalized(merged), normalized(legacy_merge_qcc_data(frame, db)))
+    assert merged.loc[0, '企业规模'] == '中型' and pd.isna(merged.loc[1, '企业规模'])
+    assert pd.isna(merged.loc[3, '企业规模']) and merged.loc[3, '高新技术企业'] == '否'
+    assert merged['科技企业'].tolist() == ['是', '是', '否', '否', '是']
+
+def legacy_resolve_company(db, row):
+    # The per-row company lookup and update process_excel_import used before resolve_companies
+    company = services.get_or_create_company(db, row['企业名称'])
+    company.enterprise_size = row.get('企业规模')
+    company.enterprise_institution_type = row.get('企业（机构）类型')
+    company.national_standard_industry_category_main = row.get('国标行业门类')
+    company.national_standard_industry_category_major = row.get('国标行业大类')
+    company.qichacha_industry_category_main = row.get('企查查行业门类')
+    company.qichacha_industry_category_major = row.get('企查查行业大类')
+    company.is_little_giant_enterprise = row.get('专精特新“小巨人”企业') == '是'
+    company.is_srun_sme = row.get('专精特新中小企业') == '是'
+    company.is_high_tech_enterprise = row.get('高新技术企业') == '是'
+    company.is_innovative_sme = row.get('创新型中小企业') == '是'
+    company.is_tech_based_sme = row.get('科技型中小企业') == '是'
+    company.is_technology_enterprise = row.get('科技企业') == '是'
+    company.qyjh_category = row.get('千亿计划') if pd.notna(row.get('千亿计划')) and row.get('千亿计划') != '否' else None
+    return company.id
+
+def stored_companies(db):
+    columns = [c for c in models.Company.__table__.columns.keys() if c != 'created_at']
+    return [
+        {c: getattr(r, c) for c in columns}
+        for r in db.query(models.Company).order_by(models.Company.id).all()
+    ]
+
+def test_resolve_companies_matches_per_row_lookup():
+    frame = pd.DataFrame({
+        '企业名称': ['甲公司', '乙公司', '甲公司', '丙公司', '乙公司'],
+        '企业规模': ['小型', None, '中型', '微型', '大型'],
+        '高新技术企业': ['是', '否', '否', None, '是'],
+        '千亿计划': [None, '否', '第一批', None, None],
+        '科技企业': ['是', '否', '是', '否', '是'],
+    })
+    results = []
+    for resolve in (
+        lambda db: services.resolve_companies(db, frame),
+        lambda db: {row['企业名称']: legacy_resolve_company(db, row) for _, row in frame.iterrows()},
+    ):
+        db = make_session()
+        # 乙公司 already exists with stale attributes; the others are created
+        db.add(models.Company(company_name='乙公司', enterprise_size='微型', is_srun_sme=True))
+        db.add(models.Company(company_name='丁公司'))
+        db.commit()
+        name_to_id = resolve(db)
+        db.commit()
+        results.append(({name: name_to_id[name] for name in frame['企业名称']}, stored_companies(db)))
+
+    assert results[0] == results[1]
+    name_to_id, companies = results[0]
+    assert name_to_id == {'乙公司': 1, '甲公司': 3, '丙公司': 4}
+    assert [c['company_name'] for c in companies] == ['乙公司', '丁公司', '甲公司', '丙公司']
+    # The last row of a repeated name wins
+    assert companies[0]['enterprise_size'] == '大型' and companies[2]['qyjh_category'] == '第一批'
+
+def test_incremental_import_applies_only_the_differences():
+    frame = sample_frame()
+    name_to_id = {'甲公司': 1, '乙公司': 2, '丙公司': 3}
+    db = make_session()
+
+    rows = services.build_business_rows(frame, name_to_id, 2025, 6)
+    assert services.apply_snapshot_diff(db, rows, 2025, 6) == {'inserted': 4, 'updated': 0, 'deleted': 0, 'unchanged': 0}
+    db.commit()
+    updated_id = db.query(models.BusinessData.id).filter(models.BusinessData.loan_amount == Decimal('100.5')).scalar()
+    assert services.apply_snapshot_diff(db, rows, 2025, 6) == {'inserted': 0, 'updated': 0, 'deleted': 0, 'unchanged': 4}
+
+    frame.loc[0, '借款余额（万元）'] = 10.0
+    frame.loc[3, '借款金额（万元）'] = 25.0
+    frame = frame.drop(index=1)
+    rows = services.build_business_rows(frame, name_to_id, 2025, 6)
+    assert services.apply_snapshot_diff(db, rows, 2025, 6) == {'inserted': 1, 'updated': 1, 'deleted': 2, 'unchanged': 1}
+    db.commit()
+
+    stored = stored_rows(db)
+    assert sorted(r['loan_amount'] for r in stored) == [Decimal('25.00'), Decimal('100.5'), Decimal('1234.567891')]
+    assert db.get(models.BusinessData, updated_id).outstanding_loan_balance == Decimal('10.00')
+
+def test_aggregate_statistics_match_dataframe_implementation():
+    db = make_session()
+    names = ['甲公司', '乙公司', '丙公司', '丁公司']
+    db.add_all([models.Company(id=i + 1, company_name=name) for i, name in enumerate(names)])
+    for year, month, shift in [(2022, 12, 0), (2023, 12, 1), (2024, 6, 2), (2024, 12, 3), (2025, 3, 1), (2025, 6, 2)]:
+        frame = sample_frame()
+        frame['企业名称'] = [names[(i + shift) % len(names)] for i in range(len(frame))]
+        frame['借款金额（万元）'] *= 1 + shift / 7
+        frame['担保余额（万元）'] *= 1 + shift / 3
+        frame.loc[shift, '借据状态'] = '未放款'
+        frame.loc[(shift + 1) % len(frame), '业务年度'] = year
+        frame.loc[(shift + 2) % len(frame), '业务类型'] = None if shift % 2 else '工行批量业务'
+        rows = services.build_business_rows(frame, {name: i + 1 for i, name in enumerate(names)}, year, month)
+        services.insert_business_rows(db, rows)
+    db.commit()
+    assert services.rebuild_snapshot_aggregates(db) == 6
+
+    for year, month in [(2025, 6), (2025, 3), (2024, 12), (2024, 6), (2023, 12), (2025, 1), (2020, 12)]:
+        assert services.get_statistics(db, year, month) == legacy_statistics(db, year, month)
+    assert services.get_statistics(db, 2020, 12) == {}
+    assert set(services.get_statistics(db, 2025, 1)['yearly_summaries']) == {'2022', '2023', '2024'}
+
+    # Without a December snapshot a year falls back to its latest month
+    services.delete_data(db, 2024, 12)
+    yearly = services.get_statistics(db, 2025, 6)['yearly_summaries']
+    assert yearly['2024'] == legacy_statistics(db, 2024, 6)['yearly_summaries']['2024']
+    assert yearly['2023'] == legacy_statistics(db, 2025, 6)['yearly_summaries']['2023']
+
+def test_statistics_cache_is_invalidated_by_writes():
+    db = make_session()
+    frame = sample_frame()
+    frame['企业名称'] = '甲公司'
+    services.write_business_data(db, frame, 2025, 6)
+    result_cache.clear()
+
+    first = services.cached_statistics(db, 2025, 6)
+    before = result_cache.stats()
+    assert services.cached_statistics(db, 2025, 6) is first
+    assert result_cache.stats()['hits'] == before['hits'] + 1
+
+    # A write from another process only changes the database, including the
+    # persisted dataset version
+    for table in (models.BusinessData.__table__, models.SnapshotAggregate.__table__):
+        db.execute(table.delete())
+    crud.bump_dataset_version(db)
+    db.commit()
+    assert services.cached_statistics(db, 2025, 6) == {}
+
+def test_company_bitsets():
+    bits = services.company_bitset(services.company_bitmap([3, 0, 17, 3]))
+    assert services.bitset_ids(bits) == [0, 3, 17]
+    assert services.bitset_count(bits | services.company_bitset(services.company_bitmap([17, 40]))) == 4
+    assert services.company_bitmap([]) == b'' and services.bitset_ids(0) == []
+
+    db = make_session()
+    frame = sample_frame()
+    services.write_business_data(db, frame, 2025, 5)
+    name_to_id = dict(db.query(models.Company.company_name, models.Company.id).all())
+    frame.loc[3, '担保余额（万元）'] = 0.0
+    frame.loc[1, '担保金额（万元）'] = 5.0
+    services.write_business_data(db, frame, 2025, 6)
+    assert services.company_changes(db, (2025, 5), (2025, 6)) == {
+        'new_companies': [name_to_id['乙公司']],
+        'churned_companies': [name_to_id['丙公司']],
+    }
+
+def test_statistics_batch_matches_single_periods():
+    db = make_session()
+    frame = sample_frame()
+    for year, month in [(2023, 12), (2024, 6), (2025, 1), (2025, 2), (2025, 3)]:
+        frame['借款金额（万元）'] += month
+        services.write_business_data(db, frame, year, month)
+
+    periods = services.period_range((2024, 11), (2025, 3))
+    assert periods[:3] == [(2024, 11), (2024, 12), (2025, 1)] and len(periods) == 5
+    batch = services.get_statistics_batch(db, periods + [(2020, 1)])
+    assert list(batch) == periods + [(2020, 1)]
+    for period in periods:
+        assert batch[period] == services.get_statistics(db, *period)
+    assert list(batch[(2025, 3)]['yearly_summaries']) == ['2023', '2024', '2025']
+    assert batch[(2020, 1)] == {}
+
+def test_compare_snapshots():
+    db = make_session()
+    frame = sample_frame()
+    services.write_business_data(db, frame, 2025, 5)
+    frame.loc[0, '借款余额（万元）'] = 40.25
+    frame.loc[1, '企业名称'] = '丁公司'
+    services.write_business_data(db, frame.drop(index=3), 2025, 6)
+
+    assert services.get_available_dates(db) == [{'year': 2025, 'month': 5}, {'year': 2025, 'month': 6}]
+    result = services.compare_snapshots(db, (2025, 5), (2025, 6))
+    assert result['summary1']['company_count'] == 3 and result['summary2']['company_count'] == 2
+    assert result['summary1']['business_count'] == 4 and result['summary2']['business_count'] == 3
+    assert result['changes']['total_loan_balance_change'] == -30.0
+    assert result['changes']['total_loan_amount_change'] == -20.0
+    assert result['percentage_changes']['company_count'] == pytest.approx(-100 / 3)
+    analysis = result['company_analysis']
+    assert [c['company_name'] for c in analysis['new_companies']] == ['丁公司']
+    assert [c['company_name'] for c in analysis['exited_companies']] == ['丙公司', '乙公司']
+    assert analysis['exited_companies_loan'] == 20.0
+    assert result['business_types']['建行批量业务']['changes']['business_count_change'] == -1
+
+def test_data_status_pages():
+    db = make_session()
+    services.write_business_data(db, sample_frame(), 2025, 5)
+    services.write_business_data(db, sample_frame(), 2025, 6)
+
+    full = services.get_data_status(db, 2025, 6)
+    assert len(full) == 4 and full[0]['company_company_name'] == '甲公司'
+    assert full[0]['loan_amount'] == 100.5 and full[0]['loan_start_date'] == '2024-03-01'
+
+    first = services.get_data_status(db, 2025, 6, limit=3)
+    rest = services.get_data_status(db, 2025, 6, limit=3, after_id=first[-1]['id'])
+    assert first + rest == full
+
+    filtered = services.get_data_status(db, 2025, 6, filters={'bank': '中国银行', 'company_name': '甲'}, columns=['loan_amount'])
+    assert filtered == [{'id': full[0]['id'], 'loan_amount': 100.5}, {'id': full[2]['id'], 'loan_amount': 1234.567891}]
+    assert services.get_data_status(db, 2025, 6, filters={'company_name': '%'}) == []
+    with pytest.raises(ValueError):
+        services.get_data_status(db, 2025, 6, columns=['password'])
+
+def test_data_status_export_formats(monkeypatch):
+    db = make_session()
+    services.write_business_data(db, sample_frame(), 2025, 6)
+    expected = services.get_data_status(db, 2025, 6)
+
+    csv_bytes = b''.join(services.export_data_status(db, 2025, 6, 'csv', chunk_size=3))
+    exported = pd.read_csv(io.BytesIO(csv_bytes), encoding='utf-8-sig', keep_default_na=False)
+    assert list(exported.columns) == list(expected[0])
+    assert exported['company_company_name'].tolist() == [row['company_company_name'] for row in expected]
+    assert exported['loan_start_date'].tolist() == [row['loan_start_date'] or '' for row in expected]
+
+    table = pq.read_table(io.BytesIO(b''.join(services.export_data_status(db, 2025, 6, 'parquet', chunk_size=3))))
+    assert table.num_rows == 4 and table.column_names == list(expected[0])
+    assert table.column('loan_amount').to_pylist() == [row['loan_amount'] for row in expected]
+    assert table.column('loan_start_date').to_pylist()[0] == datetime.date(2024, 3, 1)
+
+    monkeypatch.setattr(services, "EXPORT_READ_BYTES", 1024)
+    xlsx_chunks = list(services.export_data_status(db, 2025, 6, 'xlsx', chunk_size=3))
+    assert len(xlsx_chunks) > 1 and all(len(chunk) <= 1024 for chunk in xlsx_chunks)
+    workbook = load_workbook(io.BytesIO(b''.join(xlsx_chunks)), read_only=True)
+    rows = list(workbook['Data Status'].values)
+    assert list(rows[0]) == list(expected[0])
+    assert [list(row) for row in rows[1:]] == [list(row.values()) for row in expected]
+
+    with pytest.raises(ValueError):
+        services.export_data_status(db, 2025, 6, 'pdf')